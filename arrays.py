@@ -0,0 +1,195 @@
+"""Compact binary encoding of the integer array attributes of history.
+
+A packed array is a two byte header followed by the payload:
+
+- flags: bits 0-1 hold the codec (0 none, 1 zlib, 2 zstd), bit 2 is set
+  when the values are stored as differences to their predecessor
+- item size: 2, 4 or 8 bytes per value, little-endian signed integers
+
+Uncompressed arrays can be viewed without copying, compressed ones are
+delta encoded first since neighbouring FFT bins and counts are close.
+"""
+
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+from settings import ARRAY_CODEC
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, arrays decode to memoryviews without it
+    np = None
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, zlib is always available
+    zstandard = None
+
+CODECS = {"none": 0, "zlib": 1, "zstd": 2}
+CODEC_MASK = 0b011
+DELTA = 0b100
+
+# array typecodes and numpy dtypes by item size
+TYPECODES = {2: "h", 4: "i", 8: "q"}
+DTYPES = {2: "<i2", 4: "<i4", 8: "<i8"}
+LIMITS = {2: 1 << 15, 4: 1 << 31, 8: 1 << 63}
+
+LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def item_size(values):
+    """Return the smallest item size holding all values."""
+    low, high = min(values, default=0), max(values, default=0)
+    for size, limit in LIMITS.items():
+        if -limit <= low and high < limit:
+            return size
+    raise OverflowError(f"array value out of range: {low}..{high}")
+
+
+def compress(codec, data):
+    """Compress a payload with the codec numbered ``codec``."""
+    if codec == CODECS["zlib"]:
+        return zlib.compress(data)
+    if codec == CODECS["zstd"]:
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def decompress(codec, data):
+    """Reverse compress()."""
+    if codec == CODECS["zlib"]:
+        return zlib.decompress(data)
+    if codec == CODECS["zstd"]:
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to decode zstd arrays")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def pack_int_array(values, codec=ARRAY_CODEC):
+    """Encode a sequence of integers.
+
+    Args:
+        values: list of ints or a numpy integer array
+        codec: "none", "zlib" or "zstd"
+
+    Returns:
+        bytes holding header and payload
+    """
+    if codec == "zstd" and zstandard is None:
+        codec = "zlib"
+    codec = CODECS[codec]
+    values = [int(value) for value in values]
+    flags = codec
+    size = item_size(values)
+    if codec:
+        deltas = [b - a for a, b in zip([0] + values, values)]
+        try:
+            size = item_size(deltas)
+        except OverflowError:
+            # Differences of values far apart can exceed 8 bytes; store
+            # those arrays without delta encoding
+            pass
+        else:
+            flags |= DELTA
+            values = deltas
+    packed = array(TYPECODES[size], values)
+    if not LITTLE_ENDIAN:
+        packed.byteswap()
+    return bytes((flags, size)) + compress(codec, packed.tobytes())
+
+
+def unpack_int_array(data):
+    """Decode a packed array.
+
+    Returns:
+        numpy array when numpy is installed, otherwise a memoryview of ints.
+        Uncompressed arrays are views on ``data`` and are not copied.
+    """
+    data = memoryview(data)
+    flags, size = data[0], data[1]
+    payload = decompress(flags & CODEC_MASK, data[2:])
+    if np is not None:
+        values = np.frombuffer(payload, dtype=DTYPES[size])
+        if flags & DELTA:
+            values = np.cumsum(values, dtype="<i8")
+        return values
+    if flags & DELTA or not LITTLE_ENDIAN:
+        values = array(TYPECODES[size])
+        values.frombytes(payload)
+        if not LITTLE_ENDIAN:
+            values.byteswap()
+        if flags & DELTA:
+            values = array("q", accumulate(values))
+        return memoryview(values)
+    return memoryview(payload).cast(TYPECODES[size])
+
+
+class PackedInts:
+    """Integer array as loaded from the database, decoded on first access.
+
+    Attributes:
+        data: encoded bytes or buffer as returned by the driver, see
+            pack_int_array
+    """
+
+    __slots__ = ("data", "_values")
+
+    def __init__(self, data):
+        self.data = data
+        self._values = None
+
+    @property
+    def values(self):
+        """Decoded values, numpy array or memoryview."""
+        if self._values is None:
+            self._values = unpack_int_array(self.data)
+        return self._values
+
+    def tolist(self):
+        return self.values.tolist()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __eq__(self, other):
+        if isinstance(other, PackedInts):
+            return self.tolist() == other.tolist()
+        if isinstance(other, (list, tuple)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"PackedInts({self.tolist()!r})"
+
+
+class PackedIntArray(TypeDecorator):
+    """bytea column holding a packed integer array.
+
+    Accepts lists, numpy arrays and PackedInts, and loads PackedInts.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, PackedInts):
+            return value.data
+        return pack_int_array(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return PackedInts(value)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Which hive a sensor was on at a given time.
+
+``sensor_assignment`` holds the intervals a sensor spent on a hive. The
+AssignmentIndex keeps them sorted per sensor and resolves a (sensor, time)
+pair with a binary search. Ingest stamps the resolved ``hive_id`` on every
+reading it stores, so per-hive queries filter on ``history.hive_id``
+instead of joining history against the assignment intervals.
+
+The index is loaded once per process and reloaded by refresh_assignments()
+when the assignments in the database changed. Readings stored before an
+assignment was added or changed keep their old hive until they are
+stamped again.
+
+Usage:
+    python assignments.py list [--sensor ID ...]     # Show resolved intervals
+    python assignments.py stamp [--sensor ID ...]    # Stamp hive_id on history
+"""
+
+import sys
+import argparse
+import logging
+from bisect import bisect_right
+from datetime import timedelta
+from sqlalchemy import text
+from models import History, Sensor, SensorAssignment, SPLIT_MODELS
+from database import get_session, close_session
+from layout import history_layout
+
+# Changes whenever an assignment is added, changed or removed
+SIGNATURE_SQL = """
+    SELECT count(*), md5(string_agg(
+        concat_ws(',', id, sensor_id, hive_id, start_time, end_time), ';'
+        ORDER BY id
+    ))
+    FROM sensor_assignment
+"""
+
+STAMP_SQL = """
+    UPDATE {table} SET hive_id = CAST(:hive_id AS integer)
+    WHERE sensor_id = :sensor_id AND time >= :start AND time < :end
+        AND hive_id IS DISTINCT FROM CAST(:hive_id AS integer)
+"""
+
+# Time range of history stamped per transaction
+STAMP_CHUNK = timedelta(days=31)
+
+
+class AssignmentIndex:
+    """Sorted assignment intervals per sensor.
+
+    When the intervals of a sensor overlap, the assignment that started
+    later wins from its start on, like moving a sensor to another hive
+    without closing the old assignment.
+
+    Args:
+        assignments: iterable of (sensor_id, hive_id, start_time, end_time)
+            tuples in the order they were created; end_time may be None
+    """
+
+    def __init__(self, assignments):
+        by_sensor = {}
+        for sensor_id, hive_id, start, end in assignments:
+            # An empty assignment does not end the one before it
+            if end is None or start < end:
+                by_sensor.setdefault(sensor_id, []).append((start, end, hive_id))
+
+        # sensor_id -> [(start, end or None, hive_id)], sorted, not overlapping
+        self.intervals = {}
+        self.starts = {}
+        for sensor_id, items in by_sensor.items():
+            # Stable sort, the newer of two assignments with the same start wins
+            items.sort(key=lambda item: item[0])
+            resolved = []
+            for i, (start, end, hive_id) in enumerate(items):
+                if i + 1 < len(items):
+                    following = items[i + 1][0]
+                    end = following if end is None else min(end, following)
+                if end is None or start < end:
+                    resolved.append((start, end, hive_id))
+            self.intervals[sensor_id] = resolved
+            self.starts[sensor_id] = [start for start, _, _ in resolved]
+
+    def __len__(self):
+        return sum(len(intervals) for intervals in self.intervals.values())
+
+    def hive_at(self, sensor_id, time):
+        """Return the ID of the hive the sensor was on at ``time``, or None."""
+        starts = self.starts.get(sensor_id)
+        if not starts:
+            return None
+        i = bisect_right(starts, time) - 1
+        if i < 0:
+            return None
+        _, end, hive_id = self.intervals[sensor_id][i]
+        return hive_id if end is None or time < end else None
+
+    def segments(self, sensor_id, start, end):
+        """Split start to end into (start, end, hive_id) pieces of one hive.
+
+        Pieces without an assignment have a hive_id of None.
+        """
+        pieces = []
+        at = start
+        for begin, stop, hive_id in self.intervals.get(sensor_id, ()):
+            if stop is not None and stop <= at:
+                continue
+            if begin >= end:
+                break
+            if begin > at:
+                pieces.append((at, begin, None))
+                at = begin
+            stop = end if stop is None else min(stop, end)
+            pieces.append((at, stop, hive_id))
+            at = stop
+            if at >= end:
+                break
+        if at < end:
+            pieces.append((at, end, None))
+        return pieces
+
+
+# Index of the process and the signature of the assignments it was built from
+_index = None
+_signature = None
+
+
+def load_assignments(session):
+    """Build an AssignmentIndex from the database."""
+    return AssignmentIndex(
+        session.query(
+            SensorAssignment.sensor_id,
+            SensorAssignment.hive_id,
+            SensorAssignment.start_time,
+            SensorAssignment.end_time,
+        ).order_by(SensorAssignment.id)
+    )
+
+
+def refresh_assignments(session):
+    """Reload the assignment index if the assignments changed; return it."""
+    global _index, _signature
+    signature = tuple(session.execute(text(SIGNATURE_SQL)).one())
+    if _index is None or signature != _signature:
+        _index = load_assignments(session)
+        _signature = signature
+        logging.info(f"Loaded {len(_index)} sensor assignment intervals")
+    return _index
+
+
+def get_assignment_index(session):
+    """Return the assignment index, loading it on first use."""
+    if _index is None:
+        refresh_assignments(session)
+    return _index
+
+
+def stamp_history(session, sensor_ids=None, chunk=STAMP_CHUNK):
+    """Stamp the current assignments on stored history.
+
+    Only rows whose hive changed are written, one transaction per chunk of
+    time, so the command can be interrupted and run again.
+
+    Returns:
+        Number of rows updated
+    """
+    index = refresh_assignments(session)
+    if history_layout(session) == "split":
+        # The view is not updatable, stamp the narrow tables
+        tables = [model.__tablename__ for model in SPLIT_MODELS.values()]
+    else:
+        tables = [History.__tablename__]
+    if sensor_ids is None:
+        sensor_ids = [sensor_id for (sensor_id,) in session.query(Sensor.id)]
+
+    updated = 0
+    for sensor_id in sensor_ids:
+        first, last = session.execute(
+            text("SELECT min(time), max(time) FROM history WHERE sensor_id = :id"),
+            {"id": sensor_id},
+        ).one()
+        if first is None:
+            continue
+        stamped = 0
+        end = last + timedelta(microseconds=1)
+        for start, stop, hive_id in index.segments(sensor_id, first, end):
+            while start < stop:
+                until = min(start + chunk, stop)
+                for table in tables:
+                    stamped += session.execute(
+                        text(STAMP_SQL.format(table=table)),
+                        {
+                            "sensor_id": sensor_id,
+                            "hive_id": hive_id,
+                            "start": start,
+                            "end": until,
+                        },
+                    ).rowcount
+                session.commit()
+                start = until
+        logging.info(f"Sensor {sensor_id}: stamped {stamped} readings")
+        updated += stamped
+    return updated
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Resolve sensor assignments")
+    parser.add_argument("action", choices=["list", "stamp"])
+    parser.add_argument(
+        "--sensor",
+        type=int,
+        action="append",
+        dest="sensor_ids",
+        help="Sensor to show or stamp, may be repeated (default: all sensors)",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    session = get_session()
+    try:
+        if args.action == "stamp":
+            print(f"{stamp_history(session, args.sensor_ids)} readings stamped")
+            return
+        index = refresh_assignments(session)
+        for sensor_id in sorted(args.sensor_ids or index.intervals):
+            for start, end, hive_id in index.intervals.get(sensor_id, ()):
+                print(
+                    f"sensor {sensor_id:<8} hive {hive_id:<8} "
+                    f"{start.isoformat()} - {end.isoformat() if end else 'now'}"
+                )
+    finally:
+        close_session()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Resumable backfill of sensor history.
+
+The range to backfill is split into fixed, UTC-aligned windows per sensor.
+Windows are fetched in parallel and stored by a single writer; every
+completed window is checkpointed in ``backfill_window``, so running the
+same command again after an interruption only fetches what is missing.
+
+Usage:
+    python backfill.py SINCE [--until TIME] [--sensor ID ...] [--window HOURS]
+
+SINCE and --until are dates (YYYY-MM-DD) or ISO timestamps. --until
+defaults to each sensor's ingest watermark, or now.
+
+The history endpoint is asked for ``from``/``to`` (milliseconds) and the
+response is also filtered here, so readings outside a window are never
+stored under its checkpoint.
+"""
+
+import sys
+import math
+import queue
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from settings import (
+    BACKFILL_WINDOW_HOURS,
+    HISTORY_BATCH_SIZE,
+    FETCH_WORKERS,
+    NORMALIZE_WORKERS,
+    NORMALIZE_MIN_READINGS,
+)
+from models import BackfillWindow, Sensor
+from database import init_db, get_session, close_session
+from beehivemonitoring import (
+    DEFAULT_SAMPLE_INTERVAL,
+    NORMALIZER,
+    count_parsed,
+    fetch_sensor_history_text,
+    load_ingest_state,
+    refresh_sensors,
+    stream_sensor_history,
+    upsert_history_readings,
+)
+from normalizer import time_within
+from rollups import bucket_floor, parse_time
+from metrics import metrics, end_run
+
+# Windows request this many times the readings expected from the sample
+# interval; a window that fills its limit may be truncated
+WINDOW_LIMIT_FACTOR = 2
+MIN_WINDOW_LIMIT = 100
+
+
+def plan_windows(since, until, width, completed=()):
+    """Return the windows of ``width`` covering since to until, newest first.
+
+    Windows are aligned to the epoch, so they line up across runs, and
+    windows inside a completed ``(start, end)`` range are left out.
+    """
+    windows = []
+    start = bucket_floor(since, width)
+    while start < until:
+        end = start + width
+        if not any(
+            done_start <= start and end <= done_end
+            for done_start, done_end in completed
+        ):
+            windows.append((start, end))
+        start = end
+    return windows[::-1]
+
+
+def window_limit(width, sample_interval):
+    """Return the record limit requested for one window."""
+    expected = width.total_seconds() / (sample_interval or DEFAULT_SAMPLE_INTERVAL)
+    return max(math.ceil(expected * WINDOW_LIMIT_FACTOR), MIN_WINDOW_LIMIT)
+
+
+def fetch_window_batches(window, limit, batches):
+    """Fetch one window and put its batches on the ``batches`` queue.
+
+    Puts ``(window, HistoryBatch, None)`` per chunk, then ``(window, None,
+    None)`` when done or ``(window, None, error)`` if the fetch failed or
+    the window hit its limit.
+    """
+    sensor_id, start, end = window
+    start_ms, end_ms = start.timestamp() * 1000, end.timestamp() * 1000
+    received = 0
+    try:
+        if NORMALIZER.running:
+            # Windows are bounded by their limit, decode them in the pool
+            text = fetch_sensor_history_text(sensor_id, limit, since=start, until=end)
+            with metrics.timer("normalize_seconds", sensor=sensor_id):
+                received, chunks = NORMALIZER.parse(
+                    sensor_id, text, HISTORY_BATCH_SIZE, start_ms, end_ms
+                )
+            for batch in chunks:
+                count_parsed(sensor_id, batch)
+                batches.put((window, batch, None))
+        else:
+            for chunk in stream_sensor_history(
+                sensor_id, limit, since=start, until=end
+            ):
+                received += len(chunk)
+                chunk = [m for m in chunk if time_within(m, start_ms, end_ms)]
+                if chunk:
+                    with metrics.timer("normalize_seconds", sensor=sensor_id):
+                        batch = NORMALIZER.normalize(sensor_id, chunk)
+                    count_parsed(sensor_id, batch)
+                    batches.put((window, batch, None))
+        if received >= limit:
+            raise RuntimeError(
+                f"received {received} readings, the limit; use a smaller --window"
+            )
+    except Exception as e:
+        batches.put((window, None, e))
+    else:
+        batches.put((window, None, None))
+
+
+def write_windows(session, batches, count):
+    """Store fetched windows and checkpoint each one once it is complete.
+
+    Returns:
+        Tuple of (completed, failed) window counts
+    """
+    rows = {}
+    broken = set()
+    completed = failed = 0
+    while count:
+        window, batch, error = batches.get()
+        sensor_id, start, end = window
+        if batch is not None:
+            if batch.rejected:
+                logging.warning(
+                    f"Sensor {sensor_id}: rejected values {dict(batch.rejected)}"
+                )
+            try:
+                inserted, updated = upsert_history_readings(session, batch)
+            except Exception as e:
+                logging.error(f"Sensor {sensor_id}: storing readings failed: {e}")
+                broken.add(window)
+                continue
+            rows[window] = rows.get(window, 0) + inserted + updated
+            continue
+
+        count -= 1
+        if error is not None or window in broken:
+            failed += 1
+            logging.error(
+                f"Sensor {sensor_id}: window {start:%Y-%m-%d %H:%M} failed: "
+                f"{error or 'could not store readings'}"
+            )
+            continue
+        if end > datetime.now(timezone.utc):
+            # Readings may still arrive, leave the window to be fetched again
+            continue
+        session.merge(
+            BackfillWindow(
+                sensor_id=sensor_id,
+                start_time=start,
+                end_time=end,
+                rows=rows.get(window, 0),
+                completed_at=datetime.now(timezone.utc),
+            )
+        )
+        session.commit()
+        completed += 1
+        logging.info(
+            f"Sensor {sensor_id}: window {start:%Y-%m-%d %H:%M} stored "
+            f"{rows.get(window, 0)} readings"
+        )
+    return completed, failed
+
+
+def check_sensors(session, sensor_ids):
+    """Make sure the sensors to backfill exist before anything is fetched.
+
+    Sensors missing from the ``sensor`` table are looked up in the API and
+    stored, as ingest does.
+
+    Raises:
+        ValueError: if the API does not know a sensor either
+    """
+    known = {
+        sensor_id
+        for (sensor_id,) in session.query(Sensor.id).filter(Sensor.id.in_(sensor_ids))
+    }
+    missing = set(sensor_ids) - known
+    if missing:
+        missing -= set(refresh_sensors(session))
+    if missing:
+        raise ValueError(f"Unknown sensors: {', '.join(map(str, sorted(missing)))}")
+
+
+def backfill(session, since, until=None, sensor_ids=None, width=None, workers=None):
+    """Backfill history of the given sensors, resuming earlier runs.
+
+    Args:
+        session: SQLAlchemy session
+        since: aware datetime to backfill from
+        until: aware datetime to backfill to, defaults to each sensor's
+            ingest watermark or now
+        sensor_ids: sensors to backfill, defaults to all sensors of the API
+        width: timedelta of one window
+        workers: number of windows fetched concurrently
+
+    Returns:
+        Tuple of (completed, failed) window counts
+
+    Raises:
+        ValueError: if a sensor is unknown, see check_sensors()
+    """
+    width = width or timedelta(hours=BACKFILL_WINDOW_HOURS)
+    workers = max(workers or FETCH_WORKERS, 1)
+    if sensor_ids is None:
+        sensor_ids = refresh_sensors(session)
+    else:
+        check_sensors(session, sensor_ids)
+
+    states = load_ingest_state(session)
+    completed = {}
+    for done in session.query(BackfillWindow).filter(
+        BackfillWindow.sensor_id.in_(sensor_ids)
+    ):
+        completed.setdefault(done.sensor_id, []).append(
+            (done.start_time, done.end_time)
+        )
+
+    now = datetime.now(timezone.utc)
+    windows = []
+    limits = {}
+    for sensor_id in sensor_ids:
+        state = states.get(sensor_id)
+        end = until or (state.last_time if state else now)
+        limits[sensor_id] = window_limit(width, state and state.sample_interval)
+        windows += [
+            (sensor_id, start, stop)
+            for start, stop in plan_windows(
+                since, end, width, completed.get(sensor_id, ())
+            )
+        ]
+    # Newest windows of all sensors first
+    windows.sort(key=lambda window: window[1], reverse=True)
+    if sum(limits[window[0]] for window in windows) >= NORMALIZE_MIN_READINGS:
+        NORMALIZER.start()
+    logging.info(f"Backfilling {len(windows)} windows of {len(sensor_ids)} sensors")
+
+    batches = queue.Queue(maxsize=2 * workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for window in windows:
+            executor.submit(fetch_window_batches, window, limits[window[0]], batches)
+        return write_windows(session, batches, len(windows))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Backfill sensor history")
+    parser.add_argument("since", type=parse_time, help="Backfill from this date")
+    parser.add_argument("--until", type=parse_time, help="Backfill up to this date")
+    parser.add_argument(
+        "--sensor",
+        type=int,
+        action="append",
+        dest="sensor_ids",
+        help="Sensor to backfill, may be repeated (default: all sensors)",
+    )
+    parser.add_argument(
+        "--window",
+        type=float,
+        default=BACKFILL_WINDOW_HOURS,
+        help="Hours fetched per request",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=FETCH_WORKERS,
+        help="Number of windows fetched concurrently",
+    )
+    parser.add_argument(
+        "--normalize-workers",
+        type=int,
+        default=NORMALIZE_WORKERS,
+        help="Processes normalizing large backfills, below 2 normalizes in-process",
+    )
+    args = parser.parse_args(argv)
+    NORMALIZER.workers = args.normalize_workers
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    metrics.job = "backfill"
+
+    init_db()
+    session = get_session()
+    try:
+        try:
+            completed, failed = backfill(
+                session,
+                args.since,
+                args.until,
+                args.sensor_ids,
+                timedelta(hours=args.window),
+                args.workers,
+            )
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        print(f"{completed} windows backfilled, {failed} failed")
+        print(end_run())
+        return 1 if failed else 0
+    finally:
+        NORMALIZER.shutdown()
+        close_session()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,32 +1,109 @@
 import sys
+import json
+import math
+import time
+import heapq
+import queue
+import signal
+import argparse
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from psycopg2.extras import execute_values
 from settings import (
     BASE_URL,
     HEADERS,
-    APIARIES,
-    HIVES,
-    SENSORS,
     ATTRIBUTES,
     ARRAY_ATTRIBUTES,
-    INTEGER_ATTRIBUTES,
-    ASSIGNMENTS,
+    HISTORY_BATCH_SIZE,
+    FETCH_WORKERS,
+    ROLLUPS_ENABLED,
+    DAEMON_MIN_INTERVAL,
+    DAEMON_MAX_INTERVAL,
+    DAEMON_POLL_DELAY,
+    SENSOR_REFRESH_INTERVAL,
+    METRICS_PORT,
+    NORMALIZE_WORKERS,
+    NORMALIZE_MIN_READINGS,
 )
-from models import Apiary, Hive, Sensor, History, SensorAssignment
+from models import Apiary, Hive, Sensor, History, SensorAssignment, IngestState
 from database import init_db, get_session, close_session
+from normalizer import HistoryBatch, NormalizerPool
+from partitions import ensure_history_partitions, ensure_upcoming_partitions
+from layout import history_layout, upsert_split_readings
+from assignments import get_assignment_index, refresh_assignments
+from topology import TopologyError, get_topology
+from rollups import refresh_rollups
+from metrics import metrics, end_run
 import logging
 
+HISTORY_COLUMNS = ATTRIBUTES.split(";")
+# Order of the values of a reading, as in normalizer.HistoryBatch
+HISTORY_NAMES = ["sensor_id", "time", *HISTORY_COLUMNS]
+# Order of the values of a history row bound by upsert_history_values()
+UPSERT_COLUMNS = [*HISTORY_NAMES, "hive_id"]
+NORMALIZER = NormalizerPool(NORMALIZE_WORKERS)
+
+# Assumed cadence for sensors without an observed one (1000 records per day)
+DEFAULT_SAMPLE_INTERVAL = 86.4
+
+# Largest response downloaded whole for the normalizer pool; larger ones are
+# streamed and normalized in-process to keep memory bounded
+POOL_RESPONSE_LIMIT = 10 * HISTORY_BATCH_SIZE
+# Weight of the newest observation in the sample interval estimate
+SAMPLE_INTERVAL_SMOOTHING = 0.3
+# Extra records requested on top of the expected count, as a fraction
+HISTORY_LIMIT_MARGIN = 0.1
+MIN_HISTORY_LIMIT = 100
+
+# Characters that may end an element of a JSON array, and that may
+# continue a number
+JSON_DELIMITERS = frozenset(",] \t\n\r")
+NUMBER_CHARS = "0123456789.eE+-"
+
+_http_session = None
+# Upsert SQL and bind processors, see history_upsert()
+_upsert = None
+
+
+def get_http_session():
+    """Return the shared keep-alive HTTP session for the API.
+
+    The connection pool is sized for ``FETCH_WORKERS`` so that concurrent
+    history fetches reuse connections instead of opening new ones.
+    """
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+        _http_session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(FETCH_WORKERS, 1))
+        _http_session.mount("https://", adapter)
+        _http_session.mount("http://", adapter)
+    return _http_session
+
 
 def upsert_defaults(session):
-    """Update or insert default data from configuration."""
+    """Update or insert default data from configuration.
+
+    Raises:
+        TopologyError: if the configuration is inconsistent
+    """
+    topology = get_topology(session)
     try:
-        for apiary in APIARIES:
+        for apiary in topology.apiaries.values():
             session.merge(Apiary(id=apiary["id"], name=apiary["name"]))
-        for hive in HIVES:
+        for hive in topology.hives.values():
             session.merge(
                 Hive(id=hive["id"], name=hive["name"], apiary_id=hive["apiary_id"])
             )
-        for sensor in SENSORS:
+        # Sensors with any assignment (past or present)
+        assigned = {
+            sensor_id
+            for (sensor_id,) in session.query(SensorAssignment.sensor_id).distinct()
+        }
+        for sensor in topology.sensors.values():
             # Create or update sensor
             session.merge(
                 Sensor(
@@ -36,19 +113,9 @@ def upsert_defaults(session):
                 )
             )
 
-            # Check if this sensor has any assignment (past or present)
-            has_assignment = (
-                session.query(SensorAssignment)
-                .filter(SensorAssignment.sensor_id == sensor["id"])
-                .first()
-            )
-
             # Only set a default assignment if the sensor has never been assigned
-            if not has_assignment:
-                # Find a matching default assignment if one exists
-                default_assignment = next(
-                    (a for a in ASSIGNMENTS if a["sensor_id"] == sensor["id"]), None
-                )
+            if sensor["id"] not in assigned:
+                default_assignment = topology.default_assignments.get(sensor["id"])
                 if default_assignment:
                     session.add(
                         SensorAssignment(
@@ -67,7 +134,9 @@ def upsert_defaults(session):
 def get_sensor_list():
     """Fetch list of sensors from the API."""
     try:
-        response = requests.get(f"{BASE_URL}/api/hives", headers=HEADERS)
+        with metrics.timer("http_request_seconds", stage="sensors"):
+            response = get_http_session().get(f"{BASE_URL}/api/hives")
+        metrics.inc("http_response_bytes_total", len(response.content), stage="sensors")
         response.raise_for_status()  # Raise an exception for bad status codes
 
         if not response.text.strip():
@@ -91,7 +160,7 @@ def get_sensor_list():
 
 def get_apiary_id_for_hive(hive_id):
     """Find the apiary ID for a given hive."""
-    return next(apiary["id"] for apiary in APIARIES if hive_id in apiary["hives"])
+    return get_topology().apiary_id_for_hive(hive_id)
 
 
 def upsert_sensor(session, sensor_id, sensor_data):
@@ -110,115 +179,715 @@ def upsert_sensor(session, sensor_id, sensor_data):
         session.rollback()
 
 
-def get_history_limit(session, sensor_id):
-    """Calculate how many history records to fetch."""
+def load_ingest_state(session):
+    """Return the ingest state of all sensors keyed by sensor ID."""
+    return {state.sensor_id: state for state in session.query(IngestState)}
+
+
+def get_watermark(session, sensor_id, state=None):
+    """Return the time of the newest stored reading of a sensor, or None.
+
+    Sensors without an ingest watermark fall back to probing the history
+    table once.
+    """
+    if state is not None:
+        return state.last_time
     latest = (
         session.query(History.time)
         .filter(History.sensor_id == sensor_id)
         .order_by(History.time.desc())
         .first()
     )
-    latest_ts = int(latest[0].timestamp()) if latest else 0
-    current_ts = int(datetime.now(timezone.utc).timestamp())
-    return max(int((current_ts - latest_ts) / 86.4), 100)  # 1000 records per day
-
+    return latest[0] if latest else None
+
+
+def get_history_limit(watermark, sample_interval=None):
+    """Calculate how many history records to fetch per request.
+
+    The expected number of new records is derived from the sensor's
+    watermark and observed sample interval. The limit only sizes the
+    requests: a response that fills it is followed by more requests, see
+    fetch_sensor_batches().
+    """
+    latest_ts = watermark.timestamp() if watermark is not None else 0
+    interval = sample_interval or DEFAULT_SAMPLE_INTERVAL
+    current_ts = datetime.now(timezone.utc).timestamp()
+    expected = max(current_ts - latest_ts, 0) / interval
+    return max(math.ceil(expected * (1 + HISTORY_LIMIT_MARGIN)), MIN_HISTORY_LIMIT)
+
+
+def median_interval(times):
+    """Return the median gap in seconds between reading times, or None."""
+    times = sorted(times)
+    gaps = sorted((b - a).total_seconds() for a, b in zip(times, times[1:]) if b > a)
+    return gaps[len(gaps) // 2] if gaps else None
+
+
+def update_ingest_state(session, sensor_id, last_time, observed=None):
+    """Advance a sensor's watermark and sample interval; the caller commits.
+
+    Args:
+        session: SQLAlchemy session
+        sensor_id: ID of the sensor
+        last_time: time of the newest reading stored for the sensor
+        observed: sample interval in seconds observed in this run, smoothed
+            with the previous estimate
+    """
+    state = session.get(IngestState, sensor_id)
+    if state is None:
+        state = IngestState(sensor_id=sensor_id, last_time=last_time)
+        session.add(state)
+    else:
+        state.last_time = max(state.last_time, last_time)
 
-def fetch_sensor_history(sensor_id, limit):
-    """Fetch history data for a sensor from the API."""
-    response = requests.get(
-        f"{BASE_URL}/api/hives/{sensor_id}/history?limit={limit}&reverse=true&attributes={ATTRIBUTES}",
-        headers=HEADERS,
+    if observed:
+        if state.sample_interval:
+            observed = (
+                SAMPLE_INTERVAL_SMOOTHING * observed
+                + (1 - SAMPLE_INTERVAL_SMOOTHING) * state.sample_interval
+            )
+        state.sample_interval = observed
+    state.updated_at = datetime.now(timezone.utc)
+
+
+def iter_json_array(chunks):
+    """Yield the elements of a JSON array received as a sequence of text chunks.
+
+    Only the element being decoded is buffered, so memory use does not grow
+    with the length of the array. A scalar is only yielded once the
+    delimiter after it arrived, since a chunk may end within a number,
+    like ``2500.`` followed by ``0``.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    started = False
+    expect_value = True
+
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos == len(buffer):
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError("Truncated JSON array")
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        char = buffer[pos]
+        if not started:
+            if char != "[":
+                raise ValueError(f"Expected a JSON array, got {buffer[pos:80]!r}")
+            started = True
+            pos += 1
+        elif char == "]":
+            return
+        elif char == "," and not expect_value:
+            expect_value = True
+            pos += 1
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                end = None
+            if end is not None and end < len(buffer):
+                if buffer[end] not in JSON_DELIMITERS:
+                    if buffer[end:].strip(NUMBER_CHARS):
+                        raise ValueError(
+                            f"Malformed JSON array element {buffer[pos:end + 20]!r}"
+                        )
+                    # The chunk ended within a number
+                    end = None
+            if end is None or end == len(buffer):
+                # Incomplete element, or a number that may continue
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+                if end is None:
+                    raise ValueError("Truncated JSON array")
+            yield value
+            pos = end
+            expect_value = False
+
+
+def history_url(sensor_id, limit, since=None, until=None):
+    """Return the history endpoint URL of a sensor, newest readings first.
+
+    Args:
+        since: optional aware datetime, only request readings from then on
+        until: optional aware datetime, only request readings before then
+    """
+    url = f"{BASE_URL}/api/hives/{sensor_id}/history?limit={limit}&reverse=true&attributes={ATTRIBUTES}"
+    if since is not None:
+        url += f"&from={int(since.timestamp() * 1000)}"
+    if until is not None:
+        url += f"&to={int(until.timestamp() * 1000)}"
+    return url
+
+
+def stream_sensor_history(
+    sensor_id, limit, chunk_size=HISTORY_BATCH_SIZE, since=None, until=None
+):
+    """Fetch history data for a sensor from the API in chunks.
+
+    The response is parsed while it downloads and yielded as lists of at
+    most ``chunk_size`` measurements, newest first. ``since`` and ``until``
+    are passed to history_url().
+    """
+    url = history_url(sensor_id, limit, since, until)
+    start = time.perf_counter()
+    with get_http_session().get(url, stream=True) as response:
+        metrics.observe(
+            "http_request_seconds",
+            time.perf_counter() - start,
+            stage="history",
+            sensor=sensor_id,
+        )
+        response.raise_for_status()
+        response.encoding = response.encoding or "utf-8"
+        chunk = []
+        for measurement in iter_json_array(
+            response.iter_content(chunk_size=64 * 1024, decode_unicode=True)
+        ):
+            chunk.append(measurement)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        # Bytes as transferred, before content decoding
+        metrics.inc(
+            "http_response_bytes_total",
+            response.raw.tell(),
+            stage="history",
+            sensor=sensor_id,
+        )
+
+
+def fetch_sensor_history_text(sensor_id, limit, since=None, until=None):
+    """Fetch the whole history response of a sensor as undecoded JSON text.
+
+    For the normalizer pool, whose workers decode the response themselves.
+    ``since`` and ``until`` are passed to history_url().
+    """
+    start = time.perf_counter()
+    response = get_http_session().get(history_url(sensor_id, limit, since, until))
+    metrics.observe(
+        "http_request_seconds",
+        time.perf_counter() - start,
+        stage="history",
+        sensor=sensor_id,
     )
-    return response.json()
-
-
-def upsert_history_readings(session, readings):
-    """Update or insert multiple history readings in a batch."""
+    response.raise_for_status()
+    metrics.inc(
+        "http_response_bytes_total",
+        len(response.content),
+        stage="history",
+        sensor=sensor_id,
+    )
+    response.encoding = response.encoding or "utf-8"
+    return response.text
+
+
+def history_upsert(dialect):
+    """Return the INSERT ... ON CONFLICT statement used for history rows.
+
+    The statement is SQL for psycopg2's ``execute_values``, which binds
+    every row as a tuple ordered like UPSERT_COLUMNS, without building a
+    dict per row. Existing values are only overwritten by non-NULL values,
+    matching the previous ``session.merge`` behaviour for attributes that
+    were skipped; ``hive_id`` is always replaced. The statement returns
+    ``xmax = 0`` per row, which is true for inserted rows and false for
+    updated ones.
+
+    Returns:
+        Tuple of (SQL, list of (position, bind processor) of the columns
+        that need one)
+    """
+    global _upsert
+    if _upsert is None:
+        columns = ", ".join(f'"{name}"' for name in UPSERT_COLUMNS)
+        updates = [
+            f'"{name}" = coalesce(EXCLUDED."{name}", history."{name}")'
+            for name in HISTORY_COLUMNS
+        ]
+        # The current assignments decide the hive
+        updates.append("hive_id = EXCLUDED.hive_id")
+        sql = (
+            f"INSERT INTO history ({columns}) VALUES %s "
+            f"ON CONFLICT (sensor_id, time) DO UPDATE SET {', '.join(updates)} "
+            "RETURNING xmax = 0"
+        )
+        # Scalars arrive converted from the normalizer, arrays still need
+        # to be packed, see arrays.py
+        processors = [
+            (position, History.__table__.c[name].type.bind_processor(dialect))
+            for position, name in enumerate(UPSERT_COLUMNS)
+            if name in ARRAY_ATTRIBUTES
+        ]
+        _upsert = (sql, processors)
+    return _upsert
+
+
+def history_values(readings):
+    """Return readings as tuples ordered like HISTORY_NAMES.
+
+    Only the last reading of every ``(sensor_id, time)`` is kept, since ON
+    CONFLICT cannot touch the same row twice within one statement.
+
+    Args:
+        readings: HistoryBatch, or list of dicts with ``sensor_id``,
+            ``time`` and attribute values
+    """
+    if isinstance(readings, HistoryBatch) and readings.names == HISTORY_NAMES:
+        values = readings.values
+    else:
+        if isinstance(readings, HistoryBatch):
+            readings = readings.rows()
+        values = [tuple(r.get(name) for name in HISTORY_NAMES) for r in readings]
+    return list({(row[0], row[1]): row for row in values}.values())
+
+
+def upsert_history_values(session, rows, batch_size=HISTORY_BATCH_SIZE):
+    """Update or insert history rows in the wide layout; the caller commits.
+
+    Args:
+        session: SQLAlchemy session
+        rows: tuples ordered like UPSERT_COLUMNS, unique per
+            ``(sensor_id, time)``
+        batch_size: number of rows sent per statement
+
+    Returns:
+        Tuple of (inserted, updated) row counts
+    """
+    if not rows:
+        return 0, 0
+    connection = session.connection()
+    sql, processors = history_upsert(connection.dialect)
+    if processors:
+        rows = [list(row) for row in rows]
+        for row in rows:
+            for position, process in processors:
+                row[position] = process(row[position])
+    with connection.connection.cursor() as cursor:
+        results = execute_values(cursor, sql, rows, page_size=batch_size, fetch=True)
+    inserted = sum(1 for (was_inserted,) in results if was_inserted)
+    return inserted, len(results) - inserted
+
+
+def upsert_history_readings(
+    session, readings, batch_size=HISTORY_BATCH_SIZE, watermarks=None
+):
+    """Update or insert history readings in bulk and commit them.
+
+    Every reading is stamped with the hive its sensor was on, see
+    assignments.py. Missing monthly partitions for the readings are created,
+    the rollup buckets the readings fall into are refreshed and
+    ``updated_at`` of the sensors' ingest state is bumped, in the same
+    transaction.
+    In the split layout the readings go to the tables of their shapes, see
+    layout.py.
+
+    Args:
+        session: SQLAlchemy session
+        readings: HistoryBatch, or list of dicts with ``sensor_id``,
+            ``time`` and attribute values, see history_values()
+        batch_size: number of rows sent per statement
+        watermarks: optional dict mapping sensor IDs to ``(last_time,
+            sample_interval)`` tuples, written to the ingest state in the
+            same transaction
+
+    Returns:
+        Tuple of (inserted, updated) row counts
+
+    Raises:
+        Exception: the error of the database, after the transaction was
+            rolled back; nothing of the readings or watermarks is stored
+    """
+    values = history_values(readings)
+
+    # Time range of the readings per sensor
+    ranges = {}
+    for sensor_id, reading_time, *_ in values:
+        first, last = ranges.get(sensor_id, (reading_time, reading_time))
+        ranges[sensor_id] = (min(first, reading_time), max(last, reading_time))
+
+    inserted = updated = 0
     try:
-        for reading in readings:
-            session.merge(reading)
+        index = get_assignment_index(session)
+        rows = [(*row, index.hive_at(row[0], row[1])) for row in values]
+        if history_layout(session) == "split":
+            inserted, updated = upsert_split_readings(
+                session, [dict(zip(UPSERT_COLUMNS, row)) for row in rows], batch_size
+            )
+        else:
+            if ranges:
+                ensure_history_partitions(
+                    session,
+                    min(first for first, _ in ranges.values()),
+                    max(last for _, last in ranges.values()),
+                )
+            inserted, updated = upsert_history_values(session, rows, batch_size)
+
+        if ROLLUPS_ENABLED:
+            for sensor_id, (first, last) in ranges.items():
+                refresh_rollups(session, sensor_id, first, last)
+        if ranges:
+            # Cached series are keyed on updated_at, see query.py
+            session.query(IngestState).filter(IngestState.sensor_id.in_(ranges)).update(
+                {IngestState.updated_at: datetime.now(timezone.utc)},
+                synchronize_session=False,
+            )
+        for sensor_id, (last_time, interval) in (watermarks or {}).items():
+            update_ingest_state(session, sensor_id, last_time, interval)
         session.commit()
-    except Exception as e:
-        print(f"Error upserting readings batch: {e}")
+    except Exception:
         session.rollback()
+        raise
+    return inserted, updated
+
+
+def count_parsed(sensor_id, batch):
+    """Record the parsed rows and rejected values of a HistoryBatch."""
+    metrics.inc("rows_parsed_total", len(batch), sensor=sensor_id)
+    if batch.rejected:
+        metrics.inc(
+            "values_rejected_total",
+            sum(batch.rejected.values()),
+            sensor=sensor_id,
+        )
+
+
+def fetch_history_page(sensor_id, limit, batches, since=None, until=None):
+    """Fetch one history response of a sensor and put its batches on ``batches``.
+
+    While the normalizer pool runs, responses of up to POOL_RESPONSE_LIMIT
+    readings are downloaded whole and decoded by a pool worker.
+
+    Returns:
+        Tuple of (readings received, time of the oldest reading or None)
+    """
+    oldest = None
+
+    def put(batch):
+        nonlocal oldest
+        count_parsed(sensor_id, batch)
+        if len(batch):
+            first = min(batch.times)
+            oldest = first if oldest is None else min(oldest, first)
+        batches.put((sensor_id, batch, None))
+
+    if NORMALIZER.running and limit <= POOL_RESPONSE_LIMIT:
+        text = fetch_sensor_history_text(sensor_id, limit, since, until)
+        with metrics.timer("normalize_seconds", sensor=sensor_id):
+            received, chunks = NORMALIZER.parse(sensor_id, text, HISTORY_BATCH_SIZE)
+        for batch in chunks:
+            put(batch)
+    else:
+        received = 0
+        for chunk in stream_sensor_history(sensor_id, limit, since=since, until=until):
+            received += len(chunk)
+            with metrics.timer("normalize_seconds", sensor=sensor_id):
+                batch = NORMALIZER.normalize(sensor_id, chunk)
+            put(batch)
+    return received, oldest
+
+
+def fetch_sensor_batches(sensor_id, limit, batches, since=None):
+    """Stream a sensor's history into ``batches``; runs in a worker thread.
+
+    Puts ``(sensor_id, HistoryBatch, None)`` for every chunk, then
+    ``(sensor_id, None, None)`` when done or ``(sensor_id, None, error)`` if
+    the fetch failed. ``batches`` is bounded, so a slow writer throttles the
+    download instead of letting parsed readings pile up.
+
+    The API returns the newest ``limit`` readings, so a response that fills
+    its limit may be missing older ones. The readings before its oldest one
+    are then fetched with further requests, until a response is not full or
+    reaches ``since``, the sensor's watermark. If that cannot make progress
+    the fetch fails, so the watermark does not skip the missing readings.
+    """
+    try:
+        until = None
+        while True:
+            received, oldest = fetch_history_page(
+                sensor_id, limit, batches, since, until
+            )
+            if received < limit:
+                break
+            if oldest is None or (until is not None and oldest >= until):
+                raise RuntimeError(
+                    f"response filled its limit of {limit} readings below "
+                    f"{oldest or until}, older readings may be missing"
+                )
+            if since is not None and oldest <= since:
+                break
+            logging.info(
+                f"Sensor {sensor_id}: {received} readings, the limit; "
+                f"fetching readings before {oldest}"
+            )
+            until = oldest
+    except Exception as e:
+        batches.put((sensor_id, None, e))
+    else:
+        batches.put((sensor_id, None, None))
+
+
+def write_history_batches(session, batches, sensor_count):
+    """Store batches from the fetch workers until every sensor is done.
+
+    Each chunk is committed on its own. History arrives newest first, so a
+    sensor's watermark may only advance once all of its chunks are stored:
+    the latest chunk of every sensor is held back and written together with
+    the watermark when the sensor is done. A sensor with a chunk that
+    could not be stored is marked ``failed`` and keeps its watermark, so
+    the next run fetches the lost readings again.
+
+    Returns:
+        dict of per-sensor stats with ``inserted`` and ``updated`` counts
+        and the ``failed`` flag
+    """
+    pending = {}
+    progress = {}
+
+    def store(sensor_id, batch, watermarks=None):
+        if batch.rejected:
+            logging.warning(
+                f"Sensor {sensor_id}: rejected values {dict(batch.rejected)}"
+            )
+        stats = progress[sensor_id]
+        try:
+            with metrics.timer("db_write_seconds", sensor=sensor_id):
+                inserted, updated = upsert_history_readings(
+                    session, batch, watermarks=watermarks
+                )
+        except Exception as e:
+            logging.error(f"Storing history for sensor {sensor_id} failed: {e}")
+            stats["failed"] = True
+            return
+        metrics.inc("rows_inserted_total", inserted, sensor=sensor_id)
+        metrics.inc("rows_updated_total", updated, sensor=sensor_id)
+        stats["inserted"] += inserted
+        stats["updated"] += updated
+
+    while sensor_count:
+        sensor_id, batch, error = batches.get()
+        stats = progress.setdefault(
+            sensor_id,
+            {
+                "inserted": 0,
+                "updated": 0,
+                "last_time": None,
+                "gaps": [],
+                "failed": False,
+            },
+        )
+        if batch is not None:
+            if sensor_id in pending:
+                store(sensor_id, pending.pop(sensor_id))
+            if len(batch):
+                times = batch.times
+                newest = max(times)
+                if stats["last_time"] is None or newest > stats["last_time"]:
+                    stats["last_time"] = newest
+                interval = median_interval(times)
+                if interval:
+                    stats["gaps"].append(interval)
+                pending[sensor_id] = batch
+            continue
+
+        sensor_count -= 1
+        batch = pending.pop(sensor_id, None)
+        if error is not None:
+            logging.error(f"Fetching history for sensor {sensor_id} failed: {error}")
+            stats["failed"] = True
+        if stats["failed"]:
+            # Store what was fetched, the watermark stays where it was
+            if batch is not None:
+                store(sensor_id, batch)
+        elif batch is not None:
+            gaps = sorted(stats["gaps"])
+            interval = gaps[len(gaps) // 2] if gaps else None
+            store(sensor_id, batch, {sensor_id: (stats["last_time"], interval)})
+        logging.info(
+            f"Sensor {sensor_id}: {stats['inserted']} readings inserted, "
+            f"{stats['updated']} updated"
+        )
+    return progress
+
+
+def refresh_sensors(session):
+    """Upsert the sensors reported by the API and return their IDs."""
+    sensor_ids = []
+    for sensor_data in get_sensor_list():
+        sensor_id = sensor_data["id"]
+        upsert_sensor(session, sensor_id, sensor_data)
+        sensor_ids.append(sensor_id)
+    return sensor_ids
+
+
+def ingest(session, executor, sensor_ids, workers):
+    """Fetch and store new history of the given sensors.
+
+    Workers stream and normalize, the calling thread is the single writer.
+    The sensor assignments are reloaded first if they changed.
+
+    Returns:
+        dict of per-sensor stats, see write_history_batches
+    """
+    refresh_assignments(session)
+    states = load_ingest_state(session)
+    since = {}
+    limits = {}
+    for sensor_id in sensor_ids:
+        state = states.get(sensor_id)
+        since[sensor_id] = get_watermark(session, sensor_id, state)
+        limits[sensor_id] = get_history_limit(
+            since[sensor_id], state and state.sample_interval
+        )
+    if sum(limits.values()) >= NORMALIZE_MIN_READINGS:
+        NORMALIZER.start()
+    batches = queue.Queue(maxsize=2 * workers)
+    for sensor_id, limit in limits.items():
+        executor.submit(
+            fetch_sensor_batches, sensor_id, limit, batches, since[sensor_id]
+        )
+    return write_history_batches(session, batches, len(limits))
+
+
+def next_poll(state, now, misses):
+    """Return when to poll a sensor next, as a UNIX timestamp.
+
+    Sensors are polled shortly after their next reading is expected. When
+    that moment has passed without new data, polling backs off
+    exponentially up to DAEMON_MAX_INTERVAL.
+
+    Args:
+        state: IngestState of the sensor or None
+        now: current UNIX timestamp
+        misses: number of consecutive polls that returned no new readings
+    """
+    interval = DEFAULT_SAMPLE_INTERVAL
+    if state is not None and state.sample_interval:
+        interval = state.sample_interval
+    interval = min(max(interval, DAEMON_MIN_INTERVAL), DAEMON_MAX_INTERVAL)
+    if state is not None:
+        expected = state.last_time.timestamp() + interval + DAEMON_POLL_DELAY
+        if expected > now:
+            return expected
+    return now + min(interval * 2**misses, DAEMON_MAX_INTERVAL)
+
+
+def run_daemon(session, executor, workers, stop):
+    """Poll every sensor on its own schedule until ``stop`` is set.
+
+    The sensor list and upcoming partitions are refreshed every
+    SENSOR_REFRESH_INTERVAL seconds. Each round ingests all sensors that
+    are due, so a round that is interrupted by ``stop`` still finishes and
+    commits its watermarks.
+    """
+    schedule = []
+    misses = {}
+    refresh_at = 0
+    while not stop.is_set():
+        now = time.time()
+        due = []
+        try:
+            if now >= refresh_at:
+                ensure_upcoming_partitions(session)
+                known = {sensor_id for _, sensor_id in schedule}
+                for sensor_id in refresh_sensors(session):
+                    if sensor_id not in known:
+                        heapq.heappush(schedule, (now, sensor_id))
+                refresh_at = now + SENSOR_REFRESH_INTERVAL
+
+            while schedule and schedule[0][0] <= now:
+                due.append(heapq.heappop(schedule)[1])
+            if due:
+                progress = ingest(session, executor, due, workers)
+                states = load_ingest_state(session)
+                now = time.time()
+                for sensor_id in due:
+                    if progress.get(sensor_id, {}).get("inserted"):
+                        misses[sensor_id] = 0
+                    else:
+                        misses[sensor_id] = misses.get(sensor_id, 0) + 1
+                    at = next_poll(states.get(sensor_id), now, misses[sensor_id])
+                    heapq.heappush(schedule, (at, sensor_id))
+                logging.info(end_run())
+        except Exception as e:
+            logging.exception(f"Polling failed: {e}")
+            session.rollback()
+            # Retry the sensors of the failed round later instead of spinning
+            for sensor_id in due:
+                heapq.heappush(schedule, (now + DAEMON_MIN_INTERVAL, sensor_id))
+
+        wake = min(refresh_at, schedule[0][0]) if schedule else refresh_at
+        stop.wait(max(wake - time.time(), 0))
 
 
 def main(argv):
+    parser = argparse.ArgumentParser(description="Beehive monitoring ingest")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=FETCH_WORKERS,
+        help="Number of sensors fetched concurrently",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and poll each sensor on its observed cadence",
+    )
+    parser.add_argument(
+        "--normalize-workers",
+        type=int,
+        default=NORMALIZE_WORKERS,
+        help="Processes normalizing large runs, below 2 normalizes in-process",
+    )
+    args = parser.parse_args(argv)
+    metrics.job = "ingest"
+    NORMALIZER.workers = args.normalize_workers
+
     # Initialize database
     init_db()
     session = get_session()
 
     try:
         # Set defaults
-        upsert_defaults(session)
-
-        for sensor_data in get_sensor_list():
-            sensor_id = sensor_data["id"]
-            upsert_sensor(session, sensor_id, sensor_data)
-
-            # Fetch and process history
-            limit = get_history_limit(session, sensor_id)
-            history_data = fetch_sensor_history(sensor_id, limit)
-
-            # Prepare batch of readings
-            readings = []
-            for measurement in history_data:
-                time = measurement.pop("time")
-
-                # Process measurement data to handle arrays vs scalars
-                processed_data = {}
-                for k, v in measurement.items():
-                    if k in ARRAY_ATTRIBUTES:
-                        # Store arrays as ARRAY(Integer)
-                        if isinstance(v, list):
-                            # Convert all elements to integers
-                            try:
-                                processed_data[k] = [int(x) for x in v]
-                            except (ValueError, TypeError):
-                                # Skip invalid arrays
-                                continue
-                        elif v is not None:
-                            # Convert single value to array
-                            try:
-                                processed_data[k] = [int(v)]
-                            except (ValueError, TypeError):
-                                # Skip invalid values
-                                continue
-                        else:
-                            processed_data[k] = None
-                    elif k in INTEGER_ATTRIBUTES:
-                        # Store as Integer
-                        if v is not None:
-                            try:
-                                processed_data[k] = int(v)
-                            except (ValueError, TypeError):
-                                # Skip invalid values
-                                continue
-                        else:
-                            processed_data[k] = None
-                    else:
-                        # Store scalars as Float
-                        if v is not None:
-                            try:
-                                processed_data[k] = float(v)
-                            except (ValueError, TypeError):
-                                # Skip invalid values
-                                continue
-                        else:
-                            processed_data[k] = None
-
-                reading = History(
-                    sensor_id=sensor_id,
-                    time=datetime.fromtimestamp(time / 1000, tz=timezone.utc),
-                    **processed_data,
+        try:
+            upsert_defaults(session)
+        except TopologyError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+        # Database work happens on this thread only; workers just fetch
+        workers = max(args.workers, 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            if args.daemon:
+                logging.basicConfig(
+                    level=logging.INFO,
+                    format="%(asctime)s - %(levelname)s - %(message)s",
                 )
-                readings.append(reading)
-
-            upsert_history_readings(session, readings)
+                if METRICS_PORT:
+                    metrics.serve(METRICS_PORT)
+                stop = threading.Event()
+                for signum in (signal.SIGTERM, signal.SIGINT):
+                    signal.signal(signum, lambda signum, frame: stop.set())
+                run_daemon(session, executor, workers, stop)
+                logging.info("Stopped")
+            else:
+                ensure_upcoming_partitions(session)
+                ingest(session, executor, refresh_sensors(session), workers)
+                print(end_run())
+        return 0
 
     finally:
+        NORMALIZER.shutdown()
         close_session()
 
 
 if __name__ == "__main__":
-    main(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))
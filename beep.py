@@ -1,126 +1,154 @@
 import requests
+import sys
 import time
-from sqlalchemy import create_engine, select
-from sqlalchemy.orm import sessionmaker
-from models import History
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from functools import partial
 from dotenv import load_dotenv
 import os
 import argparse
 import logging
 from filelock import FileLock, Timeout
 from beep_sensors import (
-    HIVES,
-    DEVICES,
     SENSORS_HEART,
     SENSORS_SCALE,
+    frequency_bands,
 )
-from database import get_session, close_session
+from topology import TopologyError, get_topology
+from ratelimit import TokenBucket, backoff_delay, retry_after
+from metrics import metrics, end_run
 import atexit
 import json
+import re
+from urllib.parse import urlsplit
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
-)
-
-# If running in cron (no TTY), set to WARNING level
-if not os.isatty(0):
-    logging.getLogger().setLevel(logging.WARNING)
-
-# Lockfile mechanism
+# Lockfile mechanism, taken by main() only so the module can be imported
 LOCK_FILE = "/tmp/beep.lock"
-lock = FileLock(
-    LOCK_FILE, timeout=0
-)  # timeout=0 means it will fail immediately if lock exists
-
-try:
-    lock.acquire()
-except Timeout:
-    # If we can't acquire the lock, another instance is running
-    if os.isatty(0):  # Only log if running in terminal
-        logging.warning("Another instance is already running. Exiting.")
-    exit(0)
-
-# Register cleanup function to release lock on exit
-atexit.register(lock.release)
 
 load_dotenv()
 
 
-BASE_URL = "https://api.beep.nl"
+BASE_URL = os.getenv("BEEP_BASE_URL", "https://api.beep.nl")
 HEADERS = {"Authorization": f"Bearer {os.getenv('BEEP_API_TOKEN')}"}
 
-# Beehivemonitor -> Beep
-HIVE_MAP = {
-    30522: 66651,  # Beute 1
-    30523: 66652,  # Beute 2
-    30602: 66653,  # Beute 3
-    30603: 66654,  # Beute 4
-    30604: 66699,  # Beute 5
-    30605: 66700,  # Beute 6
+# Requests per minute until BEEP reports its own limit, and retries of
+# failed requests
+RATE_LIMIT = int(os.getenv("BEEP_RATE_LIMIT", "60"))
+MAX_RETRIES = int(os.getenv("BEEP_MAX_RETRIES", "5"))
+
+# Shared by all requests for connection reuse and pacing
+http = requests.Session()
+rate_limiter = TokenBucket(RATE_LIMIT)
+
+# Number of measurements uploaded per request
+BATCH_SIZE = int(os.getenv("BEEP_BATCH_SIZE", "50"))
+
+# Upload statuses meaning the measurements themselves were rejected; any
+# other failure (auth, unknown device, throttling, server errors) stops the
+# upload of the device
+REJECTED_STATUSES = {400, 422}
+# Upload statuses meaning the device key is no longer valid
+AUTH_STATUSES = {401, 403}
+
+# History rows read per query while syncing, each in its own transaction
+SYNC_CHUNK_SIZE = int(os.getenv("BEEP_SYNC_CHUNK_SIZE", "1000"))
+
+# BEEP measurement fields and the History columns they are read from
+DEVICE_COLUMNS = {
+    "scale": {
+        "w_v": "weight",
+        "t": "tempOut",
+        "h": "humidityOut",
+        "bv": "vbatOut",
+        "rssi": "rssiOut",
+        "p": "pressure",
+    },
+    "heart": {
+        "t_i": "tempIn",
+        "h_i": "humidityIn",
+        "bv": "vbatIn",
+        "rssi": "rssiIn",
+    },
 }
 
-FREQUENCY_BANDS = {
-    (0, 146): "s_bin098_146Hz",
-    #    (98, 146): "s_bin098_146Hz",
-    (146, 195): "s_bin146_195Hz",
-    (195, 244): "s_bin195_244Hz",
-    (244, 293): "s_bin244_293Hz",
-    (293, 342): "s_bin293_342Hz",
-    (342, 391): "s_bin342_391Hz",
-    (391, 439): "s_bin391_439Hz",
-    (439, 488): "s_bin439_488Hz",
-    (488, 537): "s_bin488_537Hz",
-    # (537, 586): "s_bin537_586Hz",
-    (537, 999999): "s_bin537_586Hz",
-}
+# Device upload keys are cached on disk for KEY_CACHE_TTL seconds, 0 disables
+KEY_CACHE_FILE = os.getenv(
+    "BEEP_KEY_CACHE", os.path.expanduser("~/.cache/bees/beep_device_keys.json")
+)
+KEY_CACHE_TTL = int(os.getenv("BEEP_KEY_CACHE_TTL", "86400"))
+
+# Measurements BEEP rejected as invalid, one JSON object per line with the
+# device, status and measurement, so they can be fixed and uploaded again
+DEAD_LETTER_FILE = os.getenv(
+    "BEEP_DEAD_LETTER_FILE", os.path.expanduser("~/.cache/bees/beep_rejected.jsonl")
+)
 
 
 def get_beep_hive_id(bhm_hive_id):
-    return HIVE_MAP.get(bhm_hive_id)
+    return get_topology().beep_hive_id(bhm_hive_id)
 
 
 def get_bhm_hive_id(beep_hive_id):
-    for bhm_id, beep_id in HIVE_MAP.items():
-        if beep_id == beep_hive_id:
-            return bhm_id
-    return None
+    return get_topology().bhm_hive_id(beep_hive_id)
 
 
 def rate_limit_aware_request(method, url, **kwargs):
     """
     Helper function to make rate-limited requests to the BEEP API.
-    Handles rate limiting by checking response headers and waiting when necessary.
+    Requests are paced by ``rate_limiter``, which learns the allowed rate
+    from the response headers. 429 and 5xx responses and connection errors
+    are retried with jittered exponential backoff, honouring Retry-After.
     """
-    while True:
-        response = requests.request(method, url, **kwargs)
-
-        remaining = int(response.headers.get("X-RateLimit-Remaining", 0))
-        limit = int(response.headers.get("X-RateLimit-Limit", 60))
-
-        if remaining < limit * 0.1:  # If less than 10% remaining
-            sleep_time = 60  # Default to 60 seconds if no reset header
-            if "X-RateLimit-Reset" in response.headers:
-                reset_time = int(response.headers["X-RateLimit-Reset"])
-                sleep_time = max(1, reset_time - int(time.time()))
-            logging.info(f"Rate limit low. Waiting {sleep_time} seconds...")
-            time.sleep(sleep_time)
-        else:
+    # IDs are left out so all requests to an endpoint share one label
+    endpoint = re.sub(r"/\d+", "/{id}", urlsplit(url).path)
+    for attempt in range(MAX_RETRIES + 1):
+        metrics.inc("rate_limit_sleep_seconds_total", rate_limiter.acquire())
+        try:
+            with metrics.timer("http_request_seconds", stage=endpoint):
+                response = http.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            logging.info(f"{method} {url} failed ({e}), retrying in {delay:.1f}s")
+            rate_limiter.sleep(delay)
+            metrics.inc("rate_limit_sleep_seconds_total", delay)
+            continue
+
+        metrics.inc("http_response_bytes_total", len(response.content), stage=endpoint)
+        rate_limiter.update(response.headers)
+        if response.status_code != 429 and response.status_code < 500:
+            return response
+        if attempt == MAX_RETRIES:
             return response
 
+        delay = retry_after(response.headers)
+        if delay is None:
+            delay = backoff_delay(attempt)
+        logging.info(
+            f"{method} {url} -> {response.status_code}, retrying in {delay:.1f}s"
+        )
+        if response.status_code == 429:
+            # Everyone has to wait, not just this request
+            rate_limiter.pause(delay)
+        else:
+            rate_limiter.sleep(delay)
+            metrics.inc("rate_limit_sleep_seconds_total", delay)
+
 
 def setup_devices():
-    for device in DEVICES:
-        device["type"] = "other"
+    for device in get_topology().beep_devices.values():
+        # Created as "other"; the topology keeps the type for setup_sensors
         res = rate_limit_aware_request(
-            "POST", f"{BASE_URL}/api/devices", headers=HEADERS, json=device
+            "POST",
+            f"{BASE_URL}/api/devices",
+            headers=HEADERS,
+            json={**device, "type": "other"},
         )
         logging.info(f"Device setup: {res.status_code} {res.text}")
 
 
 def setup_sensors():
-    for device in DEVICES:
+    for device in get_topology().beep_devices.values():
         if device["type"] == "heart":
             sensors = SENSORS_HEART
         elif device["type"] == "scale":
@@ -136,121 +164,440 @@ def setup_sensors():
             logging.info(f"Sensor setup: {res.status_code} {res.text}")
 
 
-def sync_measurements():
+def load_cached_device_keys():
+    """Return device keys from the disk cache, or an empty dict if stale."""
+    try:
+        with open(KEY_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if time.time() - cache.get("fetched_at", 0) > KEY_CACHE_TTL:
+        return {}
+    return {int(device_id): key for device_id, key in cache["keys"].items()}
+
+
+def save_cached_device_keys(keys, fetched_at=None):
+    """Write device keys to the disk cache, readable by the owner only."""
+    try:
+        os.makedirs(os.path.dirname(KEY_CACHE_FILE), exist_ok=True)
+        fd = os.open(KEY_CACHE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"fetched_at": fetched_at or time.time(), "keys": keys}, f)
+    except OSError as e:
+        logging.warning(f"Could not write device key cache: {e}")
+
+
+def update_cached_device_key(device_id, key):
+    """Replace, or with a key of None remove, one key in the disk cache.
+
+    The cache keeps its age, so the other keys expire as before.
+    """
+    try:
+        with open(KEY_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return
+    if key is None:
+        cache["keys"].pop(str(device_id), None)
+    else:
+        cache["keys"][str(device_id)] = key
+    save_cached_device_keys(cache["keys"], cache.get("fetched_at"))
+
+
+def fetch_device_key(device_id):
+    """Return the upload key of a BEEP device from the API, or None."""
+    res = rate_limit_aware_request(
+        "GET", f"{BASE_URL}/api/devices/{device_id}", headers=HEADERS
+    )
+    if res.status_code != 200:
+        logging.error(f"Device {device_id} not found")
+        return None
+    # needed to send measurement
+    return res.json()["key"]
+
+
+def get_device_keys():
+    """Return the upload key of every BEEP device, keyed by device ID.
+
+    Keys are fetched once per run, and only for devices missing from the
+    disk cache.
+    """
+    keys = load_cached_device_keys() if KEY_CACHE_TTL > 0 else {}
+    missing = [
+        device_id for device_id in get_topology().beep_devices if device_id not in keys
+    ]
+    for device_id in missing:
+        key = fetch_device_key(device_id)
+        if key is not None:
+            keys[device_id] = key
+    if missing and KEY_CACHE_TTL > 0:
+        save_cached_device_keys(keys)
+    return keys
+
+
+def refresh_device_key(keys, refreshed, device_id):
+    """Replace a key BEEP rejected, at most once per device and run.
+
+    The key is dropped from the disk cache and fetched again, so a rotated
+    key is picked up without waiting for KEY_CACHE_TTL.
+
+    Args:
+        keys: dict of device ID -> key, updated in place
+        refreshed: set of devices whose key was fetched again already
+
+    Returns:
+        The new key, or None to give up
+    """
+    if device_id in refreshed:
+        return None
+    refreshed.add(device_id)
+    logging.warning(f"Key of device {device_id} was rejected, fetching it again")
+    key = fetch_device_key(device_id)
+    if key is None:
+        keys.pop(device_id, None)
+    else:
+        keys[device_id] = key
+    if KEY_CACHE_TTL > 0:
+        update_cached_device_key(device_id, key)
+    return key
+
+
+def post_measurements(key, batch):
+    """Upload measurements of one device, returning ``(ok, response)``.
+
+    Batches go to /api/sensors/multiple with the device key in every
+    measurement; single measurements use /api/sensors as before.
+    """
+    if len(batch) == 1:
+        res = rate_limit_aware_request(
+            "POST", f"{BASE_URL}/api/sensors?key={key}", headers=HEADERS, json=batch[0]
+        )
+    else:
+        res = rate_limit_aware_request(
+            "POST",
+            f"{BASE_URL}/api/sensors/multiple",
+            headers=HEADERS,
+            json=[{"key": key, **data} for data in batch],
+        )
+    return res.ok, res
+
+
+def record_rejected(device_id, measurement, response):
+    """Append a measurement BEEP rejected to DEAD_LETTER_FILE."""
+    try:
+        os.makedirs(os.path.dirname(DEAD_LETTER_FILE), exist_ok=True)
+        with open(DEAD_LETTER_FILE, "a") as f:
+            record = {
+                "device_id": device_id,
+                "time": measurement["time"],
+                "status": response.status_code,
+                "response": response.text[:500],
+                "measurement": measurement,
+            }
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        logging.warning(f"Could not record rejected measurement: {e}")
+
+
+def upload_measurements(
+    key,
+    measurements,
+    batch_size=BATCH_SIZE,
+    on_confirmed=None,
+    on_rejected=None,
+    on_unauthorized=None,
+):
+    """Upload measurements of one device in batches of ``batch_size``.
+
+    Measurements must be sorted oldest first. A batch rejected as invalid
+    (REJECTED_STATUSES) is split in half and retried, down to single
+    measurements, so one bad measurement only loses itself. Any other
+    failure, like a revoked key, lasting throttling or a server error,
+    stops the upload without confirming anything, so the remaining
+    measurements are retried on the next run.
+
+    Args:
+        on_confirmed: optional callable receiving the time of the newest
+            measurement once it and everything before it was uploaded, or
+            rejected as invalid on its own
+        on_rejected: optional callable receiving a measurement rejected as
+            invalid and the response, called before it is confirmed
+        on_unauthorized: optional callable returning a new key, or None,
+            once the key is rejected (AUTH_STATUSES); called at most once,
+            the batch is retried with the new key
+
+    Returns:
+        Tuple of (uploaded, failed) measurement counts
+    """
+    uploaded = failed = 0
+    pending = [
+        measurements[i : i + batch_size]
+        for i in range(0, len(measurements), max(batch_size, 1))
+    ]
+    while pending:
+        batch = pending.pop(0)
+        ok, res = post_measurements(key, batch)
+        span = f"{len(batch)} measurements {batch[0]['time']}..{batch[-1]['time']}"
+        if ok:
+            uploaded += len(batch)
+            logging.info(f"Uploaded {span} -> {res.status_code}")
+        elif res.status_code in AUTH_STATUSES and on_unauthorized is not None:
+            key, on_unauthorized = on_unauthorized(), None
+            if key is None:
+                logging.error(f"Upload of {span} failed: {res.status_code}, stopping")
+                break
+            pending.insert(0, batch)
+            continue
+        elif res.status_code not in REJECTED_STATUSES:
+            logging.error(f"Upload of {span} failed: {res.status_code}, stopping")
+            break
+        elif len(batch) > 1:
+            logging.warning(f"Batch of {span} rejected ({res.status_code}), splitting")
+            middle = len(batch) // 2
+            pending[:0] = [batch[:middle], batch[middle:]]
+            continue
+        else:
+            failed += 1
+            logging.error(f"Upload of {span} failed: {res.status_code} {res.text}")
+            if on_rejected is not None:
+                on_rejected(batch[0], res)
+        if on_confirmed is not None:
+            on_confirmed(batch[-1]["time"])
+    return uploaded, failed
+
+
+def get_remote_last_time(hive_id):
+    """Return the time of the newest measurement BEEP has for a hive, or None."""
+    res = rate_limit_aware_request(
+        "GET",
+        f"{BASE_URL}/api/sensors/lastvalues",
+        headers=HEADERS,
+        params={"hive_id": hive_id},
+    )
+    if res.status_code != 200:
+        return None
+    last = res.json()["time"]  # "2025-02-14T01:35:04Z"
+    return datetime.strptime(last, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+
+
+def advance_cursor(session, cursors, device_id, timestamp):
+    """Move a device's sync cursor to ``timestamp`` and commit."""
+    from models import BeepSyncCursor
+
+    last_time = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    cursor = cursors.get(device_id)
+    if cursor is None:
+        cursor = cursors[device_id] = BeepSyncCursor(device_id=device_id)
+        session.add(cursor)
+    cursor.last_time = last_time
+    cursor.updated_at = datetime.now(timezone.utc)
+    session.commit()
+
+
+def iter_history_chunks(session, columns, sensor_id, after, shapes):
+    """Yield lists of up to SYNC_CHUNK_SIZE history rows newer than ``after``.
+
+    Rows come oldest first. Every chunk is read with its own keyset query
+    (``time > last seen ORDER BY time LIMIT n``) whose transaction ends
+    before the chunk is yielded, so no transaction stays open while the
+    caller uploads or waits for the rate limit.
+    """
+    from sqlalchemy import select
+    from models import History, reading_shape_filter
+
+    while True:
+        rows = session.execute(
+            select(*columns)
+            .where(
+                History.sensor_id == sensor_id,
+                History.time > after,
+                reading_shape_filter(*shapes),
+            )
+            .order_by(History.time)
+            .limit(SYNC_CHUNK_SIZE)
+        ).all()
+        session.commit()
+        if rows:
+            yield rows
+        if len(rows) < SYNC_CHUNK_SIZE:
+            return
+        after = rows[-1].time
+
+
+def sync_measurements(batch_size=BATCH_SIZE, verify=False):
+    """Upload new history readings to BEEP.
+
+    Each device resumes after its sync cursor, which only advances once BEEP
+    confirmed the upload. Devices without a cursor start from the newest
+    measurement BEEP reports for their hive, or one day ago.
+
+    Args:
+        batch_size: number of measurements uploaded per request
+        verify: compare every cursor with /api/sensors/lastvalues and log
+            differences
+    """
+    # Imported here, so importing this module does not load SQLAlchemy
+    from database import get_session, close_session
+    from models import History, BeepSyncCursor
+
     # Get database session
     session = get_session()
 
     try:
-        for hive in HIVES:
-            res = rate_limit_aware_request(
-                "GET",
-                f"{BASE_URL}/api/sensors/lastvalues",
-                headers=HEADERS,
-                params={"hive_id": hive["id"]},
-            )
-            if res.status_code != 200:
-                last = datetime.now() - timedelta(days=1)
-            else:
-                last = res.json()["time"]  # "2025-02-14T01:35:04Z"
-                last = datetime.strptime(last, "%Y-%m-%dT%H:%M:%SZ")
-
-            bhm_id = get_bhm_hive_id(hive["id"])
-            measurements = []
-
-            # Scales
-            for device in DEVICES:
-                res = rate_limit_aware_request(
-                    "GET", f"{BASE_URL}/api/devices/{device['id']}", headers=HEADERS
-                )
-                if res.status_code != 200:
-                    logging.error(f"Device {device['id']} not found")
-                    continue
-                # needed to send measurement
-                key = res.json()["key"]
-
-                # Query all measurements for the hive that have either weight or tempIn data
-                stmt = (
-                    select(History)
-                    .where(
-                        History.sensor_id == bhm_id,
-                        History.time > last - timedelta(minutes=15),
+        topology = get_topology(session)
+        cursors = {c.device_id: c for c in session.query(BeepSyncCursor)}
+        keys = get_device_keys()
+        # Devices whose rejected key was fetched again this run
+        refreshed = set()
+        for hive in topology.beep_hives.values():
+            # Devices of this hive by type; readings are routed to them
+            devices = {
+                device_type: device
+                for device_type, device in topology.hive_devices[hive["id"]].items()
+                if device["id"] in keys
+            }
+            if not devices:
+                continue
+
+            # Resume point of every device of the hive
+            starts = {
+                device_type: cursors[device["id"]].last_time
+                for device_type, device in devices.items()
+                if device["id"] in cursors
+            }
+            if verify or len(starts) < len(devices):
+                remote_last = get_remote_last_time(hive["id"])
+                if verify and remote_last is not None:
+                    for device_type, start in starts.items():
+                        if start != remote_last:
+                            logging.warning(
+                                f"{devices[device_type]['name']}: cursor {start} "
+                                f"differs from BEEP last value {remote_last}"
+                            )
+                if remote_last is None and len(starts) < len(devices):
+                    logging.warning(
+                        f"Hive {hive['id']}: no BEEP last value, new devices "
+                        "start one day ago"
                     )
-                    .order_by(History.time.desc())
+                    remote_last = datetime.now(timezone.utc) - timedelta(days=1)
+                for device_type in devices:
+                    starts.setdefault(device_type, remote_last)
+
+            bhm_id = topology.bhm_hive_id(hive["id"])
+
+            # Query the hive once for all of its devices, selecting only the
+            # readings and columns they need, and read them in chunks
+            shapes = [
+                device_type for device_type in devices if device_type in DEVICE_COLUMNS
+            ]
+            if not shapes:
+                continue
+            names = ["time"]
+            for device_type in shapes:
+                names += DEVICE_COLUMNS[device_type].values()
+                if device_type == "heart":
+                    names.append("frequency")
+            columns = [History.__table__.c[name] for name in dict.fromkeys(names)]
+            chunks = iter_history_chunks(
+                session,
+                columns,
+                bhm_id,
+                min(starts[device_type] for device_type in shapes),
+                shapes,
+            )
+
+            stopped = set()
+            totals = {device_type: [0, 0] for device_type in devices}
+            for rows in metrics.timed(chunks, "db_read_seconds", hive=hive["id"]):
+                measurements = {device_type: [] for device_type in devices}
+                bands = (
+                    frequency_bands([r.frequency for r in rows])
+                    if "heart" in devices
+                    else [None] * len(rows)
                 )
-                results = session.execute(stmt).scalars().all()
-
-                for r in results:
-                    frequency_band = None
-                    for (lower, upper), band_name in FREQUENCY_BANDS.items():
-                        if r.frequency and lower <= r.frequency < upper:
-                            frequency_band = band_name
-                            break
-
-                    # Determine if this is a scale or heart measurement based on available data
-                    if r.weight is not None:
-                        data = {
-                            "key": key,
-                            "time": r.time.timestamp(),
-                            "w_v": r.weight,
-                            "t": r.tempOut,
-                            "h": r.humidityOut,
-                            "bv": r.vbatOut,
-                            "rssi": r.rssiOut,
-                            "p": r.pressure,
-                        }
-                    elif r.tempIn is not None:
-                        data = {
-                            "key": key,
-                            "time": r.time.timestamp(),
-                            "t_i": r.tempIn,
-                            "h_i": r.humidityIn,
-                            "bv": r.vbatIn,
-                            "rssi": r.rssiIn,
-                            "frequency_band": frequency_band,
-                        }
-                    elif (r.rssiGw is not None) and (r.pressureGw is not None):
-                        # ignore gateway measurements
-                        continue
+                for r, frequency_band in zip(rows, bands):
+                    # Only scale and heart readings are selected, told apart
+                    # by weight like READING_SHAPES
+                    if "scale" in devices and r.weight is not None:
+                        device_type = "scale"
                     else:
-                        # Enhanced error logging with measurement details
-                        measurement_details = {
-                            "sensor_id": r.sensor_id,
-                            "time": r.time,
-                            "device_type": device["type"],
-                            "all_attributes": {
-                                attr: getattr(r, attr, None)
-                                for attr in dir(r)
-                                if not attr.startswith("_")  # Skip private attributes
-                                and not callable(getattr(r, attr))  # Skip methods
-                                and attr
-                                not in [
-                                    "metadata",
-                                    "query",
-                                    "query_class",
-                                ]  # Skip SQLAlchemy internals
-                            },
-                        }
-                        logging.error(
-                            f"Unknown measurement type for sensor {r.sensor_id}. "
-                            f"Device type: {device['type']}. "
-                            f"Measurement details: {json.dumps(measurement_details, default=str)}"
-                        )
+                        device_type = "heart"
+                    if r.time <= starts[device_type]:
                         continue
-                    measurements.append(data)
-
-            for data in measurements:
-                res = rate_limit_aware_request(
-                    "POST",
-                    f"{BASE_URL}/api/sensors?key={data.pop('key')}",
-                    headers=HEADERS,
-                    json=data,
+                    data = {"time": r.time.timestamp()}
+                    for field, name in DEVICE_COLUMNS[device_type].items():
+                        data[field] = getattr(r, name)
+                    if device_type == "heart":
+                        data["frequency_band"] = frequency_band
+                    measurements[device_type].append(data)
+
+                for device_type, device in devices.items():
+                    device_measurements = measurements[device_type]
+                    if not device_measurements or device_type in stopped:
+                        continue
+                    uploaded, failed = upload_measurements(
+                        keys[device["id"]],
+                        device_measurements,
+                        batch_size,
+                        on_confirmed=lambda timestamp, device_id=device["id"]: (
+                            advance_cursor(session, cursors, device_id, timestamp)
+                        ),
+                        on_rejected=partial(record_rejected, device["id"]),
+                        on_unauthorized=partial(
+                            refresh_device_key, keys, refreshed, device["id"]
+                        ),
+                    )
+                    totals[device_type][0] += uploaded
+                    totals[device_type][1] += failed
+                    metrics.inc(
+                        "readings_uploaded_total", uploaded, device=device["id"]
+                    )
+                    metrics.inc("readings_failed_total", failed, device=device["id"])
+                    if uploaded + failed < len(device_measurements):
+                        # Keep the cursor in front of the gap
+                        stopped.add(device_type)
+
+            for device_type, device in devices.items():
+                uploaded, failed = totals[device_type]
+                logging.info(
+                    f"{device['name']}: {uploaded} measurements uploaded, "
+                    f"{failed} failed"
                 )
-                logging.info(f"{data} -> {res.status_code} {res.text}")
     finally:
+        logging.info(f"Waited {rate_limiter.waited:.1f}s for the BEEP rate limit")
         close_session()
 
 
-if __name__ == "__main__":
+def configure_logging():
+    """Log to stderr, only warnings and errors when running in cron."""
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    # If running in cron (no TTY), set to WARNING level
+    if not os.isatty(0):
+        logging.getLogger().setLevel(logging.WARNING)
+
+
+def acquire_lock():
+    """Make sure only one instance runs, exit quietly otherwise."""
+    lock = FileLock(
+        LOCK_FILE, timeout=0
+    )  # timeout=0 means it will fail immediately if lock exists
+
+    try:
+        lock.acquire()
+    except Timeout:
+        # If we can't acquire the lock, another instance is running
+        if os.isatty(0):  # Only log if running in terminal
+            logging.warning("Another instance is already running. Exiting.")
+        sys.exit(0)
+
+    # Register cleanup function to release lock on exit
+    atexit.register(lock.release)
+
+
+def main(argv):
     parser = argparse.ArgumentParser(description="BEEP API interaction tool")
     parser.add_argument(
         "action",
@@ -259,10 +606,35 @@ if __name__ == "__main__":
         nargs="?",
         help="Action to perform: setup (devices and sensors) or sync (measurements)",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Number of measurements uploaded per request",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Compare sync cursors with the last values reported by BEEP",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+    try:
+        get_topology()
+    except TopologyError as e:
+        logging.error(e)
+        return 1
+    acquire_lock()
+    metrics.job = "beep"
 
     if args.action == "setup":
         setup_devices()
         setup_sensors()
     else:  # sync is default
-        sync_measurements()
+        sync_measurements(args.batch_size, args.verify)
+        print(end_run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
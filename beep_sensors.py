@@ -1,3 +1,10 @@
+from bisect import bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, bisect is used without it
+    np = None
+
 HIVES = [
     {"id": 66651, "name": "Beute 1"},
     {"id": 66652, "name": "Beute 2"},
@@ -6,6 +13,15 @@ HIVES = [
     {"id": 66699, "name": "Beute 5"},
     {"id": 66700, "name": "Beute 6"},
 ]
+# Beehivemonitor -> Beep
+HIVE_MAP = {
+    30522: 66651,  # Beute 1
+    30523: 66652,  # Beute 2
+    30602: 66653,  # Beute 3
+    30603: 66654,  # Beute 4
+    30604: 66699,  # Beute 5
+    30605: 66700,  # Beute 6
+}
 DEVICES = [
     {"id": 5835, "name": "Hive Heart 1", "hive_id": 66651, "type": "heart"},
     {"id": 5905, "name": "Hive Heart 2", "hive_id": 66652, "type": "heart"},
@@ -16,6 +32,53 @@ DEVICES = [
     {"id": 3187, "name": "Scientific Scale 1", "hive_id": 66654, "type": "scale"},
     {"id": 5834, "name": "Scientific Scale 2", "hive_id": 66699, "type": "scale"},
 ]
+# Heart frequency bands as (lower bound in Hz, BEEP abbreviation, BEEP
+# measurement ID), sorted by lower bound. A band reaches up to the next lower
+# bound; the last one up to FREQUENCY_MAX.
+FREQUENCY_BANDS = [
+    (0, "s_bin098_146Hz", 26),
+    (146, "s_bin146_195Hz", 27),
+    (195, "s_bin195_244Hz", 28),
+    (244, "s_bin244_293Hz", 29),
+    (293, "s_bin293_342Hz", 30),
+    (342, "s_bin342_391Hz", 31),
+    (391, "s_bin391_439Hz", 32),
+    (439, "s_bin439_488Hz", 33),
+    (488, "s_bin488_537Hz", 34),
+    (537, "s_bin537_586Hz", 35),
+]
+FREQUENCY_MAX = 999999
+
+# Compiled form of FREQUENCY_BANDS for bisect and numpy.searchsorted
+BAND_EDGES = [lower for lower, _, _ in FREQUENCY_BANDS] + [FREQUENCY_MAX]
+BAND_NAMES = [name for _, name, _ in FREQUENCY_BANDS]
+
+
+def frequency_band(frequency):
+    """Return the band name of a frequency, or None if it is outside all bands.
+
+    A missing or zero frequency has no band.
+    """
+    if not frequency:
+        return None
+    index = bisect_right(BAND_EDGES, frequency) - 1
+    return BAND_NAMES[index] if 0 <= index < len(BAND_NAMES) else None
+
+
+def frequency_bands(frequencies):
+    """Return the band name of every frequency in a sequence, in one call.
+
+    Uses numpy.searchsorted when numpy is installed.
+    """
+    if np is None:
+        return [frequency_band(frequency) for frequency in frequencies]
+    values = np.array([frequency or np.nan for frequency in frequencies], dtype=float)
+    indices = np.searchsorted(BAND_EDGES, values, side="right") - 1
+    valid = (indices >= 0) & (indices < len(BAND_NAMES)) & ~np.isnan(values)
+    names = np.array(BAND_NAMES + [None], dtype=object)
+    return names[np.where(valid, indices, len(BAND_NAMES))].tolist()
+
+
 SENSORS_HEART = [
     {
         "name": "bv",
@@ -47,106 +110,19 @@ SENSORS_HEART = [
         "input_abbr": "rssi",
         "output_abbr": "rssi",
     },
-    {
-        "name": "s_bin098_146Hz",
-        "inside": True,
-        "offset": 0,
-        "multiplier": 1,
-        "input_measurement_id": 26,
-        "output_measurement_id": 26,
-        "input_abbr": "s_bin098_146Hz",
-        "output_abbr": "s_bin098_146Hz",
-    },
-    {
-        "name": "s_bin146_195Hz",
-        "inside": True,
-        "offset": 0,
-        "multiplier": 1,
-        "input_measurement_id": 27,
-        "output_measurement_id": 27,
-        "input_abbr": "s_bin146_195Hz",
-        "output_abbr": "s_bin146_195Hz",
-    },
-    {
-        "name": "s_bin195_244Hz",
-        "inside": True,
-        "offset": 0,
-        "multiplier": 1,
-        "input_measurement_id": 28,
-        "output_measurement_id": 28,
-        "input_abbr": "s_bin195_244Hz",
-        "output_abbr": "s_bin195_244Hz",
-    },
-    {
-        "name": "s_bin244_293Hz",
-        "inside": True,
-        "offset": 0,
-        "multiplier": 1,
-        "input_measurement_id": 29,
-        "output_measurement_id": 29,
-        "input_abbr": "s_bin244_293Hz",
-        "output_abbr": "s_bin244_293Hz",
-    },
-    {
-        "name": "s_bin293_342Hz",
-        "inside": True,
-        "offset": 0,
-        "multiplier": 1,
-        "input_measurement_id": 30,
-        "output_measurement_id": 30,
-        "input_abbr": "s_bin293_342Hz",
-        "output_abbr": "s_bin293_342Hz",
-    },
-    {
-        "name": "s_bin342_391Hz",
-        "inside": True,
-        "offset": 0,
-        "multiplier": 1,
-        "input_measurement_id": 31,
-        "output_measurement_id": 31,
-        "input_abbr": "s_bin342_391Hz",
-        "output_abbr": "s_bin342_391Hz",
-    },
-    {
-        "name": "s_bin391_439Hz",
-        "inside": True,
-        "offset": 0,
-        "multiplier": 1,
-        "input_measurement_id": 32,
-        "output_measurement_id": 32,
-        "input_abbr": "s_bin391_439Hz",
-        "output_abbr": "s_bin391_439Hz",
-    },
-    {
-        "name": "s_bin439_488Hz",
-        "inside": True,
-        "offset": 0,
-        "multiplier": 1,
-        "input_measurement_id": 33,
-        "output_measurement_id": 33,
-        "input_abbr": "s_bin439_488Hz",
-        "output_abbr": "s_bin439_488Hz",
-    },
-    {
-        "name": "s_bin488_537Hz",
-        "inside": True,
-        "offset": 0,
-        "multiplier": 1,
-        "input_measurement_id": 34,
-        "output_measurement_id": 34,
-        "input_abbr": "s_bin488_537Hz",
-        "output_abbr": "s_bin488_537Hz",
-    },
-    {
-        "name": "s_bin537_586Hz",
-        "inside": True,
-        "offset": 0,
-        "multiplier": 1,
-        "input_measurement_id": 35,
-        "output_measurement_id": 35,
-        "input_abbr": "s_bin537_586Hz",
-        "output_abbr": "s_bin537_586Hz",
-    },
+    *[
+        {
+            "name": name,
+            "inside": True,
+            "offset": 0,
+            "multiplier": 1,
+            "input_measurement_id": measurement_id,
+            "output_measurement_id": measurement_id,
+            "input_abbr": name,
+            "output_abbr": name,
+        }
+        for _, name, measurement_id in FREQUENCY_BANDS
+    ],
     {
         "name": "t",
         "inside": True,
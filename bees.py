@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Single entry point for all bees commands.
+
+Usage:
+    python bees.py ingest [--workers N] [--daemon]
+    python bees.py backfill SINCE [--until TIME] [--sensor ID ...]
+    python bees.py sync [--batch-size N] [--verify]
+    python bees.py setup
+    python bees.py migrate quick|alembic
+    python bees.py partitions ensure|detach|split-legacy ...
+    python bees.py rollups rebuild START END [--sensor ID ...]
+    python bees.py layout status|split|wide
+    python bees.py query SENSOR ATTRIBUTE START [END] [--points N]
+    python bees.py assignments list|stamp [--sensor ID ...]
+    python bees.py topology check|show|store
+
+The module of a command is only imported when the command runs, so help
+and quick commands do not load SQLAlchemy, the models or the HTTP clients.
+"""
+
+import sys
+import argparse
+import importlib
+
+# command -> (module, arguments put in front, help)
+COMMANDS = {
+    "ingest": ("beehivemonitoring", [], "Fetch sensor history into the database"),
+    "backfill": ("backfill", [], "Fetch older history in resumable windows"),
+    "sync": ("beep", ["sync"], "Upload new history to BEEP"),
+    "setup": ("beep", ["setup"], "Create BEEP devices and sensor definitions"),
+    "migrate": ("migrate", [], "Recreate tables or create an Alembic migration"),
+    "partitions": ("partitions", [], "Create, detach or split history partitions"),
+    "rollups": ("rollups", [], "Rebuild history rollups"),
+    "layout": ("layout", [], "Show or convert the history storage layout"),
+    "query": ("query", [], "Export a downsampled series of a sensor"),
+    "assignments": ("assignments", [], "Show assignments or stamp hives on history"),
+    "topology": ("topology", [], "Check, show or store the topology"),
+}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="bees",
+        description="Beehive monitoring",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n"
+        + "\n".join(f"  {name:<12}{help}" for name, (_, _, help) in COMMANDS.items())
+        + "\n\nRun 'bees COMMAND --help' for the options of a command.",
+    )
+    parser.add_argument("command", choices=COMMANDS, metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    module, prefix, _ = COMMANDS[args.command]
+    return importlib.import_module(module).main(prefix + args.args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
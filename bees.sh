@@ -1,2 +1,2 @@
 #!/bin/bash
-"$(dirname "$0")"/.venv/bin/python "$(dirname "$0")"/beehivemonitoring.py
+"$(dirname "$0")"/.venv/bin/python "$(dirname "$0")"/bees.py ingest "$@"
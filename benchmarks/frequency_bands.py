@@ -0,0 +1,90 @@
+"""Benchmark of heart frequency band classification.
+
+Compares the linear scan over a dict of (lower, upper) tuples that
+``beep.sync_measurements`` used before with the compiled lookups in
+``beep_sensors``, over a synthetic month of heart readings. Run from the
+repository root:
+
+    python -m benchmarks.frequency_bands --hives 6
+"""
+
+import argparse
+import random
+import time
+import beep_sensors
+from beep_sensors import FREQUENCY_BANDS, FREQUENCY_MAX, frequency_band
+
+# The previous band table, as a dict of (lower, upper) tuples
+LEGACY_BANDS = {
+    (lower, upper): name
+    for (lower, name, _), upper in zip(
+        FREQUENCY_BANDS,
+        [lower for lower, _, _ in FREQUENCY_BANDS[1:]] + [FREQUENCY_MAX],
+    )
+}
+
+READINGS_PER_DAY = 1000
+
+
+def legacy_bands(frequencies):
+    """The previous per-reading linear scan, kept for comparison."""
+    bands = []
+    for frequency in frequencies:
+        band = None
+        for (lower, upper), name in LEGACY_BANDS.items():
+            if frequency and lower <= frequency < upper:
+                band = name
+                break
+        bands.append(band)
+    return bands
+
+
+def synthetic_month(hives, seed=0):
+    """Return a month of heart frequencies for ``hives`` hives, with gaps."""
+    rng = random.Random(seed)
+    return [
+        None if rng.random() < 0.05 else rng.uniform(80, 650)
+        for _ in range(hives * 30 * READINGS_PER_DAY)
+    ]
+
+
+def best_of(repeat, func, data):
+    """Return the fastest of ``repeat`` runs of ``func(data)`` in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hives", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    frequencies = synthetic_month(args.hives)
+    expected = legacy_bands(frequencies)
+    candidates = [
+        ("legacy linear scan", legacy_bands),
+        ("bisect per reading", lambda data: [frequency_band(f) for f in data]),
+    ]
+    if beep_sensors.np is not None:
+        candidates.append(("numpy searchsorted", beep_sensors.frequency_bands))
+    else:
+        print("numpy is not installed, skipping searchsorted")
+
+    legacy = None
+    for name, func in candidates:
+        assert func(frequencies) == expected, name
+        seconds = best_of(args.repeat, func, frequencies)
+        legacy = legacy or seconds
+        print(
+            f"{name:<20} {seconds * 1000:8.1f} ms  "
+            f"{len(frequencies) / seconds:12.0f} readings/s  x{legacy / seconds:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
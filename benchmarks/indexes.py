@@ -0,0 +1,245 @@
+"""EXPLAIN benchmark of the history indexes on the main read paths.
+
+Loads synthetic history of scale, heart and gateway readings into a
+scratch PostgreSQL database, then runs every read path with ``EXPLAIN
+(ANALYZE, BUFFERS)`` twice: with only the primary key, and with the
+indexes of ``models.History``. With ``--split`` the
+paths are run a third time against the split layout (see layout.py), and
+the database is converted back afterwards. The history table is truncated
+first. Run from the repository root:
+
+    python -m benchmarks.indexes --database-url postgresql://localhost/bees_bench \\
+        --sensors 6 --readings 100000 --split
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+# Modules reading settings are imported inside main(), once DATABASE_URL
+# and ROLLUPS_ENABLED are set
+
+# Readings per day of a real sensor
+SAMPLE_INTERVAL = 86.4
+
+SHAPE_ORDER = ["scale", "heart", "gateway"]
+
+
+def shaped_history(count, start_ms, seed):
+    """Return synthetic history cycling through the reading shapes.
+
+    Every reading only has the columns of its shape, like real readings of
+    one device.
+    """
+    from benchmarks.synthetic import generate_history
+    from models import READING_SHAPES
+
+    history = generate_history(count, start_ms, SAMPLE_INTERVAL, seed=seed)
+    for i, measurement in enumerate(history):
+        columns = READING_SHAPES[SHAPE_ORDER[i % len(SHAPE_ORDER)]][1]
+        for name in measurement:
+            if name != "time" and name not in columns:
+                measurement[name] = None
+    return history
+
+
+def load(session, sensor_ids, count):
+    """Replace history with ``count`` shaped readings per sensor."""
+    from sqlalchemy import text
+    from beehivemonitoring import upsert_history_readings
+    from normalizer import Normalizer
+
+    session.execute(text("TRUNCATE history"))
+    for sensor_id in sensor_ids:
+        session.execute(
+            text(
+                "INSERT INTO sensor (id, name) VALUES (:id, :name) "
+                "ON CONFLICT (id) DO NOTHING"
+            ),
+            {"id": sensor_id, "name": f"Benchmark sensor {sensor_id}"},
+        )
+    session.commit()
+
+    normalizer = Normalizer()
+    start = datetime.now(timezone.utc) - timedelta(seconds=count * SAMPLE_INTERVAL)
+    start_ms = int(start.timestamp() * 1000)
+    for seed, sensor_id in enumerate(sensor_ids):
+        history = shaped_history(count, start_ms, seed)
+        upsert_history_readings(session, normalizer.normalize(sensor_id, history))
+    return start
+
+
+def read_paths(sensor_id, start, count):
+    """Return name -> SQLAlchemy statement of every measured read path."""
+    from sqlalchemy import select
+    from models import History, READING_SHAPES, reading_shape_filter
+
+    table = History.__table__
+    # BEEP sync resumes near the end of the history
+    since = start + timedelta(seconds=count * SAMPLE_INTERVAL * 0.9)
+    day = start + timedelta(seconds=count * SAMPLE_INTERVAL / 2)
+
+    def shapes_query(*shapes):
+        names = ["time"]
+        for shape in shapes:
+            names += READING_SHAPES[shape][1]
+        return (
+            select(*(table.c[name] for name in dict.fromkeys(names)))
+            .where(
+                table.c.sensor_id == sensor_id,
+                table.c.time > since,
+                reading_shape_filter(*shapes),
+            )
+            .order_by(table.c.time)
+        )
+
+    return {
+        "beep scale device": shapes_query("scale"),
+        "beep heart device": shapes_query("heart"),
+        "beep hive (scale+heart)": shapes_query("scale", "heart"),
+        "gateway of a sensor": shapes_query("gateway"),
+        "one day, all sensors": select(
+            table.c.sensor_id, table.c.time, table.c.weight
+        ).where(table.c.time >= day, table.c.time < day + timedelta(days=1)),
+    }
+
+
+def explain(connection, stmt, repeat):
+    """Return (milliseconds, buffers, plan nodes) of the fastest run."""
+    from sqlalchemy.dialects import postgresql
+
+    compiled = stmt.compile(dialect=postgresql.dialect())
+    best = None
+    for _ in range(repeat):
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {compiled}", compiled.params
+        ).scalar()[0]
+        if best is None or plan["Execution Time"] < best["Execution Time"]:
+            best = plan
+    nodes = []
+    stack = [best["Plan"]]
+    while stack:
+        node = stack.pop()
+        if "Index Name" in node or "Relation Name" in node:
+            nodes.append(node["Node Type"])
+        stack += node.get("Plans", [])
+    root = best["Plan"]
+    buffers = root.get("Shared Hit Blocks", 0) + root.get("Shared Read Blocks", 0)
+    return best["Execution Time"], buffers, sorted(set(nodes))
+
+
+def relation_sizes(connection, names):
+    """Return name -> total size in bytes of (partitioned) tables or indexes."""
+    from sqlalchemy import text
+
+    return {
+        name: connection.execute(
+            text(
+                "SELECT coalesce(sum(pg_relation_size(relid)), 0) "
+                "FROM pg_partition_tree(CAST(:name AS regclass))"
+            ),
+            {"name": name},
+        ).scalar()
+        for name in names
+    }
+
+
+def row_widths(connection, names):
+    """Return name -> average stored row width in bytes of tables."""
+    from sqlalchemy import text
+
+    return {
+        name: connection.execute(
+            text(f"SELECT avg(pg_column_size(t.*)) FROM {name} t")
+        ).scalar()
+        for name in names
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--sensors", type=int, default=6)
+    parser.add_argument("--readings", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--split", action="store_true", help="also measure the split layout"
+    )
+    args = parser.parse_args()
+
+    os.environ.update(DATABASE_URL=args.database_url, ROLLUPS_ENABLED="false")
+    from database import get_engine, get_session, init_db
+    from models import History, SPLIT_MODELS
+    import layout
+
+    init_db()
+    engine = get_engine()
+    sensor_ids = list(range(900001, 900001 + args.sensors))
+    session = get_session()
+    began = time.perf_counter()
+    start = load(session, sensor_ids, args.readings)
+    session.close()
+    print(
+        f"Loaded {args.sensors} x {args.readings} readings in "
+        f"{time.perf_counter() - began:.1f}s"
+    )
+
+    indexes = sorted(History.__table__.indexes, key=lambda index: index.name)
+    paths = read_paths(sensor_ids[0], start, args.readings)
+    tables = [model.__tablename__ for model in SPLIT_MODELS.values()]
+    results = {}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as c:
+        for phase in ("before", "after"):
+            for index in indexes:
+                if phase == "before":
+                    index.drop(c, checkfirst=True)
+                else:
+                    index.create(c, checkfirst=True)
+            # Statistics and the visibility map, needed for index-only scans
+            c.exec_driver_sql("VACUUM ANALYZE history")
+            for name, stmt in paths.items():
+                results.setdefault(name, {})[phase] = explain(c, stmt, args.repeat)
+        sizes = relation_sizes(
+            c, ["history", "history_pkey", *(index.name for index in indexes)]
+        )
+        widths = row_widths(c, ["history"])
+
+        if args.split:
+            session = get_session()
+            layout.convert_to_split(session)
+            for name in tables:
+                c.exec_driver_sql(f"VACUUM ANALYZE {name}")
+            for name, stmt in paths.items():
+                results[name]["split"] = explain(c, stmt, args.repeat)
+            sizes.update(
+                relation_sizes(
+                    c,
+                    [
+                        name
+                        for table in tables
+                        for name in (table, f"{table}_pkey", f"ix_{table}_time_brin")
+                    ],
+                )
+            )
+            widths.update(row_widths(c, tables))
+            layout.convert_to_wide(session)
+            session.close()
+
+    for name, phases in results.items():
+        before = phases["before"][0]
+        print(
+            f"{name:<26} "
+            + "  ".join(
+                f"{phase} {ms:9.2f} ms {buffers:7} buf x{before / ms:5.1f}"
+                for phase, (ms, buffers, _) in phases.items()
+            )
+        )
+        print("    " + " -> ".join(", ".join(nodes) for _, _, nodes in phases.values()))
+    for name, size in sizes.items():
+        width = f"{widths[name]:7.0f} B/row" if name in widths else ""
+        print(f"{name:<34} {size / 1e6:9.1f} MB {width}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Micro-benchmark of history normalization.
+
+Compares the compiled ``normalizer.Normalizer`` with the per-key branching
+loop that ``beehivemonitoring.main`` used before, also including the
+tuples ``beehivemonitoring.history_values`` binds for the upsert. With ``--processes N``
+it also decodes and normalizes the readings as JSON responses of
+HISTORY_BATCH_SIZE readings from N threads, as the fetch workers do,
+in-process and through a ``NormalizerPool`` of N processes.
+Run from the repository root:
+
+    python -m benchmarks.normalizer --readings 20000 --processes 4
+"""
+
+import argparse
+import copy
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from settings import (
+    ATTRIBUTES,
+    ARRAY_ATTRIBUTES,
+    INTEGER_ATTRIBUTES,
+    HISTORY_BATCH_SIZE,
+)
+from normalizer import Normalizer, NormalizerPool
+from beehivemonitoring import history_values
+from benchmarks.synthetic import generate_history
+
+HISTORY_COLUMNS = ATTRIBUTES.split(";")
+
+
+def legacy_normalize(sensor_id, history_data):
+    """The previous per-key normalization loop, kept for comparison."""
+    readings = []
+    for measurement in history_data:
+        time = measurement.pop("time")
+
+        processed_data = dict.fromkeys(HISTORY_COLUMNS)
+        for k, v in measurement.items():
+            if k in ARRAY_ATTRIBUTES:
+                if isinstance(v, list):
+                    try:
+                        processed_data[k] = [int(x) for x in v]
+                    except (ValueError, TypeError):
+                        continue
+                elif v is not None:
+                    try:
+                        processed_data[k] = [int(v)]
+                    except (ValueError, TypeError):
+                        continue
+                else:
+                    processed_data[k] = None
+            elif k in INTEGER_ATTRIBUTES:
+                if v is not None:
+                    try:
+                        processed_data[k] = int(v)
+                    except (ValueError, TypeError):
+                        continue
+                else:
+                    processed_data[k] = None
+            else:
+                if v is not None:
+                    try:
+                        processed_data[k] = float(v)
+                    except (ValueError, TypeError):
+                        continue
+                else:
+                    processed_data[k] = None
+
+        processed_data["sensor_id"] = sensor_id
+        processed_data["time"] = datetime.fromtimestamp(time / 1000, tz=timezone.utc)
+        readings.append(processed_data)
+    return readings
+
+
+def best_of(repeat, func, make_input):
+    """Return the fastest of ``repeat`` runs of ``func`` in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        data = make_input()
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def parse_responses(pool, responses, threads):
+    """Parse JSON ``responses`` with ``pool`` from ``threads`` threads."""
+    with ThreadPoolExecutor(threads) as executor:
+        list(
+            executor.map(
+                lambda text: pool.parse(1, text, HISTORY_BATCH_SIZE), responses
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readings", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--null-ratio", type=float, default=0.3)
+    parser.add_argument("--processes", type=int, default=0)
+    args = parser.parse_args()
+
+    history = generate_history(args.readings, null_ratio=args.null_ratio)
+    normalizer = Normalizer()
+
+    # The legacy loop mutates its input, so every run gets a fresh copy
+    legacy = best_of(
+        args.repeat,
+        lambda data: legacy_normalize(1, data),
+        lambda: copy.deepcopy(history),
+    )
+    compiled = best_of(
+        args.repeat,
+        lambda data: history_values(normalizer.normalize(1, data)),
+        lambda: history,
+    )
+    columns_only = best_of(
+        args.repeat,
+        lambda data: normalizer.normalize(1, data),
+        lambda: history,
+    )
+
+    for name, seconds in (
+        ("legacy loop", legacy),
+        ("normalizer + tuples", compiled),
+        ("normalizer batch", columns_only),
+    ):
+        print(
+            f"{name:<22} {seconds * 1000:8.1f} ms  "
+            f"{args.readings / seconds:10.0f} readings/s  "
+            f"x{legacy / seconds:.2f}"
+        )
+
+    if args.processes > 1:
+        in_process = NormalizerPool()
+        pool = NormalizerPool(args.processes)
+        pool.start()
+        responses = [
+            json.dumps(history[i : i + HISTORY_BATCH_SIZE])
+            for i in range(0, len(history), HISTORY_BATCH_SIZE)
+        ]
+        # Warm up the workers, so process startup is not measured
+        parse_responses(pool, responses[: args.processes], args.processes)
+        timings = [
+            (
+                f"{args.processes} threads",
+                best_of(
+                    args.repeat,
+                    lambda data: parse_responses(in_process, data, args.processes),
+                    lambda: responses,
+                ),
+            ),
+            (
+                f"{args.processes} processes",
+                best_of(
+                    args.repeat,
+                    lambda data: parse_responses(pool, data, args.processes),
+                    lambda: responses,
+                ),
+            ),
+        ]
+        pool.shutdown()
+        for name, seconds in timings:
+            print(
+                f"{name:<22} {seconds * 1000:8.1f} ms  "
+                f"{args.readings / seconds:10.0f} readings/s  "
+                f"x{timings[0][1] / seconds:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
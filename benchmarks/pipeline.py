@@ -0,0 +1,219 @@
+"""End-to-end benchmark of ingest and BEEP sync against local stand-ins.
+
+For every size, synthetic history of that many readings per sensor is
+served by a beehivemonitoring stand-in, ingested with
+``beehivemonitoring.main`` and then uploaded to a BEEP stand-in with
+``beep.sync_measurements``. Readings alternate between scale and heart
+readings so both device types are synced.
+
+Needs a scratch PostgreSQL database: history, ingest state, rollups and
+BEEP sync cursors are truncated before every size. Run from the
+repository root:
+
+    python -m benchmarks.pipeline --database-url postgresql://localhost/bees_bench \\
+        --sizes 1000 10000 50000 --baseline benchmarks/results/previous.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+from benchmarks.standins import BeehiveStandIn, BeepStandIn
+
+# Modules reading settings are imported inside the functions: settings are
+# read on import, and the stand-in URLs are only known once they run
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Readings per day of a real sensor
+SAMPLE_INTERVAL = 86.4
+
+RESET_TABLES = [
+    "history",
+    "ingest_state",
+    "beep_sync_cursor",
+    "history_rollup_15m",
+    "history_rollup_1h",
+    "history_rollup_1d",
+]
+
+
+def mixed_history(count, start_ms, seed):
+    """Return synthetic history alternating between scale and heart readings."""
+    from benchmarks.synthetic import generate_history
+
+    history = generate_history(count, start_ms, SAMPLE_INTERVAL, seed=seed)
+    for i, measurement in enumerate(history):
+        if i % 2:
+            measurement["weight"] = None
+        else:
+            measurement["tempIn"] = None
+    return history
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(size, sensor_ids, beehive, beep_api, workers):
+    """Ingest and sync ``size`` readings per sensor; return the measurements."""
+    import beehivemonitoring
+    import beep
+    from database import get_engine
+    from ratelimit import TokenBucket
+    from sqlalchemy import text
+
+    engine = get_engine()
+    with engine.begin() as connection:
+        connection.execute(text(f"TRUNCATE {', '.join(RESET_TABLES)}"))
+
+    start = datetime.now(timezone.utc) - timedelta(seconds=size * SAMPLE_INTERVAL)
+    start_ms = int(start.timestamp() * 1000)
+    beehive.replay(
+        {
+            sensor_id: mixed_history(size, start_ms, seed)
+            for seed, sensor_id in enumerate(sensor_ids)
+        }
+    )
+    beep_api.last_time = start - timedelta(minutes=1)
+
+    requests_before = beehive.requests
+    began = time.perf_counter()
+    beehivemonitoring.main(["--workers", str(workers)])
+    ingest_seconds = time.perf_counter() - began
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text("SELECT count(*) FROM history WHERE sensor_id = ANY(:ids)"),
+            {"ids": list(sensor_ids)},
+        ).scalar()
+
+    beep.rate_limiter = TokenBucket(beep.RATE_LIMIT)
+    uploaded_before = beep_api.measurements
+    beep_requests_before = beep_api.requests
+    began = time.perf_counter()
+    beep.sync_measurements()
+    sync_seconds = time.perf_counter() - began
+    uploaded = beep_api.measurements - uploaded_before
+
+    return {
+        "size": size,
+        "ingest": {
+            "rows": rows,
+            "seconds": round(ingest_seconds, 3),
+            "rows_per_s": round(rows / ingest_seconds, 1),
+            "requests": beehive.requests - requests_before,
+        },
+        "beep": {
+            "readings": uploaded,
+            "seconds": round(sync_seconds, 3),
+            "readings_per_s": round(uploaded / sync_seconds, 1),
+            "requests": beep_api.requests - beep_requests_before,
+            "rate_limit_wait_s": round(beep.rate_limiter.waited, 3),
+        },
+    }
+
+
+def compare(results, baseline_path):
+    """Print the change of every throughput against a previous result file."""
+    with open(baseline_path) as f:
+        baseline = {entry["size"]: entry for entry in json.load(f)["results"]}
+    for entry in results:
+        previous = baseline.get(entry["size"])
+        if previous is None:
+            continue
+        for stage, metric in (("ingest", "rows_per_s"), ("beep", "readings_per_s")):
+            before, after = previous[stage][metric], entry[stage][metric]
+            change = (after / before - 1) * 100 if before else float("nan")
+            print(
+                f"{entry['size']:>8} {stage:<7} {before:12.1f} -> {after:12.1f} "
+                f"{metric}  {change:+6.1f}%"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--sensors", type=int, default=6)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--beep-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument(
+        "--beep-rate-limit", type=int, default=6000, help="requests per minute"
+    )
+    parser.add_argument("--output", help="result file, default in results/")
+    parser.add_argument("--baseline", help="previous result file to compare with")
+    args = parser.parse_args()
+
+    with BeehiveStandIn(args.latency) as beehive, BeepStandIn(
+        args.beep_rate_limit, args.beep_latency
+    ) as beep_api:
+        os.environ.update(
+            DATABASE_URL=args.database_url,
+            BEEHIVE_BASE_URL=beehive.url,
+            BEEP_BASE_URL=beep_api.url,
+            BEEP_RATE_LIMIT=str(args.beep_rate_limit),
+            BEEP_KEY_CACHE_TTL="0",
+        )
+        import beep
+        from database import init_db
+        from topology import get_topology
+        from settings import ARRAY_CODEC, HISTORY_BATCH_SIZE, ROLLUPS_ENABLED
+
+        logging.getLogger().setLevel(logging.WARNING)
+        init_db()
+        sensor_ids = list(get_topology().hive_map)[: args.sensors]
+        results = [
+            run_size(size, sensor_ids, beehive, beep_api, args.workers)
+            for size in args.sizes
+        ]
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {
+            "sensors": len(sensor_ids),
+            "workers": args.workers,
+            "latency": args.latency,
+            "beep_latency": args.beep_latency,
+            "beep_rate_limit": args.beep_rate_limit,
+            "beep_batch_size": beep.BATCH_SIZE,
+            "history_batch_size": HISTORY_BATCH_SIZE,
+            "rollups": ROLLUPS_ENABLED,
+            "array_codec": ARRAY_CODEC,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"pipeline-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for entry in results:
+        print(
+            f"{entry['size']:>8} readings/sensor  "
+            f"ingest {entry['ingest']['rows_per_s']:10.1f} rows/s  "
+            f"beep {entry['beep']['readings_per_s']:10.1f} readings/s"
+        )
+    print(f"Results written to {output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
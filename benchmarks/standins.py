@@ -0,0 +1,220 @@
+"""Local HTTP stand-ins for the beehivemonitoring and BEEP APIs.
+
+Both servers answer only the endpoints the pipeline uses, run in a
+background thread and can add a fixed latency to every request. The BEEP
+stand-in enforces a per-minute request limit and reports it with the same
+``X-RateLimit-*`` and ``Retry-After`` headers as the real API.
+"""
+
+import json
+import re
+import threading
+import time
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class StandIn(ThreadingHTTPServer):
+    """Threaded HTTP server on a free local port.
+
+    Attributes:
+        latency: seconds slept before answering a request
+        requests: number of requests answered
+    """
+
+    daemon_threads = True
+
+    def __init__(self, handler, latency=0.0):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Request handler with JSON helpers; subclasses implement route()."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        return json.loads(self.body or b"null")
+
+    def handle_request(self, method):
+        # Always consume the body so the connection can be kept alive
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = self.rfile.read(length)
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.route(method, url.path, query)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+
+class BeehiveHandler(Handler):
+    HISTORY = re.compile(r"^/api/hives/(\d+)/history$")
+
+    def route(self, method, path, query):
+        if method == "GET" and path == "/api/hives":
+            return self.send_json(200, self.server.sensors)
+        match = self.HISTORY.match(path)
+        if method == "GET" and match:
+            sensor_id = int(match.group(1))
+            if sensor_id not in self.server.history:
+                return self.send_json(404, {"message": "Not found"})
+            limit = int(query.get("limit", 1000))
+            since = int(query["from"]) if "from" in query else None
+            until = int(query["to"]) if "to" in query else None
+            return self.send_json(
+                200, self.server.history_payload(sensor_id, limit, since, until)
+            )
+        self.send_json(404, {"message": "Not found"})
+
+
+class BeehiveStandIn(StandIn):
+    """Replays /api/hives and /api/hives/{id}/history.
+
+    Args:
+        latency: seconds added to every request
+    """
+
+    def __init__(self, latency=0.0):
+        super().__init__(BeehiveHandler, latency)
+        self.replay({})
+
+    def replay(self, history):
+        """Serve ``history``, a dict of sensor ID to measurements newest first."""
+        with self.lock:
+            self.history = history
+            self.sensors = [
+                {"id": sensor_id, "name": f"Benchmark sensor {sensor_id}"}
+                for sensor_id in history
+            ]
+            self.payloads = {}
+
+    def history_payload(self, sensor_id, limit, since=None, until=None):
+        """Return the encoded response, cached so encoding is not measured.
+
+        ``since`` and ``until`` are the ``from`` and ``to`` parameters in
+        milliseconds, from inclusive and to exclusive.
+        """
+        key = (sensor_id, limit, since, until)
+        with self.lock:
+            if key not in self.payloads:
+                history = [
+                    m
+                    for m in self.history[sensor_id]
+                    if (since is None or m["time"] >= since)
+                    and (until is None or m["time"] < until)
+                ]
+                self.payloads[key] = json.dumps(history[:limit]).encode()
+            return self.payloads[key]
+
+
+class BeepHandler(Handler):
+    DEVICE = re.compile(r"^/api/devices/(\d+)$")
+
+    def route(self, method, path, query):
+        headers = self.server.take_token()
+        if headers.get("Retry-After"):
+            return self.send_json(429, {"message": "Too Many Attempts."}, headers)
+
+        match = self.DEVICE.match(path)
+        if method == "GET" and match:
+            device_id = int(match.group(1))
+            return self.send_json(
+                200, {"id": device_id, "key": f"key{device_id}"}, headers
+            )
+        if method == "GET" and path == "/api/sensors/lastvalues":
+            if self.server.last_time is None:
+                return self.send_json(404, {"message": "Not found"}, headers)
+            last_time = self.server.last_time.astimezone(timezone.utc)
+            return self.send_json(
+                200, {"time": last_time.strftime("%Y-%m-%dT%H:%M:%SZ")}, headers
+            )
+        if method == "POST" and path == "/api/sensors/multiple":
+            self.server.received(len(self.read_json()))
+            return self.send_json(200, {}, headers)
+        if method == "POST" and path == "/api/sensors":
+            self.server.received(1)
+            return self.send_json(200, {}, headers)
+        self.send_json(404, {"message": "Not found"}, headers)
+
+
+class BeepStandIn(StandIn):
+    """Accepts BEEP uploads and hands out device keys.
+
+    Args:
+        rate_limit: requests allowed per minute
+        latency: seconds added to every request
+
+    Attributes:
+        last_time: aware datetime reported by /api/sensors/lastvalues, or
+            None to report no measurements
+        measurements: number of measurements uploaded
+    """
+
+    def __init__(self, rate_limit=6000, latency=0.0):
+        super().__init__(BeepHandler, latency)
+        self.last_time = None
+        self.rate_limit = rate_limit
+        self.window = 0
+        self.used = 0
+        self.measurements = 0
+
+    def take_token(self):
+        """Count a request against the current minute and return the headers."""
+        now = time.time()
+        with self.lock:
+            window = int(now // 60)
+            if window != self.window:
+                self.window, self.used = window, 0
+            reset = (window + 1) * 60
+            headers = {"X-RateLimit-Limit": self.rate_limit}
+            if self.used >= self.rate_limit:
+                headers["X-RateLimit-Remaining"] = 0
+                headers["X-RateLimit-Reset"] = int(reset)
+                headers["Retry-After"] = max(int(reset - now), 1)
+                return headers
+            self.used += 1
+            headers["X-RateLimit-Remaining"] = self.rate_limit - self.used
+            return headers
+
+    def received(self, count):
+        with self.lock:
+            self.measurements += count
@@ -0,0 +1,75 @@
+"""Benchmark of interpreter startup and module import time.
+
+Runs every target in a fresh interpreter with ``-X importtime`` and
+reports the cumulative import time of its module and the wall time of the
+whole process, best of ``--repeat`` runs. Run from the repository root:
+
+    python -m benchmarks.startup --top 10
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+# name -> (code run with -c, module whose cumulative import time is reported)
+TARGETS = {
+    "bees --help": (
+        "import sys, bees; sys.argv[1:] = ['--help']; bees.main(sys.argv[1:])",
+        "bees",
+    ),
+    "import settings": ("import settings", "settings"),
+    "import database": ("import database", "database"),
+    "import models": ("import models", "models"),
+    "import beehivemonitoring": ("import beehivemonitoring", "beehivemonitoring"),
+    "import beep": ("import beep", "beep"),
+}
+
+# import time: self [us] | cumulative | imported package
+IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(code):
+    """Run ``code`` in a new interpreter, return (seconds, importtime lines)."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    seconds = time.perf_counter() - start
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match:
+            imports.append((int(match.group(2)), match.group(4)))
+    return seconds, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--top", type=int, default=0, help="also list the N slowest imports"
+    )
+    args = parser.parse_args()
+
+    for name, (code, module) in TARGETS.items():
+        runs = [run(code) for _ in range(args.repeat)]
+        seconds, imports = min(runs, key=lambda r: r[0])
+        cumulative = next((us for us, mod in imports if mod == module), 0)
+        print(
+            f"{name:<26} process {seconds * 1000:7.1f} ms  "
+            f"import {cumulative / 1000:7.1f} ms"
+        )
+        for us, mod in sorted(imports, reverse=True)[1 : args.top + 1]:
+            print(f"    {us / 1000:7.1f} ms  {mod}")
+
+
+if __name__ == "__main__":
+    main()
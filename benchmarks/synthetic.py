@@ -0,0 +1,37 @@
+"""Synthetic history payloads shaped like /api/hives/{id}/history responses."""
+
+import random
+from settings import ATTRIBUTES, ARRAY_ATTRIBUTES, INTEGER_ATTRIBUTES
+
+FFT_BINS = 32
+
+
+def generate_measurement(time_ms, rng, null_ratio=0.0):
+    """Return one measurement with a plausible value for every attribute."""
+    measurement = {"time": time_ms}
+    for attr in ATTRIBUTES.split(";"):
+        if rng.random() < null_ratio:
+            measurement[attr] = None
+        elif attr in ARRAY_ATTRIBUTES:
+            size = FFT_BINS if attr == "fft" else 24
+            measurement[attr] = [rng.randint(0, 4000) for _ in range(size)]
+        elif attr in INTEGER_ATTRIBUTES:
+            measurement[attr] = rng.randint(-120, 2000)
+        else:
+            measurement[attr] = round(rng.uniform(-10.0, 100.0), 2)
+    return measurement
+
+
+def generate_history(count, start_ms=1_700_000_000_000, interval_s=86.4, **kwargs):
+    """Return ``count`` measurements, newest first like ``reverse=true``.
+
+    Keyword arguments:
+        null_ratio: fraction of attribute values that are null
+        seed: seed of the random generator, for reproducible payloads
+    """
+    rng = random.Random(kwargs.pop("seed", 0))
+    step = int(interval_s * 1000)
+    return [
+        generate_measurement(start_ms + i * step, rng, **kwargs)
+        for i in reversed(range(count))
+    ]
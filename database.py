@@ -1,19 +1,39 @@
+import threading
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, scoped_session
-from models import Base
 from settings import DB_CONNECTION
 
-# Create SQLAlchemy engine for PostgreSQL
-engine = create_engine(DB_CONNECTION)
+# The engine is created on first use, so importing this module is cheap
+_engine = None
+_engine_lock = threading.Lock()
 
-# Create session factory
-session_factory = sessionmaker(bind=engine)
+# Create session factory, bound to the engine by get_engine()
+session_factory = sessionmaker()
 Session = scoped_session(session_factory)
 
 
+def get_engine():
+    """Return the SQLAlchemy engine for PostgreSQL, creating it on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(DB_CONNECTION)
+            session_factory.configure(bind=_engine)
+    return _engine
+
+
+def __getattr__(name):
+    # ``engine`` used to be a module attribute created on import
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def init_db():
     """Initialize the database, creating all tables."""
-    Base.metadata.create_all(engine)
+    from models import Base
+
+    Base.metadata.create_all(get_engine())
 
 
 def get_session():
@@ -22,9 +42,20 @@ def get_session():
     Returns:
         SQLAlchemy session object that should be closed after use
     """
+    get_engine()
     return Session()
 
 
+def new_session():
+    """Get a session independent of the one returned by get_session().
+
+    Returns:
+        SQLAlchemy session object that should be closed after use
+    """
+    get_engine()
+    return session_factory()
+
+
 def close_session():
     """Remove the current session."""
     Session.remove()
@@ -32,6 +63,9 @@ def close_session():
 
 def migrate():
     """Drop all tables and recreate them with the new schema."""
+    from models import Base
+
+    engine = get_engine()
     print("Dropping all tables...")
     # Drop all tables with cascade enabled
     Base.metadata.drop_all(engine, checkfirst=True)
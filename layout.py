@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Storage layout of the history table.
+
+The default ``wide`` layout keeps every reading in the partitioned
+``history`` table, with one nullable column per attribute. Each reading
+comes from one kind of device though, so most of its columns are NULL.
+The ``split`` layout stores every reading in the narrow table of its shape
+(scale, heart, gateway or environment, see ``models.SPLIT_SHAPES``) and
+replaces ``history`` with a view over those tables, so existing queries
+keep working. Values of attributes outside a reading's shape are kept in
+the ``extra`` JSONB column of its table.
+
+Usage:
+    python layout.py status           # Show the layout and table sizes
+    python layout.py split --without-retention  # Move history into the narrow tables
+    python layout.py wide             # Move it back into one table
+
+Converting rewrites all of history in one transaction; stop ingest and
+BEEP sync while it runs.
+
+The narrow tables are not partitioned, so ``partitions.py detach`` and
+``split-legacy`` cannot expire months of the split layout. ``split``
+therefore refuses to run unless ``--without-retention`` confirms that
+monthly retention is not needed; ``wide`` restores the partitioned table.
+"""
+
+import sys
+import argparse
+import logging
+from sqlalchemy import case, delete, func, literal_column, select, text, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert
+from settings import ATTRIBUTES, ARRAY_ATTRIBUTES, HISTORY_BATCH_SIZE
+from models import History, SPLIT_MODELS, SPLIT_SHAPES, reading_shape
+from arrays import PackedInts
+from database import get_session, close_session
+from partitions import ensure_history_partitions, forget_partitions
+
+HISTORY_COLUMNS = ATTRIBUTES.split(";")
+
+# Columns that are always NULL in readings of a shape, by the
+# classification of models.reading_shape(); the view selects them as NULL
+# so the planner can skip tables that cannot match a query
+EMPTY_COLUMNS = {
+    "scale": set(),
+    "heart": {"weight"},
+    "gateway": {"weight", "tempIn"},
+    "environment": {"weight", "tempIn"},
+}
+
+# Layout of the database, cached for the life of the process
+_layout = None
+
+
+def history_layout(session):
+    """Return ``split`` if history is the view over the narrow tables,
+    ``wide`` otherwise."""
+    global _layout
+    if _layout is None:
+        relkind = session.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass('history')")
+        ).scalar()
+        _layout = "split" if relkind == "v" else "wide"
+    return _layout
+
+
+def split_reading(reading):
+    """Return the shape of a reading and its row in the table of that shape.
+
+    Args:
+        reading: dict with ``sensor_id``, ``time`` and attribute values
+
+    Returns:
+        Tuple of (shape, dict of column values including ``extra``)
+    """
+    shape = reading_shape(reading)
+    columns = SPLIT_SHAPES[shape][0]
+    row = {
+        "sensor_id": reading["sensor_id"],
+        "time": reading["time"],
+        "hive_id": reading.get("hive_id"),
+    }
+    extra = {}
+    for name in HISTORY_COLUMNS:
+        value = reading.get(name)
+        if name in columns:
+            row[name] = value
+        elif value is not None:
+            extra[name] = value.tolist() if isinstance(value, PackedInts) else value
+    row["extra"] = extra or None
+    return shape, row
+
+
+def split_upsert_statement(shape):
+    """Build the INSERT ... ON CONFLICT statement of a shape's table.
+
+    Like the statement of the wide layout, NULL values leave stored values
+    untouched, ``extra`` is merged key by key and ``hive_id`` is replaced.
+    """
+    table = SPLIT_MODELS[shape].__table__
+    stmt = insert(table)
+    extra = case(
+        (stmt.excluded.extra.is_(None), table.c.extra),
+        else_=func.coalesce(table.c.extra, literal_column("'{}'::jsonb")).op("||")(
+            stmt.excluded.extra
+        ),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.sensor_id, table.c.time],
+        set_={
+            **{
+                name: func.coalesce(stmt.excluded[name], table.c[name])
+                for name in SPLIT_SHAPES[shape][0]
+            },
+            "hive_id": stmt.excluded.hive_id,
+            "extra": extra,
+        },
+    ).returning(literal_column("xmax = 0").label("inserted"))
+
+
+def split_row_reading(row):
+    """Return the reading of a row of a narrow table, reversing split_reading."""
+    reading = dict(row["extra"] or {})
+    reading.update((name, value) for name, value in row.items() if name != "extra")
+    return reading
+
+
+def take_moved_readings(session, readings):
+    """Merge in the stored rows of readings whose shape changed.
+
+    A reading is classified on its own values, so fetching it again can
+    change its shape, e.g. when its weight arrives later. Its stored row is
+    deleted from the table of the old shape and its values fill the NULL
+    values of the new reading, like the wide layout keeps stored values,
+    so every reading stays in exactly one table.
+
+    Returns:
+        List of the readings, merged with their moved rows
+    """
+    merged = {(reading["sensor_id"], reading["time"]): reading for reading in readings}
+    shapes = {key: reading_shape(reading) for key, reading in merged.items()}
+    for shape, model in SPLIT_MODELS.items():
+        keys = [key for key, new_shape in shapes.items() if new_shape != shape]
+        if not keys:
+            continue
+        table = model.__table__
+        moved = session.execute(
+            delete(table)
+            .where(tuple_(table.c.sensor_id, table.c.time).in_(keys))
+            .returning(*table.c)
+        ).mappings()
+        for row in moved:
+            key = (row["sensor_id"], row["time"])
+            stored = split_row_reading(row)
+            reading = dict(merged[key])
+            for name in HISTORY_COLUMNS:
+                if reading.get(name) is None:
+                    reading[name] = stored.get(name)
+            merged[key] = reading
+    return list(merged.values())
+
+
+def upsert_split_readings(session, readings, batch_size=HISTORY_BATCH_SIZE):
+    """Update or insert readings into the tables of their shapes.
+
+    The caller commits. A reading whose shape changed since it was stored
+    is moved to the table of its new shape, see take_moved_readings().
+
+    Args:
+        session: SQLAlchemy session
+        readings: list of dicts, unique per ``(sensor_id, time)``
+        batch_size: number of rows sent per statement
+
+    Returns:
+        Tuple of (inserted, updated) row counts; moved readings count as
+        inserted
+    """
+    inserted = updated = 0
+    for start in range(0, len(readings), batch_size):
+        rows = {}
+        for reading in take_moved_readings(
+            session, readings[start : start + batch_size]
+        ):
+            shape, row = split_reading(reading)
+            rows.setdefault(shape, []).append(row)
+        for shape, shape_rows in rows.items():
+            result = session.execute(split_upsert_statement(shape), shape_rows)
+            for (was_inserted,) in result:
+                if was_inserted:
+                    inserted += 1
+                else:
+                    updated += 1
+    return inserted, updated
+
+
+def view_sql():
+    """Return the CREATE VIEW statement of history in the split layout."""
+    dialect = postgresql.dialect()
+    selects = []
+    for shape, model in SPLIT_MODELS.items():
+        columns = SPLIT_SHAPES[shape][0]
+        expressions = ["sensor_id", '"time"']
+        for name in HISTORY_COLUMNS:
+            sql_type = History.__table__.c[name].type.compile(dialect=dialect)
+            if name in columns:
+                expression = f'"{name}"'
+            elif name in EMPTY_COLUMNS[shape] or name in ARRAY_ATTRIBUTES:
+                # Arrays in extra are JSON lists, not packed; they are only
+                # visible in the narrow table
+                expression = f"CAST(NULL AS {sql_type})"
+            else:
+                expression = f"CAST(extra ->> '{name}' AS {sql_type})"
+            expressions.append(f'{expression} AS "{name}"')
+        # Last, so that a migration can add it with CREATE OR REPLACE VIEW
+        expressions.append("hive_id")
+        selects.append(f"SELECT {', '.join(expressions)} FROM {model.__tablename__}")
+    return "CREATE VIEW history AS\n" + "\nUNION ALL\n".join(selects)
+
+
+def iter_batches(session, table, batch_size):
+    """Yield all rows of ``table`` in primary key order, batch by batch."""
+    last = None
+    while True:
+        stmt = select(table).order_by(table.c.sensor_id, table.c.time)
+        if last is not None:
+            stmt = stmt.where(tuple_(table.c.sensor_id, table.c.time) > last)
+        rows = session.execute(stmt.limit(batch_size)).mappings().all()
+        if not rows:
+            return
+        yield rows
+        last = (rows[-1]["sensor_id"], rows[-1]["time"])
+
+
+def convert_to_split(session, batch_size=HISTORY_BATCH_SIZE):
+    """Move history into the narrow tables and replace it with the view.
+
+    Returns:
+        dict of shape -> number of readings moved
+    """
+    global _layout
+    counts = {shape: 0 for shape in SPLIT_MODELS}
+    for model in SPLIT_MODELS.values():
+        model.__table__.create(session.connection(), checkfirst=True)
+        if session.query(model).first() is not None:
+            raise RuntimeError(f"{model.__tablename__} is not empty")
+
+    for rows in iter_batches(session, History.__table__, batch_size):
+        by_shape = {}
+        for reading in rows:
+            shape, row = split_reading(reading)
+            by_shape.setdefault(shape, []).append(row)
+        for shape, shape_rows in by_shape.items():
+            session.execute(insert(SPLIT_MODELS[shape].__table__), shape_rows)
+            counts[shape] += len(shape_rows)
+        logging.info(f"Moved readings up to sensor {rows[-1]['sensor_id']}")
+
+    session.execute(text("DROP TABLE history"))
+    session.execute(text(view_sql()))
+    session.commit()
+    _layout = "split"
+    forget_partitions()
+    return counts
+
+
+def convert_to_wide(session, batch_size=HISTORY_BATCH_SIZE):
+    """Replace the view with the partitioned history table and move the
+    readings of the narrow tables into it.
+
+    Returns:
+        dict of shape -> number of readings moved
+    """
+    # Imported here, beehivemonitoring imports this module
+    from beehivemonitoring import UPSERT_COLUMNS, upsert_history_values
+
+    global _layout
+    session.execute(text("DROP VIEW history"))
+    History.__table__.create(session.connection())
+    forget_partitions()
+    counts = {shape: 0 for shape in SPLIT_MODELS}
+    for shape, model in SPLIT_MODELS.items():
+        for rows in iter_batches(session, model.__table__, batch_size):
+            values = []
+            for row in rows:
+                reading = split_row_reading(row)
+                values.append(tuple(reading.get(name) for name in UPSERT_COLUMNS))
+            ensure_history_partitions(
+                session,
+                min(row["time"] for row in rows),
+                max(row["time"] for row in rows),
+            )
+            upsert_history_values(session, values, batch_size)
+            counts[shape] += len(values)
+        session.execute(text(f"TRUNCATE {model.__tablename__}"))
+
+    session.commit()
+    _layout = "wide"
+    return counts
+
+
+def status(session):
+    """Print the layout and the estimated rows and size of its tables."""
+    layout = history_layout(session)
+    print(f"history layout: {layout}")
+    tables = (
+        [model.__tablename__ for model in SPLIT_MODELS.values()]
+        if layout == "split"
+        else ["history"]
+    )
+    for name in tables:
+        rows, size = session.execute(
+            text(
+                "SELECT coalesce(sum(c.reltuples), 0)::bigint, "
+                "coalesce(sum(pg_total_relation_size(t.relid)), 0) "
+                "FROM pg_partition_tree(CAST(:name AS regclass)) t "
+                "JOIN pg_class c ON c.oid = t.relid"
+            ),
+            {"name": name},
+        ).one()
+        print(f"{name:<22} ~{max(rows, 0):>12} rows {size / 1e6:10.1f} MB")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Manage the history layout")
+    parser.add_argument("action", choices=["status", "split", "wide"])
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=HISTORY_BATCH_SIZE,
+        help="Readings moved per statement",
+    )
+    parser.add_argument(
+        "--without-retention",
+        action="store_true",
+        help="Convert to split although its tables cannot expire old months",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    session = get_session()
+    try:
+        if args.action == "status":
+            status(session)
+            return 0
+        layout = history_layout(session)
+        if layout == args.action:
+            print(f"history is already {layout}")
+            return 0
+        if args.action == "split" and not args.without_retention:
+            print(
+                "The split tables are not partitioned, so old months can no "
+                "longer be detached; pass --without-retention to convert anyway",
+                file=sys.stderr,
+            )
+            return 1
+        convert = convert_to_split if args.action == "split" else convert_to_wide
+        counts = convert(session, args.batch_size)
+        print(
+            f"history is now {args.action}: "
+            + ", ".join(f"{count} {shape}" for shape, count in counts.items())
+        )
+        status(session)
+        return 0
+    finally:
+        close_session()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
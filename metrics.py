@@ -0,0 +1,253 @@
+"""Per-stage run metrics in the Prometheus text exposition format.
+
+Counters and timings are collected in a process-wide registry, labelled by
+job (``ingest`` or ``beep``), stage and sensor or device. They can be
+written to a file for the node_exporter textfile collector, served over
+HTTP in daemon mode and condensed into a summary line at the end of a run.
+"""
+
+import os
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from settings import METRICS_TEXTFILE_DIR
+
+PREFIX = "bees_"
+
+# name -> (type, help); summaries are exported as _sum and _count
+DEFINITIONS = {
+    "http_request_seconds": ("summary", "Time until the API responded"),
+    "http_response_bytes_total": ("counter", "Bytes received from the API"),
+    "rows_parsed_total": ("counter", "History readings parsed"),
+    "values_rejected_total": ("counter", "Attribute values that failed to convert"),
+    "normalize_seconds": ("summary", "Time spent normalizing readings"),
+    "db_read_seconds": ("summary", "Time spent reading history"),
+    "db_write_seconds": ("summary", "Time spent writing history"),
+    "rows_inserted_total": ("counter", "History rows inserted"),
+    "rows_updated_total": ("counter", "History rows updated"),
+    "readings_uploaded_total": ("counter", "Readings uploaded to BEEP"),
+    "readings_failed_total": ("counter", "Readings rejected by BEEP"),
+    "rate_limit_sleep_seconds_total": (
+        "counter",
+        "Seconds slept for the rate limit and retries",
+    ),
+    "run_duration_seconds": ("gauge", "Duration of the last run"),
+    "last_run_timestamp_seconds": ("gauge", "End of the last run"),
+}
+
+
+def format_labels(labels):
+    """Render labels as ``{a="1",b="2"}``, escaping values."""
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and summaries.
+
+    Samples accumulate over the life of the process, as Prometheus
+    expects; summary() only covers the current run.
+
+    Attributes:
+        job: value of the ``job`` label of every sample
+        started: time.time() of the start of the current run
+    """
+
+    def __init__(self, job=None):
+        self.job = job
+        self.lock = threading.Lock()
+        self.values = {}
+        self.baseline = {}
+        self.started = time.time()
+
+    def _key(self, name, labels):
+        if name not in DEFINITIONS:
+            raise KeyError(f"Unknown metric {name}")
+        labels = {"job": self.job, **labels} if self.job else labels
+        return name, tuple(sorted((k, v) for k, v in labels.items() if v is not None))
+
+    def inc(self, name, value=1, **labels):
+        """Add ``value`` to a counter."""
+        key = self._key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge."""
+        key = self._key(name, labels)
+        with self.lock:
+            self.values[key] = value
+
+    def observe(self, name, seconds, **labels):
+        """Record one duration of a summary."""
+        key = self._key(name, labels)
+        with self.lock:
+            total, count = self.values.get(key, (0.0, 0))
+            self.values[key] = (total + seconds, count + 1)
+
+    def timed(self, iterable, name, **labels):
+        """Yield from ``iterable``, observing the time spent in each step."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.observe(name, time.perf_counter() - start, **labels)
+            yield item
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the ``with`` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def finish_run(self):
+        """Record the run duration and start the next run."""
+        now = time.time()
+        self.set("run_duration_seconds", now - self.started)
+        self.set("last_run_timestamp_seconds", now)
+        with self.lock:
+            self.baseline = dict(self.values)
+        self.started = now
+
+    def render(self):
+        """Return all samples in the Prometheus text exposition format."""
+        with self.lock:
+            values = dict(self.values)
+        lines = []
+        for name, (kind, help) in DEFINITIONS.items():
+            samples = sorted(
+                (labels, value) for (n, labels), value in values.items() if n == name
+            )
+            if not samples:
+                continue
+            lines.append(f"# HELP {PREFIX}{name} {help}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            for labels, value in samples:
+                if kind == "summary":
+                    total, count = value
+                    lines.append(f"{PREFIX}{name}_sum{format_labels(labels)} {total}")
+                    lines.append(f"{PREFIX}{name}_count{format_labels(labels)} {count}")
+                else:
+                    lines.append(f"{PREFIX}{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def total(self, name, **labels):
+        """Return a metric of the current run, summed over all label sets
+        matching ``labels``.
+
+        Summaries return the tuple ``(seconds, count)``.
+        """
+        wanted = set(labels.items())
+        summary = DEFINITIONS[name][0] == "summary"
+        zero = (0.0, 0) if summary else 0
+        seconds = count = 0
+        with self.lock:
+            for key, value in self.values.items():
+                if key[0] != name or not wanted <= set(key[1]):
+                    continue
+                before = self.baseline.get(key, zero)
+                if summary:
+                    seconds += value[0] - before[0]
+                    count += value[1] - before[1]
+                else:
+                    seconds += value - before
+        return (seconds, count) if summary else seconds
+
+    def summary(self):
+        """Return a one-line overview of the run, for logs and cron mail."""
+        http_seconds, requests = self.total("http_request_seconds")
+        parts = [
+            f"{self.job or 'run'} in {time.time() - self.started:.1f}s",
+            f"http {requests} requests {http_seconds:.1f}s "
+            f"{self.total('http_response_bytes_total') / 1e6:.1f}MB",
+        ]
+        if self.total("rows_parsed_total"):
+            parts.append(
+                f"parsed {self.total('rows_parsed_total')} rows "
+                f"({self.total('values_rejected_total')} values rejected) "
+                f"in {self.total('normalize_seconds')[0]:.1f}s"
+            )
+        read_seconds, reads = self.total("db_read_seconds")
+        if reads:
+            parts.append(f"db read {read_seconds:.1f}s")
+        write_seconds, writes = self.total("db_write_seconds")
+        if writes:
+            parts.append(
+                f"db write {write_seconds:.1f}s "
+                f"{self.total('rows_inserted_total')} inserted "
+                f"{self.total('rows_updated_total')} updated"
+            )
+        if self.total("readings_uploaded_total") or self.total("readings_failed_total"):
+            parts.append(
+                f"uploaded {self.total('readings_uploaded_total')} "
+                f"failed {self.total('readings_failed_total')}"
+            )
+        parts.append(
+            f"rate limit slept {self.total('rate_limit_sleep_seconds_total'):.1f}s"
+        )
+        return ", ".join(parts)
+
+    def write_textfile(self, directory):
+        """Atomically write ``<directory>/bees_<job>.prom``."""
+        path = os.path.join(directory, f"bees_{self.job or 'run'}.prom")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def serve(self, port, host=""):
+        """Serve /metrics from a background thread and return the server."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# Registry shared by the whole process; scripts set metrics.job on start
+metrics = Metrics()
+
+
+def end_run():
+    """Finish a run of the shared registry and return its summary line.
+
+    Writes the textfile when METRICS_TEXTFILE_DIR is set.
+    """
+    line = metrics.summary()
+    metrics.finish_run()
+    if METRICS_TEXTFILE_DIR:
+        try:
+            metrics.write_textfile(METRICS_TEXTFILE_DIR)
+        except OSError as e:
+            logging.warning(f"Could not write metrics: {e}")
+    return line
@@ -13,19 +13,20 @@ Usage:
 
 import sys
 import subprocess
-from database import migrate as quick_migrate
 
 
-def main():
-    if len(sys.argv) != 2:
+def main(argv):
+    if len(argv) != 1:
         print("Usage: python migrate.py [quick|alembic]")
         print("  quick   - Drop and recreate all tables (loses data)")
         print("  alembic - Use Alembic for proper migrations (preserves data)")
         sys.exit(1)
 
-    method = sys.argv[1].lower()
+    method = argv[0].lower()
 
     if method == "quick":
+        from database import migrate as quick_migrate
+
         print("Running quick migration (drops and recreates all tables)...")
         quick_migrate()
         print("Quick migration completed!")
@@ -51,4 +52,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
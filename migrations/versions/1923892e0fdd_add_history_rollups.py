@@ -0,0 +1,49 @@
+"""Add history rollups
+
+Revision ID: 1923892e0fdd
+Revises: 27a30ca38bdc
+Create Date: 2026-10-18 19:50:49.931403
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1923892e0fdd'
+down_revision: Union[str, Sequence[str], None] = '27a30ca38bdc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+ROLLUP_TABLES = ['history_rollup_15m', 'history_rollup_1h', 'history_rollup_1d']
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    The tables start empty; fill them with 'python rollups.py rebuild'.
+    """
+    for table in ROLLUP_TABLES:
+        op.create_table(
+            table,
+            sa.Column('attribute', sa.Text(), nullable=False),
+            sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('min', sa.Float(), nullable=True),
+            sa.Column('max', sa.Float(), nullable=True),
+            sa.Column('avg', sa.Float(), nullable=True),
+            sa.Column('last', sa.Float(), nullable=True),
+            sa.Column('last_time', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('sensor_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['sensor_id'], ['sensor.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('sensor_id', 'attribute', 'bucket'),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in reversed(ROLLUP_TABLES):
+        op.drop_table(table)
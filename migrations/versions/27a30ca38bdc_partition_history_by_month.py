@@ -0,0 +1,105 @@
+"""Partition history by month
+
+Revision ID: 27a30ca38bdc
+Revises: d96d71157f4a
+Create Date: 2026-10-18 19:49:10.631131
+
+"""
+from typing import Sequence, Union
+
+from datetime import datetime, timezone
+
+from alembic import context, op
+import sqlalchemy as sa
+
+from partitions import (
+    LEGACY_PARTITION,
+    MONTHS_AHEAD,
+    add_months,
+    month_start,
+    partition_name,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = '27a30ca38bdc'
+down_revision: Union[str, Sequence[str], None] = 'd96d71157f4a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    The existing table becomes the partition for everything before next
+    month, so no rows are copied. Its time range is validated first, outside
+    the main transaction: VALIDATE scans the table without blocking writes,
+    and the valid CHECK lets ATTACH PARTITION skip its own scan, so the
+    exclusive lock is only held for catalog changes.
+    """
+    if not context.is_offline_mode():
+        relkind = op.get_bind().execute(
+            sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass('history')")
+        ).scalar()
+        if relkind != 'r':
+            # Already partitioned, e.g. created by init_db()
+            return
+
+    boundary = add_months(month_start(datetime.now(timezone.utc)), 1)
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            'ALTER TABLE history ADD CONSTRAINT history_legacy_range '
+            f"CHECK (\"time\" IS NOT NULL AND \"time\" < '{boundary.isoformat()}') "
+            'NOT VALID'
+        )
+        op.execute('ALTER TABLE history VALIDATE CONSTRAINT history_legacy_range')
+
+    op.execute(f'ALTER TABLE history RENAME TO {LEGACY_PARTITION}')
+    op.execute(f'ALTER INDEX history_pkey RENAME TO {LEGACY_PARTITION}_pkey')
+    op.execute(
+        f'CREATE TABLE history (LIKE {LEGACY_PARTITION} INCLUDING DEFAULTS) '
+        'PARTITION BY RANGE ("time")'
+    )
+    op.execute(
+        'ALTER TABLE history ADD CONSTRAINT history_pkey '
+        'PRIMARY KEY (sensor_id, "time")'
+    )
+    op.execute(
+        'ALTER TABLE history ADD CONSTRAINT history_sensor_id_fkey '
+        'FOREIGN KEY (sensor_id) REFERENCES sensor (id) ON DELETE CASCADE'
+    )
+    op.execute(
+        f'ALTER TABLE history ATTACH PARTITION {LEGACY_PARTITION} '
+        f"FOR VALUES FROM (MINVALUE) TO ('{boundary.isoformat()}')"
+    )
+    op.execute(f'ALTER TABLE {LEGACY_PARTITION} DROP CONSTRAINT history_legacy_range')
+
+    month = boundary
+    for _ in range(MONTHS_AHEAD):
+        op.execute(
+            f'CREATE TABLE {partition_name(month)} PARTITION OF history '
+            f"FOR VALUES FROM ('{month.isoformat()}') "
+            f"TO ('{add_months(month, 1).isoformat()}')"
+        )
+        month = add_months(month, 1)
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Copies all rows back into a plain table, which locks history for the
+    duration of the copy.
+    """
+    op.execute('CREATE TABLE history_unpartitioned (LIKE history INCLUDING DEFAULTS)')
+    op.execute('INSERT INTO history_unpartitioned SELECT * FROM history')
+    op.execute('DROP TABLE history')
+    op.execute('ALTER TABLE history_unpartitioned RENAME TO history')
+    op.execute(
+        'ALTER TABLE history ADD CONSTRAINT history_pkey '
+        'PRIMARY KEY (sensor_id, "time")'
+    )
+    op.execute(
+        'ALTER TABLE history ADD CONSTRAINT history_sensor_id_fkey '
+        'FOREIGN KEY (sensor_id) REFERENCES sensor (id) ON DELETE CASCADE'
+    )
@@ -0,0 +1,112 @@
+"""Add history indexes
+
+Revision ID: 28f6031495ea
+Revises: 5f7690f14831
+Create Date: 2026-10-18 20:10:49.917542
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '28f6031495ea'
+down_revision: Union[str, Sequence[str], None] = '5f7690f14831'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# name -> definition after "ON <table>", see History.__table_args__
+INDEXES = {
+    'ix_history_time_brin': 'USING brin ("time")',
+}
+
+
+def partition_index(partition, name):
+    """Return the name of the index of ``partition`` attached to ``name``."""
+    return f'{partition}_{name[len("ix_history_"):]}'
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    A partitioned table cannot build an index concurrently, so every index
+    is created invalid on the parent alone, built with CREATE INDEX
+    CONCURRENTLY on each partition without blocking ingest, and attached;
+    the parent index becomes valid once all partitions are attached.
+    Partitions created afterwards get the indexes from the parent.
+
+    Running the migration again after an interrupted build drops the
+    invalid leftovers and continues. In offline mode the partitions are
+    unknown and the indexes are built on the parent, which locks history
+    against writes for the duration.
+    """
+    if context.is_offline_mode():
+        for name, definition in INDEXES.items():
+            op.execute(f'CREATE INDEX {name} ON history {definition}')
+        return
+
+    bind = op.get_bind()
+    partitions = bind.execute(
+        sa.text(
+            'SELECT inhrelid::regclass::text FROM pg_inherits '
+            "WHERE inhparent = 'history'::regclass ORDER BY 1"
+        )
+    ).scalars().all()
+    invalid = set(
+        bind.execute(
+            sa.text(
+                'SELECT c.relname FROM pg_index i '
+                'JOIN pg_class c ON c.oid = i.indexrelid '
+                'WHERE NOT i.indisvalid '
+                'AND i.indrelid = ANY(CAST(:tables AS regclass[]))'
+            ),
+            {'tables': partitions},
+        ).scalars()
+    )
+
+    for name, definition in INDEXES.items():
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON ONLY history {definition}')
+    # (parent index, partition) pairs that are done, e.g. on a database
+    # created by init_db()
+    attached = set(
+        bind.execute(
+            sa.text(
+                'SELECT h.inhparent::regclass::text, i.indrelid::regclass::text '
+                'FROM pg_inherits h JOIN pg_index i ON i.indexrelid = h.inhrelid '
+                'WHERE h.inhparent = ANY(CAST(:parents AS regclass[]))'
+            ),
+            {'parents': list(INDEXES)},
+        ).tuples()
+    )
+
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            for name, definition in INDEXES.items():
+                if (name, partition) in attached:
+                    continue
+                index = partition_index(partition, name)
+                if index in invalid:
+                    op.execute(f'DROP INDEX CONCURRENTLY {index}')
+                op.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} '
+                    f'ON {partition} {definition}'
+                )
+    for partition in partitions:
+        for name in INDEXES:
+            if (name, partition) not in attached:
+                op.execute(
+                    f'ALTER INDEX {name} '
+                    f'ATTACH PARTITION {partition_index(partition, name)}'
+                )
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Dropping a partitioned index also drops the attached partition
+    indexes; it cannot be done concurrently.
+    """
+    for name in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
@@ -0,0 +1,34 @@
+"""Add BEEP sync cursor
+
+Revision ID: 3668d99c21a8
+Revises: 1923892e0fdd
+Create Date: 2026-10-18 19:52:10.853002
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3668d99c21a8'
+down_revision: Union[str, Sequence[str], None] = '1923892e0fdd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'beep_sync_cursor',
+        sa.Column('device_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('last_time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('device_id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('beep_sync_cursor')
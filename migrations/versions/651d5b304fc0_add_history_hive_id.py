@@ -0,0 +1,237 @@
+"""Add history hive_id
+
+Revision ID: 651d5b304fc0
+Revises: f5d45c335bc9
+Create Date: 2026-10-18 20:19:39.562704
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '651d5b304fc0'
+down_revision: Union[str, Sequence[str], None] = 'f5d45c335bc9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SPLIT_TABLES = ['history_scale', 'history_heart', 'history_gateway', 'history_environment']
+
+# Definition after "ON <table>", see History.__table_args__
+INDEX = '(hive_id, "time") WHERE hive_id IS NOT NULL'
+
+# Columns of the history view per split table, frozen from layout.view_sql()
+# at this revision; upgrade() appends hive_id
+VIEW_COLUMNS = {
+    'history_scale': """
+        sensor_id, "time", "weight" AS "weight", "pressure" AS "pressure", CAST(extra
+        ->> 'pressureGw' AS FLOAT) AS "pressureGw", CAST(extra ->> 'pressureEnv' AS
+        FLOAT) AS "pressureEnv", CAST(NULL AS BYTEA) AS "inCounts", CAST(NULL AS BYTEA)
+        AS "outCounts", CAST(extra ->> 'inTotal' AS INTEGER) AS "inTotal", CAST(extra
+        ->> 'outTotal' AS INTEGER) AS "outTotal", CAST(extra ->> 'magX' AS FLOAT) AS
+        "magX", CAST(extra ->> 'magY' AS FLOAT) AS "magY", CAST(extra ->> 'magZ' AS
+        FLOAT) AS "magZ", CAST(extra ->> 'accX' AS FLOAT) AS "accX", CAST(extra ->>
+        'accY' AS FLOAT) AS "accY", CAST(extra ->> 'accZ' AS FLOAT) AS "accZ",
+        CAST(extra ->> 'tempIn' AS FLOAT) AS "tempIn", "tempOut" AS "tempOut",
+        CAST(extra ->> 'tempEnv' AS FLOAT) AS "tempEnv", CAST(extra ->> 'humidityIn' AS
+        FLOAT) AS "humidityIn", "humidityOut" AS "humidityOut", CAST(extra ->>
+        'humidityEnv' AS FLOAT) AS "humidityEnv", CAST(extra ->> 'humiditySh1' AS FLOAT)
+        AS "humiditySh1", CAST(extra ->> 'humiditySh2' AS FLOAT) AS "humiditySh2",
+        CAST(extra ->> 'humiditySh3' AS FLOAT) AS "humiditySh3", CAST(extra ->>
+        'frequency' AS FLOAT) AS "frequency", CAST(extra ->> 'amplitude' AS FLOAT) AS
+        "amplitude", CAST(extra ->> 'vbatIn' AS FLOAT) AS "vbatIn", "vbatOut" AS
+        "vbatOut", CAST(extra ->> 'vbatEnv' AS FLOAT) AS "vbatEnv", CAST(extra ->>
+        'vbatGw' AS FLOAT) AS "vbatGw", CAST(extra ->> 'vbatMap' AS FLOAT) AS "vbatMap",
+        CAST(extra ->> 'rssiIn' AS INTEGER) AS "rssiIn", "rssiOut" AS "rssiOut",
+        CAST(extra ->> 'rssiEnv' AS FLOAT) AS "rssiEnv", CAST(extra ->> 'rssiGw' AS
+        INTEGER) AS "rssiGw", CAST(extra ->> 'rssiMap' AS FLOAT) AS "rssiMap",
+        CAST(extra ->> 'co2' AS FLOAT) AS "co2", CAST(extra ->> 'tvoc' AS FLOAT) AS
+        "tvoc", CAST(extra ->> 'co' AS FLOAT) AS "co", CAST(extra ->> 'o2' AS FLOAT) AS
+        "o2", CAST(extra ->> 'o3' AS FLOAT) AS "o3", CAST(extra ->> 'so' AS FLOAT) AS
+        "so", CAST(extra ->> 'no' AS FLOAT) AS "no", CAST(extra ->> 'so2' AS FLOAT) AS
+        "so2", CAST(extra ->> 'pm25' AS FLOAT) AS "pm25", CAST(extra ->> 'pm10' AS
+        FLOAT) AS "pm10", CAST(extra ->> 'fftPeak' AS INTEGER) AS "fftPeak", CAST(NULL
+        AS BYTEA) AS "fft"
+    """,
+    'history_heart': """
+        sensor_id, "time", CAST(NULL AS FLOAT) AS "weight", CAST(extra ->> 'pressure' AS
+        FLOAT) AS "pressure", CAST(extra ->> 'pressureGw' AS FLOAT) AS "pressureGw",
+        CAST(extra ->> 'pressureEnv' AS FLOAT) AS "pressureEnv", CAST(NULL AS BYTEA) AS
+        "inCounts", CAST(NULL AS BYTEA) AS "outCounts", CAST(extra ->> 'inTotal' AS
+        INTEGER) AS "inTotal", CAST(extra ->> 'outTotal' AS INTEGER) AS "outTotal",
+        CAST(extra ->> 'magX' AS FLOAT) AS "magX", CAST(extra ->> 'magY' AS FLOAT) AS
+        "magY", CAST(extra ->> 'magZ' AS FLOAT) AS "magZ", CAST(extra ->> 'accX' AS
+        FLOAT) AS "accX", CAST(extra ->> 'accY' AS FLOAT) AS "accY", CAST(extra ->>
+        'accZ' AS FLOAT) AS "accZ", "tempIn" AS "tempIn", CAST(extra ->> 'tempOut' AS
+        FLOAT) AS "tempOut", CAST(extra ->> 'tempEnv' AS FLOAT) AS "tempEnv",
+        "humidityIn" AS "humidityIn", CAST(extra ->> 'humidityOut' AS FLOAT) AS
+        "humidityOut", CAST(extra ->> 'humidityEnv' AS FLOAT) AS "humidityEnv",
+        CAST(extra ->> 'humiditySh1' AS FLOAT) AS "humiditySh1", CAST(extra ->>
+        'humiditySh2' AS FLOAT) AS "humiditySh2", CAST(extra ->> 'humiditySh3' AS FLOAT)
+        AS "humiditySh3", "frequency" AS "frequency", "amplitude" AS "amplitude",
+        "vbatIn" AS "vbatIn", CAST(extra ->> 'vbatOut' AS FLOAT) AS "vbatOut",
+        CAST(extra ->> 'vbatEnv' AS FLOAT) AS "vbatEnv", CAST(extra ->> 'vbatGw' AS
+        FLOAT) AS "vbatGw", CAST(extra ->> 'vbatMap' AS FLOAT) AS "vbatMap", "rssiIn" AS
+        "rssiIn", CAST(extra ->> 'rssiOut' AS INTEGER) AS "rssiOut", CAST(extra ->>
+        'rssiEnv' AS FLOAT) AS "rssiEnv", CAST(extra ->> 'rssiGw' AS INTEGER) AS
+        "rssiGw", CAST(extra ->> 'rssiMap' AS FLOAT) AS "rssiMap", CAST(extra ->> 'co2'
+        AS FLOAT) AS "co2", CAST(extra ->> 'tvoc' AS FLOAT) AS "tvoc", CAST(extra ->>
+        'co' AS FLOAT) AS "co", CAST(extra ->> 'o2' AS FLOAT) AS "o2", CAST(extra ->>
+        'o3' AS FLOAT) AS "o3", CAST(extra ->> 'so' AS FLOAT) AS "so", CAST(extra ->>
+        'no' AS FLOAT) AS "no", CAST(extra ->> 'so2' AS FLOAT) AS "so2", CAST(extra ->>
+        'pm25' AS FLOAT) AS "pm25", CAST(extra ->> 'pm10' AS FLOAT) AS "pm10", "fftPeak"
+        AS "fftPeak", "fft" AS "fft"
+    """,
+    'history_gateway': """
+        sensor_id, "time", CAST(NULL AS FLOAT) AS "weight", CAST(extra ->> 'pressure' AS
+        FLOAT) AS "pressure", "pressureGw" AS "pressureGw", CAST(extra ->> 'pressureEnv'
+        AS FLOAT) AS "pressureEnv", CAST(NULL AS BYTEA) AS "inCounts", CAST(NULL AS
+        BYTEA) AS "outCounts", CAST(extra ->> 'inTotal' AS INTEGER) AS "inTotal",
+        CAST(extra ->> 'outTotal' AS INTEGER) AS "outTotal", CAST(extra ->> 'magX' AS
+        FLOAT) AS "magX", CAST(extra ->> 'magY' AS FLOAT) AS "magY", CAST(extra ->>
+        'magZ' AS FLOAT) AS "magZ", CAST(extra ->> 'accX' AS FLOAT) AS "accX",
+        CAST(extra ->> 'accY' AS FLOAT) AS "accY", CAST(extra ->> 'accZ' AS FLOAT) AS
+        "accZ", CAST(NULL AS FLOAT) AS "tempIn", CAST(extra ->> 'tempOut' AS FLOAT) AS
+        "tempOut", CAST(extra ->> 'tempEnv' AS FLOAT) AS "tempEnv", CAST(extra ->>
+        'humidityIn' AS FLOAT) AS "humidityIn", CAST(extra ->> 'humidityOut' AS FLOAT)
+        AS "humidityOut", CAST(extra ->> 'humidityEnv' AS FLOAT) AS "humidityEnv",
+        CAST(extra ->> 'humiditySh1' AS FLOAT) AS "humiditySh1", CAST(extra ->>
+        'humiditySh2' AS FLOAT) AS "humiditySh2", CAST(extra ->> 'humiditySh3' AS FLOAT)
+        AS "humiditySh3", CAST(extra ->> 'frequency' AS FLOAT) AS "frequency",
+        CAST(extra ->> 'amplitude' AS FLOAT) AS "amplitude", CAST(extra ->> 'vbatIn' AS
+        FLOAT) AS "vbatIn", CAST(extra ->> 'vbatOut' AS FLOAT) AS "vbatOut", CAST(extra
+        ->> 'vbatEnv' AS FLOAT) AS "vbatEnv", "vbatGw" AS "vbatGw", CAST(extra ->>
+        'vbatMap' AS FLOAT) AS "vbatMap", CAST(extra ->> 'rssiIn' AS INTEGER) AS
+        "rssiIn", CAST(extra ->> 'rssiOut' AS INTEGER) AS "rssiOut", CAST(extra ->>
+        'rssiEnv' AS FLOAT) AS "rssiEnv", "rssiGw" AS "rssiGw", CAST(extra ->> 'rssiMap'
+        AS FLOAT) AS "rssiMap", CAST(extra ->> 'co2' AS FLOAT) AS "co2", CAST(extra ->>
+        'tvoc' AS FLOAT) AS "tvoc", CAST(extra ->> 'co' AS FLOAT) AS "co", CAST(extra
+        ->> 'o2' AS FLOAT) AS "o2", CAST(extra ->> 'o3' AS FLOAT) AS "o3", CAST(extra
+        ->> 'so' AS FLOAT) AS "so", CAST(extra ->> 'no' AS FLOAT) AS "no", CAST(extra
+        ->> 'so2' AS FLOAT) AS "so2", CAST(extra ->> 'pm25' AS FLOAT) AS "pm25",
+        CAST(extra ->> 'pm10' AS FLOAT) AS "pm10", CAST(extra ->> 'fftPeak' AS INTEGER)
+        AS "fftPeak", CAST(NULL AS BYTEA) AS "fft"
+    """,
+    'history_environment': """
+        sensor_id, "time", CAST(NULL AS FLOAT) AS "weight", CAST(extra ->> 'pressure' AS
+        FLOAT) AS "pressure", CAST(extra ->> 'pressureGw' AS FLOAT) AS "pressureGw",
+        "pressureEnv" AS "pressureEnv", "inCounts" AS "inCounts", "outCounts" AS
+        "outCounts", "inTotal" AS "inTotal", "outTotal" AS "outTotal", "magX" AS "magX",
+        "magY" AS "magY", "magZ" AS "magZ", "accX" AS "accX", "accY" AS "accY", "accZ"
+        AS "accZ", CAST(NULL AS FLOAT) AS "tempIn", CAST(extra ->> 'tempOut' AS FLOAT)
+        AS "tempOut", "tempEnv" AS "tempEnv", CAST(extra ->> 'humidityIn' AS FLOAT) AS
+        "humidityIn", CAST(extra ->> 'humidityOut' AS FLOAT) AS "humidityOut",
+        "humidityEnv" AS "humidityEnv", "humiditySh1" AS "humiditySh1", "humiditySh2" AS
+        "humiditySh2", "humiditySh3" AS "humiditySh3", CAST(extra ->> 'frequency' AS
+        FLOAT) AS "frequency", CAST(extra ->> 'amplitude' AS FLOAT) AS "amplitude",
+        CAST(extra ->> 'vbatIn' AS FLOAT) AS "vbatIn", CAST(extra ->> 'vbatOut' AS
+        FLOAT) AS "vbatOut", "vbatEnv" AS "vbatEnv", CAST(extra ->> 'vbatGw' AS FLOAT)
+        AS "vbatGw", "vbatMap" AS "vbatMap", CAST(extra ->> 'rssiIn' AS INTEGER) AS
+        "rssiIn", CAST(extra ->> 'rssiOut' AS INTEGER) AS "rssiOut", "rssiEnv" AS
+        "rssiEnv", CAST(extra ->> 'rssiGw' AS INTEGER) AS "rssiGw", "rssiMap" AS
+        "rssiMap", "co2" AS "co2", "tvoc" AS "tvoc", "co" AS "co", "o2" AS "o2", "o3" AS
+        "o3", "so" AS "so", "no" AS "no", "so2" AS "so2", "pm25" AS "pm25", "pm10" AS
+        "pm10", CAST(extra ->> 'fftPeak' AS INTEGER) AS "fftPeak", CAST(NULL AS BYTEA)
+        AS "fft"
+    """,
+}
+
+
+def view_sql(hive_id):
+    """Return the statement creating the history view of the split layout."""
+    selects = []
+    for table, columns in VIEW_COLUMNS.items():
+        columns = columns.strip()
+        if hive_id:
+            columns += ', hive_id'
+        selects.append(f'SELECT {columns} FROM {table}')
+    return 'CREATE OR REPLACE VIEW history AS\n' + '\nUNION ALL\n'.join(selects)
+
+
+def history_relkind(bind):
+    return bind.execute(
+        sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass('history')")
+    ).scalar()
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    Adds the column to history and the split tables. In the split layout
+    the history view is replaced with the frozen definition of this
+    revision, which appends the column. The partial per-hive index
+    is built like the indexes of 28f6031495ea: invalid on the partitioned
+    parent, concurrently on every partition, then attached; running the
+    migration again after an interruption continues. Existing rows keep a
+    NULL hive_id until ``assignments.py stamp`` runs.
+    """
+    for table in SPLIT_TABLES:
+        op.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS hive_id integer')
+    if context.is_offline_mode():
+        op.execute('ALTER TABLE history ADD COLUMN hive_id integer')
+        op.execute(f'CREATE INDEX ix_history_hive ON history {INDEX}')
+        for table in SPLIT_TABLES:
+            op.execute(f'CREATE INDEX ix_{table}_hive ON {table} {INDEX}')
+        return
+
+    bind = op.get_bind()
+    partitions = []
+    if history_relkind(bind) == 'v':
+        op.execute(view_sql(hive_id=True))
+    else:
+        op.execute('ALTER TABLE history ADD COLUMN IF NOT EXISTS hive_id integer')
+        op.execute(f'CREATE INDEX IF NOT EXISTS ix_history_hive ON ONLY history {INDEX}')
+        partitions = bind.execute(
+            sa.text(
+                'SELECT inhrelid::regclass::text FROM pg_inherits '
+                "WHERE inhparent = 'history'::regclass ORDER BY 1"
+            )
+        ).scalars().all()
+    # Partitions whose index is done, e.g. on a database created by init_db()
+    attached = set(
+        bind.execute(
+            sa.text(
+                'SELECT i.indrelid::regclass::text '
+                'FROM pg_inherits h JOIN pg_index i ON i.indexrelid = h.inhrelid '
+                "WHERE h.inhparent = to_regclass('ix_history_hive')"
+            )
+        ).scalars()
+    )
+    pending = [p for p in partitions if p not in attached]
+    indexes = {f'ix_{table}_hive': table for table in SPLIT_TABLES}
+    indexes.update({f'{partition}_hive': partition for partition in pending})
+    invalid = set(
+        bind.execute(
+            sa.text(
+                'SELECT c.relname FROM pg_index i '
+                'JOIN pg_class c ON c.oid = i.indexrelid '
+                'WHERE NOT i.indisvalid AND c.relname = ANY(:names)'
+            ),
+            {'names': list(indexes)},
+        ).scalars()
+    )
+
+    with op.get_context().autocommit_block():
+        for index, table in indexes.items():
+            if index in invalid:
+                op.execute(f'DROP INDEX CONCURRENTLY {index}')
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} {INDEX}')
+    for partition in pending:
+        op.execute(f'ALTER INDEX ix_history_hive ATTACH PARTITION {partition}_hive')
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Dropping the columns drops their indexes. A view cannot lose a column
+    in place, so in the split layout history is recreated without it.
+    """
+    if not context.is_offline_mode() and history_relkind(op.get_bind()) == 'v':
+        op.execute('DROP VIEW history')
+        op.execute(view_sql(hive_id=False))
+    else:
+        op.execute('ALTER TABLE history DROP COLUMN hive_id')
+    for table in SPLIT_TABLES:
+        op.execute(f'ALTER TABLE {table} DROP COLUMN hive_id')
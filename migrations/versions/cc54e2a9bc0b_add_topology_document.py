@@ -0,0 +1,35 @@
+"""Add topology document
+
+Revision ID: cc54e2a9bc0b
+Revises: 651d5b304fc0
+Create Date: 2026-10-18 20:22:22.101076
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cc54e2a9bc0b'
+down_revision: Union[str, Sequence[str], None] = '651d5b304fc0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'topology_document',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('document', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('topology_document')
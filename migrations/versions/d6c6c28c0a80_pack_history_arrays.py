@@ -0,0 +1,120 @@
+"""Pack history arrays
+
+Revision ID: d6c6c28c0a80
+Revises: 3668d99c21a8
+Create Date: 2026-10-18 20:14:31.207194
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+from arrays import pack_int_array, unpack_int_array
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6c6c28c0a80'
+down_revision: Union[str, Sequence[str], None] = '3668d99c21a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ['inCounts', 'outCounts', 'fft']
+
+# Rows converted per transaction
+BATCH_SIZE = 5000
+
+
+def convert(suffix, new_type, encode):
+    """Copy every array column into its ``suffix`` replacement, batch by batch.
+
+    Runs inside an autocommit block: the SELECT and the single UPDATE of
+    every batch commit on their own, so no lock is held across batches.
+    Rows are walked in primary key order, so each batch is one index range
+    scan and memory use is bounded by BATCH_SIZE. Rows whose replacement
+    columns are already set are skipped, which lets an interrupted run
+    resume where it stopped.
+    """
+    bind = op.get_bind()
+    old = [f'"{column}"' for column in COLUMNS]
+    new = [f'"{column}{suffix}"' for column in COLUMNS]
+    select = sa.text(
+        f'SELECT sensor_id, time, {", ".join(old)} FROM history '
+        'WHERE (sensor_id, time) > (:sensor_id, :time) '
+        f'AND COALESCE({", ".join(old)}) IS NOT NULL '
+        f'AND COALESCE({", ".join(new)}) IS NULL '
+        'ORDER BY sensor_id, time LIMIT :limit'
+    )
+    sensor_id, time = -1, '-infinity'
+    while True:
+        rows = bind.execute(
+            select, {'sensor_id': sensor_id, 'time': time, 'limit': BATCH_SIZE}
+        ).all()
+        if not rows:
+            break
+        values = []
+        params = {}
+        for j, row in enumerate(rows):
+            params[f's{j}'], params[f't{j}'] = row[0], row[1]
+            casts = []
+            for i, value in enumerate(row[2:]):
+                params[f'c{j}_{i}'] = None if value is None else encode(value)
+                casts.append(f'CAST(:c{j}_{i} AS {new_type})')
+            values.append(f'(:s{j}, :t{j}, {", ".join(casts)})')
+        bind.execute(
+            sa.text(
+                'UPDATE history AS h SET '
+                + ', '.join(f'{name} = v.c{i}' for i, name in enumerate(new))
+                + f' FROM (VALUES {", ".join(values)}) AS v(sensor_id, time, '
+                + ', '.join(f'c{i}' for i in range(len(new)))
+                + ') WHERE h.sensor_id = v.sensor_id AND h.time = v.time'
+            ),
+            params,
+        )
+        sensor_id, time = rows[-1][0], rows[-1][1]
+
+
+def replace_columns(suffix, new_type, encode):
+    """Replace the array columns by columns of ``new_type``.
+
+    The replacements are added next to the old columns, filled batch by
+    batch outside the migration's transaction, and swapped in at the end.
+    Only the final swap, which drops and renames columns without touching
+    any rows, takes the ACCESS EXCLUSIVE lock on history, so readers keep
+    working while rows are converted. Writers must be stopped: rows they
+    write during the conversion keep NULL arrays.
+    """
+    for column in COLUMNS:
+        op.execute(
+            'ALTER TABLE history '
+            f'ADD COLUMN IF NOT EXISTS "{column}{suffix}" {new_type}'
+        )
+    with op.get_context().autocommit_block():
+        convert(suffix, new_type, encode)
+    for column in COLUMNS:
+        op.drop_column('history', column)
+        op.alter_column('history', f'{column}{suffix}', new_column_name=column)
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    Replaces the integer[] columns with bytea holding packed little-endian
+    integers, see replace_columns(). Every row with arrays is rewritten
+    once; run VACUUM (or pg_repack) on the history partitions afterwards to
+    return the space.
+    """
+    if context.is_offline_mode():
+        raise RuntimeError('packing history arrays needs a database connection')
+
+    replace_columns('_packed', 'bytea', pack_int_array)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if context.is_offline_mode():
+        raise RuntimeError('unpacking history arrays needs a database connection')
+
+    replace_columns(
+        '_unpacked', 'integer[]', lambda value: unpack_int_array(value).tolist()
+    )
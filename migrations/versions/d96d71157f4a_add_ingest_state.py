@@ -0,0 +1,36 @@
+"""Add ingest state
+
+Revision ID: d96d71157f4a
+Revises: 8791c1f72cbf
+Create Date: 2026-10-18 19:40:11.006416
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd96d71157f4a'
+down_revision: Union[str, Sequence[str], None] = '8791c1f72cbf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'ingest_state',
+        sa.Column('sensor_id', sa.Integer(), nullable=False),
+        sa.Column('last_time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('sample_interval', sa.Float(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['sensor_id'], ['sensor.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('sensor_id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('ingest_state')
@@ -0,0 +1,142 @@
+"""Add split history tables
+
+Revision ID: f5d45c335bc9
+Revises: 28f6031495ea
+Create Date: 2026-10-18 20:15:08.973623
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5d45c335bc9'
+down_revision: Union[str, Sequence[str], None] = '28f6031495ea'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    The tables stay empty until ``layout.py split`` moves history into
+    them; the wide layout remains the default.
+    """
+    op.create_table(
+        'history_scale',
+        sa.Column('sensor_id', sa.Integer(), nullable=False),
+        sa.Column('time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('weight', sa.Float(), nullable=True),
+        sa.Column('tempOut', sa.Float(), nullable=True),
+        sa.Column('humidityOut', sa.Float(), nullable=True),
+        sa.Column('vbatOut', sa.Float(), nullable=True),
+        sa.Column('rssiOut', sa.Integer(), nullable=True),
+        sa.Column('pressure', sa.Float(), nullable=True),
+        sa.Column('extra', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.CheckConstraint('"weight" IS NOT NULL', name='history_scale_shape'),
+        sa.ForeignKeyConstraint(['sensor_id'], ['sensor.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('sensor_id', 'time'),
+    )
+    op.create_index(
+        'ix_history_scale_time_brin', 'history_scale', ['time'], postgresql_using='brin'
+    )
+    op.create_table(
+        'history_heart',
+        sa.Column('sensor_id', sa.Integer(), nullable=False),
+        sa.Column('time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('tempIn', sa.Float(), nullable=True),
+        sa.Column('humidityIn', sa.Float(), nullable=True),
+        sa.Column('vbatIn', sa.Float(), nullable=True),
+        sa.Column('rssiIn', sa.Integer(), nullable=True),
+        sa.Column('frequency', sa.Float(), nullable=True),
+        sa.Column('amplitude', sa.Float(), nullable=True),
+        sa.Column('fftPeak', sa.Integer(), nullable=True),
+        sa.Column('fft', sa.LargeBinary(), nullable=True),
+        sa.Column('extra', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.CheckConstraint('"tempIn" IS NOT NULL', name='history_heart_shape'),
+        sa.ForeignKeyConstraint(['sensor_id'], ['sensor.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('sensor_id', 'time'),
+    )
+    op.create_index(
+        'ix_history_heart_time_brin', 'history_heart', ['time'], postgresql_using='brin'
+    )
+    op.create_table(
+        'history_gateway',
+        sa.Column('sensor_id', sa.Integer(), nullable=False),
+        sa.Column('time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('rssiGw', sa.Integer(), nullable=True),
+        sa.Column('pressureGw', sa.Float(), nullable=True),
+        sa.Column('vbatGw', sa.Float(), nullable=True),
+        sa.Column('extra', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.CheckConstraint(
+            '"rssiGw" IS NOT NULL AND "pressureGw" IS NOT NULL',
+            name='history_gateway_shape',
+        ),
+        sa.ForeignKeyConstraint(['sensor_id'], ['sensor.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('sensor_id', 'time'),
+    )
+    op.create_index(
+        'ix_history_gateway_time_brin',
+        'history_gateway',
+        ['time'],
+        postgresql_using='brin',
+    )
+    op.create_table(
+        'history_environment',
+        sa.Column('sensor_id', sa.Integer(), nullable=False),
+        sa.Column('time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('pressureEnv', sa.Float(), nullable=True),
+        sa.Column('inCounts', sa.LargeBinary(), nullable=True),
+        sa.Column('outCounts', sa.LargeBinary(), nullable=True),
+        sa.Column('inTotal', sa.Integer(), nullable=True),
+        sa.Column('outTotal', sa.Integer(), nullable=True),
+        sa.Column('magX', sa.Float(), nullable=True),
+        sa.Column('magY', sa.Float(), nullable=True),
+        sa.Column('magZ', sa.Float(), nullable=True),
+        sa.Column('accX', sa.Float(), nullable=True),
+        sa.Column('accY', sa.Float(), nullable=True),
+        sa.Column('accZ', sa.Float(), nullable=True),
+        sa.Column('tempEnv', sa.Float(), nullable=True),
+        sa.Column('humidityEnv', sa.Float(), nullable=True),
+        sa.Column('humiditySh1', sa.Float(), nullable=True),
+        sa.Column('humiditySh2', sa.Float(), nullable=True),
+        sa.Column('humiditySh3', sa.Float(), nullable=True),
+        sa.Column('vbatEnv', sa.Float(), nullable=True),
+        sa.Column('vbatMap', sa.Float(), nullable=True),
+        sa.Column('rssiEnv', sa.Float(), nullable=True),
+        sa.Column('rssiMap', sa.Float(), nullable=True),
+        sa.Column('co2', sa.Float(), nullable=True),
+        sa.Column('tvoc', sa.Float(), nullable=True),
+        sa.Column('co', sa.Float(), nullable=True),
+        sa.Column('o2', sa.Float(), nullable=True),
+        sa.Column('o3', sa.Float(), nullable=True),
+        sa.Column('so', sa.Float(), nullable=True),
+        sa.Column('no', sa.Float(), nullable=True),
+        sa.Column('so2', sa.Float(), nullable=True),
+        sa.Column('pm25', sa.Float(), nullable=True),
+        sa.Column('pm10', sa.Float(), nullable=True),
+        sa.Column('extra', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.ForeignKeyConstraint(['sensor_id'], ['sensor.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('sensor_id', 'time'),
+    )
+    op.create_index(
+        'ix_history_environment_time_brin',
+        'history_environment',
+        ['time'],
+        postgresql_using='brin',
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Fails while history is the view over these tables; run
+    ``layout.py wide`` first.
+    """
+    op.drop_table('history_environment')
+    op.drop_table('history_gateway')
+    op.drop_table('history_heart')
+    op.drop_table('history_scale')
@@ -1,12 +1,116 @@
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey, Text, ARRAY, JSON
+from sqlalchemy import (
+    CheckConstraint,
+    Column,
+    Integer,
+    Float,
+    DateTime,
+    ForeignKey,
+    Index,
+    Text,
+    ARRAY,
+    JSON,
+    PrimaryKeyConstraint,
+    or_,
+    text,
+)
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import declared_attr, relationship
+from arrays import PackedIntArray
 from settings import ATTRIBUTES, ARRAY_ATTRIBUTES, INTEGER_ATTRIBUTES
 
 Base = declarative_base()
 
+# Shapes of history readings, one per kind of device: an SQL predicate
+# telling them apart and the columns read for them. The shapes are mutually
+# exclusive.
+READING_SHAPES = {
+    "scale": (
+        '"weight" IS NOT NULL',
+        ["weight", "tempOut", "humidityOut", "vbatOut", "rssiOut", "pressure"],
+    ),
+    "heart": (
+        '"weight" IS NULL AND "tempIn" IS NOT NULL',
+        ["tempIn", "humidityIn", "vbatIn", "rssiIn", "frequency"],
+    ),
+    "gateway": (
+        '"weight" IS NULL AND "tempIn" IS NULL '
+        'AND "rssiGw" IS NOT NULL AND "pressureGw" IS NOT NULL',
+        ["rssiGw", "pressureGw", "vbatGw"],
+    ),
+}
+
+
+def reading_shape_filter(*shapes):
+    """Return an SQL condition matching readings of any of ``shapes``."""
+    return or_(*(text(f"({READING_SHAPES[shape][0]})") for shape in shapes))
+
+
+def reading_shape(reading):
+    """Return the shape of a reading, a dict of column values.
+
+    Same classification as READING_SHAPES; readings of none of those
+    shapes come from the environment sensors.
+    """
+    if reading.get("weight") is not None:
+        return "scale"
+    if reading.get("tempIn") is not None:
+        return "heart"
+    if reading.get("rssiGw") is not None and reading.get("pressureGw") is not None:
+        return "gateway"
+    return "environment"
+
+
+# Narrow tables of the split history layout, see layout.py: per reading
+# shape, its columns and a CHECK the classification guarantees. Values of
+# other attributes are kept in the ``extra`` JSONB column.
+_SPLIT_SHAPES = {
+    "scale": (
+        ["weight", "tempOut", "humidityOut", "vbatOut", "rssiOut", "pressure"],
+        '"weight" IS NOT NULL',
+    ),
+    "heart": (
+        [
+            "tempIn",
+            "humidityIn",
+            "vbatIn",
+            "rssiIn",
+            "frequency",
+            "amplitude",
+            "fftPeak",
+            "fft",
+        ],
+        '"tempIn" IS NOT NULL',
+    ),
+    "gateway": (
+        ["rssiGw", "pressureGw", "vbatGw"],
+        '"rssiGw" IS NOT NULL AND "pressureGw" IS NOT NULL',
+    ),
+}
+SPLIT_SHAPES = {
+    **_SPLIT_SHAPES,
+    # Everything else: pressure, climate, air quality, bee counter, motion
+    "environment": (
+        [
+            attr
+            for attr in ATTRIBUTES.split(";")
+            if not any(attr in columns for columns, _ in _SPLIT_SHAPES.values())
+        ],
+        None,
+    ),
+}
+
+
+def history_column(attr):
+    """Return the column storing the history attribute ``attr``."""
+    if attr in ARRAY_ATTRIBUTES:
+        # Packed little-endian integers, see arrays.py
+        return Column(PackedIntArray)
+    if attr in INTEGER_ATTRIBUTES:
+        return Column(Integer)
+    return Column(Float)
+
 
 class Apiary(Base):
     __tablename__ = "apiary"
@@ -61,21 +165,181 @@ class SensorAssignment(Base):
 
 class History(Base):
     __tablename__ = "history"
+    __table_args__ = (
+        # Small index for time range scans across all sensors
+        Index("ix_history_time_brin", "time", postgresql_using="brin"),
+        # Per-hive queries, see assignments.py
+        Index(
+            "ix_history_hive",
+            "hive_id",
+            "time",
+            postgresql_where=text("hive_id IS NOT NULL"),
+        ),
+        # Monthly partitions are created on demand, see partitions.py
+        {"postgresql_partition_by": "RANGE (time)"},
+    )
 
     sensor_id = Column(
         Integer, ForeignKey("sensor.id", ondelete="CASCADE"), primary_key=True
     )
     time = Column(DateTime(timezone=True), primary_key=True)
+    # Hive the sensor was on at ``time``, stamped at ingest from the sensor
+    # assignments; not a foreign key, to keep inserts free of lookups
+    hive_id = Column(Integer)
     sensor = relationship("Sensor", back_populates="history")
 
     # Dynamically create columns from ATTRIBUTES
     for attr in ATTRIBUTES.split(";"):
-        if attr in ARRAY_ATTRIBUTES:
-            locals()[attr] = Column(ARRAY(Integer))
-        elif attr in INTEGER_ATTRIBUTES:
-            locals()[attr] = Column(Integer)
-        else:
-            locals()[attr] = Column(Float)
+        locals()[attr] = history_column(attr)
+
+
+class SplitHistoryMixin:
+    """Readings of one shape in the split history layout, see layout.py.
+
+    Subclasses set ``shape`` and create the columns of SPLIT_SHAPES.
+    """
+
+    @declared_attr
+    def __table_args__(cls):
+        name = cls.__tablename__
+        check = SPLIT_SHAPES[cls.shape][1]
+        return (
+            PrimaryKeyConstraint("sensor_id", "time"),
+            Index(f"ix_{name}_time_brin", "time", postgresql_using="brin"),
+            Index(
+                f"ix_{name}_hive",
+                "hive_id",
+                "time",
+                postgresql_where=text("hive_id IS NOT NULL"),
+            ),
+            *([CheckConstraint(check, name=f"{name}_shape")] if check else []),
+        )
+
+    @declared_attr
+    def sensor_id(cls):
+        return Column(Integer, ForeignKey("sensor.id", ondelete="CASCADE"))
+
+    time = Column(DateTime(timezone=True))
+    hive_id = Column(Integer)
+    # Values of attributes without a column in this table
+    extra = Column(JSONB)
+
+
+class HistoryScale(SplitHistoryMixin, Base):
+    __tablename__ = "history_scale"
+    shape = "scale"
+    for attr in SPLIT_SHAPES[shape][0]:
+        locals()[attr] = history_column(attr)
+
+
+class HistoryHeart(SplitHistoryMixin, Base):
+    __tablename__ = "history_heart"
+    shape = "heart"
+    for attr in SPLIT_SHAPES[shape][0]:
+        locals()[attr] = history_column(attr)
+
+
+class HistoryGateway(SplitHistoryMixin, Base):
+    __tablename__ = "history_gateway"
+    shape = "gateway"
+    for attr in SPLIT_SHAPES[shape][0]:
+        locals()[attr] = history_column(attr)
+
+
+class HistoryEnvironment(SplitHistoryMixin, Base):
+    __tablename__ = "history_environment"
+    shape = "environment"
+    for attr in SPLIT_SHAPES[shape][0]:
+        locals()[attr] = history_column(attr)
+
+
+# shape -> model of its table in the split layout
+SPLIT_MODELS = {
+    model.shape: model
+    for model in (HistoryScale, HistoryHeart, HistoryGateway, HistoryEnvironment)
+}
+
+
+class IngestState(Base):
+    """Per-sensor ingest watermark, updated in the same transaction as history."""
+
+    __tablename__ = "ingest_state"
+
+    sensor_id = Column(
+        Integer, ForeignKey("sensor.id", ondelete="CASCADE"), primary_key=True
+    )
+    last_time = Column(DateTime(timezone=True), nullable=False)
+    # Estimated seconds between two readings of the sensor
+    sample_interval = Column(Float, nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class BeepSyncCursor(Base):
+    """Time of the newest reading confirmed uploaded to a BEEP device."""
+
+    __tablename__ = "beep_sync_cursor"
+
+    device_id = Column(Integer, primary_key=True, autoincrement=False)
+    last_time = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class TopologyDocument(Base):
+    """Topology read by topology.py when TOPOLOGY_SOURCE is ``database``."""
+
+    __tablename__ = "topology_document"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    document = Column(JSONB, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class BackfillWindow(Base):
+    """Time window of a sensor's history that was backfilled completely."""
+
+    __tablename__ = "backfill_window"
+
+    sensor_id = Column(
+        Integer, ForeignKey("sensor.id", ondelete="CASCADE"), primary_key=True
+    )
+    start_time = Column(DateTime(timezone=True), primary_key=True)
+    end_time = Column(DateTime(timezone=True), nullable=False)
+    # Readings stored for the window
+    rows = Column(Integer, nullable=False)
+    completed_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class RollupMixin:
+    """Aggregates of one attribute of one sensor over one time bucket."""
+
+    @declared_attr
+    def __table_args__(cls):
+        return (PrimaryKeyConstraint("sensor_id", "attribute", "bucket"),)
+
+    @declared_attr
+    def sensor_id(cls):
+        return Column(Integer, ForeignKey("sensor.id", ondelete="CASCADE"))
+
+    attribute = Column(Text)
+    bucket = Column(DateTime(timezone=True))
+    count = Column(Integer, nullable=False)
+    min = Column(Float)
+    max = Column(Float)
+    avg = Column(Float)
+    last = Column(Float)
+    last_time = Column(DateTime(timezone=True))
+
+
+class HistoryRollup15m(RollupMixin, Base):
+    __tablename__ = "history_rollup_15m"
+
+
+class HistoryRollup1h(RollupMixin, Base):
+    __tablename__ = "history_rollup_1h"
+
+
+class HistoryRollup1d(RollupMixin, Base):
+    __tablename__ = "history_rollup_1d"
 
 
 class Event(Base):
@@ -0,0 +1,269 @@
+"""Conversion of API measurements into typed history batches."""
+
+import json
+import math
+import multiprocessing
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from settings import ATTRIBUTES, ARRAY_ATTRIBUTES, INTEGER_ATTRIBUTES
+
+
+def to_int_array(value):
+    """Convert a list, or a single value, into a list of integers."""
+    if isinstance(value, list):
+        return list(map(int, value))
+    return [int(value)]
+
+
+def build_converters(
+    attributes=ATTRIBUTES,
+    array_attributes=ARRAY_ATTRIBUTES,
+    integer_attributes=INTEGER_ATTRIBUTES,
+):
+    """Map every attribute name to the function converting its raw value."""
+    converters = {}
+    for attr in attributes.split(";"):
+        if attr in array_attributes:
+            converters[attr] = to_int_array
+        elif attr in integer_attributes:
+            converters[attr] = int
+        else:
+            converters[attr] = float
+    return converters
+
+
+def timestamp_from_ms(value):
+    """Convert an API timestamp in milliseconds into an aware datetime."""
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+CONVERSION_ERRORS = (ValueError, TypeError, OverflowError, OSError)
+
+
+class HistoryBatch:
+    """Normalized history readings of one sensor.
+
+    All readings share the same column list, so values are kept as one
+    tuple per reading instead of one dict per reading. This keeps batches
+    compact and cheap to pickle.
+
+    Attributes:
+        names: column names, starting with ``sensor_id`` and ``time``
+        values: list of tuples, one per reading, ordered like ``names``
+        rejected: Counter of raw values that could not be converted, keyed
+            by attribute name
+    """
+
+    def __init__(self, names, values, rejected):
+        self.names = names
+        self.values = values
+        self.rejected = rejected
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def times(self):
+        """Return the reading times in batch order."""
+        index = self.names.index("time")
+        return [values[index] for values in self.values]
+
+    @property
+    def columns(self):
+        """Return a dict mapping each column name to a tuple of its values."""
+        if not self.values:
+            return {name: () for name in self.names}
+        return dict(zip(self.names, zip(*self.values)))
+
+    def rows(self):
+        """Return the readings as a list of dicts, as used by executemany."""
+        names = self.names
+        return [dict(zip(names, values)) for values in self.values]
+
+
+class Normalizer:
+    """Converts batches of API measurements using precomputed converters.
+
+    Values that cannot be converted, unknown attributes and measurements
+    without a time are counted in ``HistoryBatch.rejected``. Bad values are
+    stored as NULL, which leaves any existing value untouched on upsert.
+    """
+
+    def __init__(
+        self,
+        attributes=ATTRIBUTES,
+        array_attributes=ARRAY_ATTRIBUTES,
+        integer_attributes=INTEGER_ATTRIBUTES,
+    ):
+        self.converters = build_converters(
+            attributes, array_attributes, integer_attributes
+        )
+        self.names = ["sensor_id", "time", *self.converters]
+        self._items = list(self.converters.items())
+
+    def normalize(self, sensor_id, measurements):
+        """Normalize a list of API measurements of one sensor.
+
+        Args:
+            sensor_id: ID of the sensor the measurements belong to
+            measurements: list of dicts as returned by the history API; they
+                are not modified
+
+        Returns:
+            HistoryBatch with ``sensor_id``, ``time`` and one column per
+            attribute
+        """
+        items = self._items
+        rejected = Counter()
+        values = []
+        append = values.append
+        for measurement in measurements:
+            get = measurement.get
+            try:
+                append(
+                    (
+                        sensor_id,
+                        timestamp_from_ms(measurement["time"]),
+                        *[
+                            None if (v := get(name)) is None else convert(v)
+                            for name, convert in items
+                        ],
+                    )
+                )
+            except (KeyError, *CONVERSION_ERRORS):
+                row = self._convert_slowly(sensor_id, measurement, rejected)
+                if row is not None:
+                    append(row)
+
+        unknown = set().union(*measurements) - self.converters.keys() - {"time"}
+        for key in unknown:
+            rejected[key] += sum(1 for m in measurements if m.get(key) is not None)
+
+        return HistoryBatch(self.names, values, rejected)
+
+    def _convert_slowly(self, sensor_id, measurement, rejected):
+        """Convert a measurement value by value, counting what is rejected."""
+        try:
+            time = timestamp_from_ms(measurement["time"])
+        except (KeyError, *CONVERSION_ERRORS):
+            rejected["time"] += 1
+            return None
+
+        row = [sensor_id, time]
+        for name, convert in self._items:
+            value = measurement.get(name)
+            if value is not None:
+                try:
+                    value = convert(value)
+                except CONVERSION_ERRORS:
+                    rejected[name] += 1
+                    value = None
+            row.append(value)
+        return tuple(row)
+
+
+def time_within(measurement, since_ms, until_ms):
+    """Return False for measurements timed outside ``since_ms`` to ``until_ms``.
+
+    Measurements without a numeric time are kept, so Normalizer counts them
+    in ``HistoryBatch.rejected`` instead of the filter failing on them.
+    """
+    time = measurement.get("time")
+    if not isinstance(time, (int, float)):
+        return True
+    return since_ms <= time < until_ms
+
+
+def parse_history(
+    normalizer, sensor_id, text, chunk_size, since_ms=None, until_ms=None
+):
+    """Decode a history response and normalize it in chunks.
+
+    Args:
+        normalizer: Normalizer to use
+        sensor_id: ID of the sensor the response belongs to
+        text: JSON array of measurements as returned by the history API
+        chunk_size: maximum number of readings per HistoryBatch
+        since_ms, until_ms: optional bounds in milliseconds; readings
+            outside ``since_ms <= time < until_ms`` are dropped
+
+    Returns:
+        Tuple of (number of measurements in the response, list of
+        HistoryBatch)
+    """
+    measurements = json.loads(text)
+    received = len(measurements)
+    if since_ms is not None or until_ms is not None:
+        low = -math.inf if since_ms is None else since_ms
+        high = math.inf if until_ms is None else until_ms
+        measurements = [m for m in measurements if time_within(m, low, high)]
+    return received, [
+        normalizer.normalize(sensor_id, measurements[i : i + chunk_size])
+        for i in range(0, len(measurements), chunk_size)
+    ]
+
+
+# Normalizer of a pool worker process, created on its first task
+_process_normalizer = None
+
+
+def _parse_in_worker(*args):
+    global _process_normalizer
+    if _process_normalizer is None:
+        _process_normalizer = Normalizer()
+    return parse_history(_process_normalizer, *args)
+
+
+class NormalizerPool:
+    """Parses and normalizes whole history responses in worker processes.
+
+    JSON decoding and normalization are pure Python work that holds the
+    GIL, so with many fetch threads they become the bottleneck of large
+    backfills. Workers receive the raw response text and return compact
+    HistoryBatch objects: sending decoded measurements to a process costs
+    about as much pickling as normalizing them in place.
+
+    Until start() is called, or with fewer than two workers, everything
+    runs in-process.
+    """
+
+    def __init__(self, workers=0):
+        self.workers = workers
+        self.normalizer = Normalizer()
+        self.executor = None
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        """True while worker processes are available."""
+        return self.executor is not None
+
+    def start(self):
+        """Start the worker processes, if configured and not yet running."""
+        with self.lock:
+            if self.executor is None and self.workers > 1:
+                # spawn, since forking a process with running threads is unsafe
+                self.executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+
+    def shutdown(self):
+        """Stop the worker processes; later work runs in-process."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def normalize(self, sensor_id, measurements):
+        """Normalize decoded measurements in-process, see Normalizer.normalize."""
+        return self.normalizer.normalize(sensor_id, measurements)
+
+    def parse(self, sensor_id, text, chunk_size, since_ms=None, until_ms=None):
+        """Like parse_history, in a worker process when running."""
+        args = (sensor_id, text, chunk_size, since_ms, until_ms)
+        executor = self.executor
+        if executor is None:
+            return parse_history(self.normalizer, *args)
+        return executor.submit(_parse_in_worker, *args).result()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Monthly range partitions of the history table.
+
+The history table is partitioned by month on ``time``. Partitions are
+created on demand before readings are written, and old months can be
+detached (and dropped) without touching the remaining data.
+
+The rows that were in history before it was partitioned are in one legacy
+partition, which can only be detached as a whole once all of it is past
+the retention cutoff. ``split-legacy`` moves them into monthly partitions
+instead, so they expire month by month like newer readings.
+
+Usage:
+    python partitions.py ensure [--months N]      # Create upcoming partitions
+    python partitions.py detach YYYY-MM [--drop]  # Detach months before YYYY-MM
+    python partitions.py split-legacy [--drop]    # Move legacy rows to months
+"""
+
+import re
+import sys
+import argparse
+import logging
+from datetime import datetime, timezone
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from database import get_session, close_session
+
+PARENT_TABLE = "history"
+# Partition holding everything that was in history before partitioning
+LEGACY_PARTITION = "history_legacy"
+PARTITION_PATTERN = re.compile(r"^history_y(\d{4})m(\d{2})$")
+# Number of months created ahead of the current one
+MONTHS_AHEAD = 2
+# Legacy rows copied per transaction by split_legacy_partition()
+LEGACY_BATCH_SIZE = 10000
+
+# Upper bound of the range of the legacy partition
+LEGACY_END_SQL = """
+    SELECT (regexp_match(
+        pg_get_expr(c.relpartbound, c.oid), 'TO \\(''([^'']+)''\\)'
+    ))[1]::timestamptz
+    FROM pg_class c
+    WHERE c.oid = to_regclass(:name) AND c.relispartition
+"""
+
+# Months known to be covered by a partition, and whether history is
+# partitioned at all; both are cached for the life of the process
+_covered_months = set()
+_partitioned = None
+
+
+def month_start(dt):
+    """Return the first instant of the month containing ``dt``, in UTC."""
+    dt = dt.astimezone(timezone.utc)
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(dt, months):
+    """Return the first instant of the month ``months`` after ``dt``."""
+    index = dt.year * 12 + dt.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month):
+    """Return the partition table name for the month starting at ``month``."""
+    return f"history_y{month.year:04d}m{month.month:02d}"
+
+
+def is_history_partition(name):
+    """Return True for tables that are partitions of history."""
+    return name == LEGACY_PARTITION or PARTITION_PATTERN.match(name) is not None
+
+
+def is_partitioned(session):
+    """Return True if the history table is a partitioned table."""
+    global _partitioned
+    if _partitioned is None:
+        relkind = session.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": PARENT_TABLE},
+        ).scalar()
+        _partitioned = relkind == "p"
+        # A view is the split layout, see layout.py
+        if relkind == "r":
+            logging.warning(
+                "history is not partitioned, run 'alembic upgrade head' "
+                "to convert it"
+            )
+    return _partitioned
+
+
+def forget_partitions():
+    """Clear the cached partition state, after history was dropped or created."""
+    global _partitioned
+    _covered_months.clear()
+    _partitioned = None
+
+
+def ensure_history_partitions(session, start, end):
+    """Create the monthly partitions covering ``start`` to ``end``.
+
+    Months that already have a partition, or that fall into the legacy
+    partition, are skipped. Partitions are created in the current
+    transaction; the caller commits.
+
+    Returns:
+        List of created partition names
+    """
+    if not is_partitioned(session):
+        return []
+
+    created = []
+    month = month_start(start)
+    while month <= end:
+        if month not in _covered_months:
+            name = partition_name(month)
+            try:
+                with session.begin_nested():
+                    session.execute(
+                        text(
+                            f"CREATE TABLE IF NOT EXISTS {name} "
+                            f"PARTITION OF {PARENT_TABLE} "
+                            f"FOR VALUES FROM ('{month.isoformat()}') "
+                            f"TO ('{add_months(month, 1).isoformat()}')"
+                        )
+                    )
+                created.append(name)
+            except DBAPIError as e:
+                # 42P17: the month overlaps an existing partition, such as
+                # the legacy one, so it is covered already
+                if getattr(e.orig, "pgcode", None) != "42P17":
+                    raise
+            _covered_months.add(month)
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_upcoming_partitions(session, months=MONTHS_AHEAD):
+    """Create partitions for the current month and ``months`` ahead."""
+    now = datetime.now(timezone.utc)
+    created = ensure_history_partitions(session, now, add_months(now, months))
+    session.commit()
+    return created
+
+
+def list_history_partitions(session):
+    """Return the names of all partitions of the history table."""
+    return list(
+        session.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:name) ORDER BY c.relname"
+            ),
+            {"name": PARENT_TABLE},
+        ).scalars()
+    )
+
+
+def legacy_partition_end(session):
+    """Return the end of the legacy partition's range, or None without one."""
+    return session.execute(text(LEGACY_END_SQL), {"name": LEGACY_PARTITION}).scalar()
+
+
+def detach_history_partitions(session, before, drop=False):
+    """Detach the partitions that end on or before ``before``.
+
+    Detaching only touches the catalog, so old data can be removed without
+    deleting rows. The legacy partition is detached as a whole once its
+    range ends on or before ``before``, see split_legacy_partition().
+
+    Returns:
+        List of detached partition names
+    """
+    detached = []
+    for name in list_history_partitions(session):
+        match = PARTITION_PATTERN.match(name)
+        if match is not None:
+            month = datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)
+            end = add_months(month, 1)
+        elif name == LEGACY_PARTITION:
+            end = legacy_partition_end(session)
+        else:
+            continue
+        if end is None or end > before:
+            continue
+        session.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        if drop:
+            session.execute(text(f"DROP TABLE {name}"))
+        _covered_months.difference_update(
+            [month for month in _covered_months if month < end]
+        )
+        detached.append(name)
+    session.commit()
+    return detached
+
+
+def create_month_table(session, month):
+    """Create the table of a month outside of history, ready to be attached.
+
+    The table has the indexes and the foreign key of history and a CHECK
+    matching the month's range, so attaching it neither builds indexes nor
+    scans its rows.
+
+    Returns:
+        Name of the table
+    """
+    name = partition_name(month)
+    if session.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+        return name
+    session.execute(
+        text(
+            f"CREATE TABLE {name} ("
+            f"LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING INDEXES, "
+            f"CONSTRAINT {name}_range CHECK ("
+            f"\"time\" >= '{month.isoformat()}' "
+            f"AND \"time\" < '{add_months(month, 1).isoformat()}'))"
+        )
+    )
+    session.execute(
+        text(
+            f"ALTER TABLE {name} ADD CONSTRAINT {name}_sensor_id_fkey "
+            "FOREIGN KEY (sensor_id) REFERENCES sensor (id) ON DELETE CASCADE"
+        )
+    )
+    return name
+
+
+def split_legacy_partition(session, batch_size=LEGACY_BATCH_SIZE, drop=False):
+    """Move the rows of the legacy partition into monthly partitions.
+
+    The rows are copied into tables of their months, one transaction per
+    batch of ``batch_size`` rows in primary key order, while history keeps
+    serving them from the legacy partition. A short final transaction
+    detaches the legacy partition and attaches the month tables in its
+    place. An interrupted run can be started again.
+
+    Readings written to the legacy months while the rows are copied may be
+    missed, so backfills of those months must not run at the same time;
+    the command refuses to run while the legacy range reaches into the
+    current month, where ingest still writes.
+
+    Args:
+        drop: drop the detached legacy partition, otherwise it is kept as a
+            standalone table
+
+    Returns:
+        List of attached partition names
+    """
+    end = legacy_partition_end(session)
+    if end is None:
+        return []
+    if end > month_start(datetime.now(timezone.utc)):
+        raise ValueError(
+            f"{LEGACY_PARTITION} ends on {end:%Y-%m-%d}, split it once that "
+            "month is over"
+        )
+    columns = ", ".join(
+        f'"{name}"'
+        for name in session.execute(
+            text(
+                "SELECT attname FROM pg_attribute WHERE attrelid = "
+                "to_regclass(:name) AND attnum > 0 AND NOT attisdropped "
+                "ORDER BY attnum"
+            ),
+            {"name": PARENT_TABLE},
+        ).scalars()
+    )
+    keys = text(
+        f"SELECT sensor_id, time FROM {LEGACY_PARTITION} "
+        "WHERE (sensor_id, time) > (:sensor_id, :time) "
+        "ORDER BY sensor_id, time LIMIT :limit"
+    )
+
+    tables = {}
+    copied = 0
+    sensor_id, time = -1, datetime.min.replace(tzinfo=timezone.utc)
+    while True:
+        rows = session.execute(
+            keys, {"sensor_id": sensor_id, "time": time, "limit": batch_size}
+        ).all()
+        if not rows:
+            break
+        last_sensor_id, last_time = rows[-1]
+        for month in sorted({month_start(row.time) for row in rows}):
+            if month not in tables:
+                tables[month] = create_month_table(session, month)
+            session.execute(
+                text(
+                    f"INSERT INTO {tables[month]} ({columns}) "
+                    f"SELECT {columns} FROM {LEGACY_PARTITION} "
+                    "WHERE (sensor_id, time) > (:sensor_id, :time) "
+                    "AND (sensor_id, time) <= (:last_sensor_id, :last_time) "
+                    "AND time >= :start AND time < :end "
+                    "ON CONFLICT DO NOTHING"
+                ),
+                {
+                    "sensor_id": sensor_id,
+                    "time": time,
+                    "last_sensor_id": last_sensor_id,
+                    "last_time": last_time,
+                    "start": month,
+                    "end": add_months(month, 1),
+                },
+            )
+        session.commit()
+        copied += len(rows)
+        logging.info(f"Copied {copied} rows of {LEGACY_PARTITION}")
+        sensor_id, time = last_sensor_id, last_time
+
+    session.execute(
+        text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {LEGACY_PARTITION}")
+    )
+    for month, name in sorted(tables.items()):
+        session.execute(
+            text(
+                f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{month.isoformat()}') "
+                f"TO ('{add_months(month, 1).isoformat()}')"
+            )
+        )
+    if drop:
+        session.execute(text(f"DROP TABLE {LEGACY_PARTITION}"))
+    session.commit()
+    # Months of the legacy range without rows get partitions on demand
+    _covered_months.clear()
+    return [name for _, name in sorted(tables.items())]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Manage history partitions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ensure_parser = subparsers.add_parser("ensure", help="Create upcoming partitions")
+    ensure_parser.add_argument("--months", type=int, default=MONTHS_AHEAD)
+    detach_parser = subparsers.add_parser(
+        "detach", help="Detach partitions of months before the given one"
+    )
+    detach_parser.add_argument("before", help="First month to keep, as YYYY-MM")
+    detach_parser.add_argument(
+        "--drop", action="store_true", help="Drop the detached partitions"
+    )
+    split_parser = subparsers.add_parser(
+        "split-legacy", help="Move the legacy partition into monthly partitions"
+    )
+    split_parser.add_argument("--batch-size", type=int, default=LEGACY_BATCH_SIZE)
+    split_parser.add_argument(
+        "--drop", action="store_true", help="Drop the detached legacy partition"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    session = get_session()
+    try:
+        if args.command != "ensure" and not is_partitioned(session):
+            print(
+                "history is not partitioned, see 'python layout.py status'",
+                file=sys.stderr,
+            )
+            return 1
+        if args.command == "ensure":
+            names = ensure_upcoming_partitions(session, args.months)
+            print(f"Created partitions: {', '.join(names) or 'none'}")
+        elif args.command == "split-legacy":
+            try:
+                names = split_legacy_partition(session, args.batch_size, args.drop)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                return 1
+            print(f"Attached partitions: {', '.join(names) or 'none'}")
+        else:
+            before = datetime.strptime(args.before, "%Y-%m").replace(
+                tzinfo=timezone.utc
+            )
+            names = detach_history_partitions(session, before, drop=args.drop)
+            print(f"Detached partitions: {', '.join(names) or 'none'}")
+        return 0
+    finally:
+        close_session()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Downsampled reads of history for dashboards and exports.
+
+A series is one attribute of one sensor over a time range, reduced to at
+most ``points`` points. The ``minmax`` method keeps the lowest and highest
+reading of every time bucket, computed in SQL, so only the reduced series
+leaves the database. ``lttb`` (Largest-Triangle-Three-Buckets) first
+preselects min/max points of LTTB_PRESELECT times as many buckets in SQL
+and then picks the points that preserve the visual shape best.
+
+Series are cached in-process in an LRU cache, which pays off in
+long-running processes such as a dashboard backend. Entries are keyed on
+``ingest_state.updated_at`` of the sensor, which every history write
+bumps in its transaction, so writes of any process are seen on the next
+read. Sensors without an ingest state are not cached. Entries expire
+after QUERY_CACHE_TTL seconds.
+
+Usage:
+    python query.py SENSOR ATTRIBUTE START [END] [--points N] [--method lttb]
+"""
+
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from settings import (
+    ATTRIBUTES,
+    ARRAY_ATTRIBUTES,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL,
+    QUERY_MAX_POINTS,
+)
+from database import get_session, close_session
+from rollups import parse_time
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, LTTB runs in pure Python without it
+    np = None
+
+# Attributes that can be read as series; arrays have no single value
+SERIES_ATTRIBUTES = [a for a in ATTRIBUTES.split(";") if a not in ARRAY_ATTRIBUTES]
+
+METHODS = ("minmax", "lttb")
+
+# Buckets preselected in SQL per point returned by LTTB
+LTTB_PRESELECT = 4
+
+MINMAX_SQL = """
+    SELECT
+        (array_agg(time ORDER BY value, time))[1] AS min_time,
+        min(value) AS min_value,
+        (array_agg(time ORDER BY value DESC, time))[1] AS max_time,
+        max(value) AS max_value
+    FROM (
+        SELECT time, CAST("{attribute}" AS double precision) AS value,
+            date_bin(CAST(:width AS interval), time, :start) AS bucket
+        FROM history
+        WHERE sensor_id = :sensor_id AND time >= :start AND time < :end
+            AND "{attribute}" IS NOT NULL
+    ) readings
+    GROUP BY bucket
+    ORDER BY bucket
+"""
+
+
+def minmax_series(session, sensor_id, attribute, start, end, buckets):
+    """Return the min and max reading of each of ``buckets`` time buckets.
+
+    Returns:
+        List of (time, value) tuples ordered by time, at most two per bucket
+    """
+    width = max((end - start) / max(buckets, 1), timedelta(microseconds=1))
+    rows = session.execute(
+        text(MINMAX_SQL.format(attribute=attribute)),
+        {"sensor_id": sensor_id, "start": start, "end": end, "width": width},
+    )
+    series = []
+    for min_time, min_value, max_time, max_value in rows:
+        if min_time == max_time:
+            series.append((min_time, min_value))
+        else:
+            series += sorted([(min_time, min_value), (max_time, max_value)])
+    return series
+
+
+def lttb_indices(times, values, threshold):
+    """Return the indices of the points LTTB keeps out of a series.
+
+    Args:
+        times, values: sequences of numbers of equal length, ordered by time
+        threshold: number of points to keep
+
+    Returns:
+        List of indices, including the first and the last point
+    """
+    count = len(times)
+    if threshold >= count:
+        return list(range(count))
+    if threshold < 3:
+        return [0, count - 1][:threshold]
+
+    every = (count - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle point
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        start = int(i * every) + 1
+        end = next_start
+        ta, va = times[a], values[a]
+        if np is not None:
+            avg_t = times[next_start:next_end].mean()
+            avg_v = values[next_start:next_end].mean()
+            areas = np.abs(
+                (ta - avg_t) * (values[start:end] - va)
+                - (ta - times[start:end]) * (avg_v - va)
+            )
+            a = start + int(areas.argmax())
+        else:
+            span = next_end - next_start
+            avg_t = sum(times[next_start:next_end]) / span
+            avg_v = sum(values[next_start:next_end]) / span
+            a = max(
+                range(start, end),
+                key=lambda j: abs(
+                    (ta - avg_t) * (values[j] - va) - (ta - times[j]) * (avg_v - va)
+                ),
+            )
+        selected.append(a)
+    selected.append(count - 1)
+    return selected
+
+
+def lttb(series, threshold):
+    """Reduce a list of (time, value) tuples to ``threshold`` points."""
+    if len(series) <= threshold:
+        return series
+    times = [t.timestamp() for t, _ in series]
+    values = [v for _, v in series]
+    if np is not None:
+        times, values = np.array(times), np.array(values, dtype=float)
+    return [series[i] for i in lttb_indices(times, values, threshold)]
+
+
+class SeriesCache:
+    """Thread-safe LRU cache of series with time-based expiry.
+
+    Series are stored as tuples, so callers cannot change a cached entry.
+
+    Args:
+        size: maximum number of series kept, 0 disables the cache
+        ttl: seconds a series is kept
+    """
+
+    def __init__(self, size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached series of ``key``, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, series):
+        """Cache ``series`` under ``key``, evicting the least recently used."""
+        if not self.size:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, tuple(series))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all series."""
+        with self.lock:
+            self.entries.clear()
+
+
+# Cache shared by the whole process
+cache = SeriesCache()
+
+
+def series_version(session, sensor_id):
+    """Return the time history of a sensor last changed, or None if unknown."""
+    return session.execute(
+        text("SELECT updated_at FROM ingest_state WHERE sensor_id = :sensor_id"),
+        {"sensor_id": sensor_id},
+    ).scalar()
+
+
+def read_series(
+    session, sensor_id, attribute, start, end, points=QUERY_MAX_POINTS, method="lttb"
+):
+    """Return an attribute of a sensor from start to end, downsampled.
+
+    Args:
+        session: SQLAlchemy session
+        sensor_id: ID of the sensor
+        attribute: scalar history attribute, e.g. ``weight``
+        start, end: aware datetimes, end is exclusive
+        points: maximum number of points returned
+        method: ``minmax`` or ``lttb``
+
+    Returns:
+        List of (time, value) tuples ordered by time
+    """
+    if attribute not in SERIES_ATTRIBUTES:
+        raise ValueError(f"Unknown or non-scalar attribute {attribute!r}")
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method!r}, expected one of {METHODS}")
+    if points < 2:
+        raise ValueError("At least 2 points are needed")
+    if end <= start:
+        return []
+
+    version = series_version(session, sensor_id)
+    key = (sensor_id, version, attribute, start, end, points, method)
+    series = cache.get(key) if version is not None else None
+    if series is not None:
+        return list(series)
+    if method == "minmax":
+        series = minmax_series(session, sensor_id, attribute, start, end, points // 2)
+    else:
+        series = lttb(
+            minmax_series(
+                session, sensor_id, attribute, start, end, points * LTTB_PRESELECT
+            ),
+            points,
+        )
+    if version is not None:
+        cache.put(key, series)
+    return series
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Read a downsampled series")
+    parser.add_argument("sensor_id", type=int)
+    parser.add_argument("attribute", choices=SERIES_ATTRIBUTES, metavar="attribute")
+    parser.add_argument("start", type=parse_time, help="Date or ISO timestamp")
+    parser.add_argument(
+        "end", type=parse_time, nargs="?", help="Exclusive end, default now"
+    )
+    parser.add_argument("--points", type=int, default=QUERY_MAX_POINTS)
+    parser.add_argument("--method", choices=METHODS, default="lttb")
+    parser.add_argument("--format", choices=["csv", "json"], default="csv")
+    args = parser.parse_args(argv)
+    end = args.end or datetime.now(timezone.utc)
+
+    session = get_session()
+    try:
+        series = read_series(
+            session,
+            args.sensor_id,
+            args.attribute,
+            args.start,
+            end,
+            args.points,
+            args.method,
+        )
+    finally:
+        close_session()
+
+    if args.format == "json":
+        json.dump([[t.isoformat(), v] for t, v in series], sys.stdout)
+        print()
+    else:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["time", args.attribute])
+        writer.writerows((t.isoformat(), v) for t, v in series)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,106 @@
+"""Client-side pacing for rate-limited HTTP APIs."""
+
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """Thread-safe token bucket that spreads requests evenly over time.
+
+    The bucket refills at ``limit / period`` tokens per second and holds at
+    most ``burst`` tokens, so requests are paced instead of being sent in a
+    burst followed by a long stall. The limit and the remaining budget are
+    learned from ``X-RateLimit-*`` response headers.
+
+    Attributes:
+        waited: total seconds callers spent blocked in ``acquire`` and
+            ``sleep``
+    """
+
+    def __init__(self, limit=60, period=60.0, burst=5):
+        self.period = period
+        self.burst = burst
+        self.rate = limit / period
+        self.tokens = float(min(burst, limit))
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a request may be sent; return the seconds waited."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Reserve a token now, possibly going into debt, so concurrent
+            # callers queue up behind each other instead of all waking at once
+            self.tokens -= 1
+            delay = max(-self.tokens / self.rate, self.blocked_until - now, 0.0)
+        if delay > 0:
+            self.sleep(delay)
+        return delay
+
+    def sleep(self, seconds):
+        """Sleep and account the time as waited."""
+        time.sleep(seconds)
+        with self.lock:
+            self.waited += seconds
+
+    def pause(self, seconds):
+        """Hold back all requests for ``seconds``, e.g. after a 429."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def update(self, headers):
+        """Adjust rate and budget to the server's ``X-RateLimit-*`` headers.
+
+        Missing or malformed headers leave the current state unchanged.
+        """
+        limit = parse_int(headers.get("X-RateLimit-Limit"))
+        remaining = parse_int(headers.get("X-RateLimit-Remaining"))
+        reset = parse_int(headers.get("X-RateLimit-Reset"))
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit:
+                self.rate = limit / self.period
+            if remaining is not None:
+                # The server's count wins if it is lower than ours
+                self.tokens = min(self.tokens, float(remaining))
+                if remaining == 0 and reset:
+                    wait = reset - time.time()
+                    if wait > 0:
+                        self.blocked_until = max(self.blocked_until, now + wait)
+
+
+def parse_int(value):
+    """Return ``value`` as an int, or None if it is missing or malformed."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(headers):
+    """Return the seconds requested by a ``Retry-After`` header, or None."""
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    seconds = parse_int(value)
+    if seconds is not None:
+        return max(seconds, 0)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Return a full-jitter exponential backoff delay for ``attempt``."""
+    return random.uniform(0, min(cap, base * 2**attempt))
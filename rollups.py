@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Rollups of history at 15-minute, hourly and daily grain.
+
+Every rollup row holds count, min, max, avg and the last value of one
+attribute of one sensor over one bucket. The 15-minute rollup is computed
+from history, each coarser rollup from the one below it, so refreshing a
+day only reads that day's 15-minute and hourly rows instead of raw history.
+
+Usage:
+    python rollups.py rebuild START END [--sensor ID ...]
+
+START and END are dates (YYYY-MM-DD) or ISO timestamps, END is exclusive.
+"""
+
+import sys
+import argparse
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from settings import ATTRIBUTES, ARRAY_ATTRIBUTES
+from models import Sensor, HistoryRollup15m, HistoryRollup1h, HistoryRollup1d
+from database import get_session, close_session
+
+# Scalar attributes that are rolled up; arrays have no meaningful aggregate
+ROLLUP_ATTRIBUTES = [a for a in ATTRIBUTES.split(";") if a not in ARRAY_ATTRIBUTES]
+
+# (table, bucket width, source table) from finest to coarsest grain
+ROLLUPS = [
+    (HistoryRollup15m.__tablename__, timedelta(minutes=15), "history"),
+    (HistoryRollup1h.__tablename__, timedelta(hours=1), HistoryRollup15m.__tablename__),
+    (HistoryRollup1d.__tablename__, timedelta(days=1), HistoryRollup1h.__tablename__),
+]
+
+# Buckets are aligned to the Unix epoch, i.e. days start at midnight UTC
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Days rebuilt per transaction by rebuild_rollups
+REBUILD_CHUNK = timedelta(days=7)
+
+UPSERT = """
+    ON CONFLICT (sensor_id, attribute, bucket) DO UPDATE SET
+        count = excluded.count,
+        min = excluded.min,
+        max = excluded.max,
+        avg = excluded.avg,
+        last = excluded.last,
+        last_time = excluded.last_time
+"""
+
+
+def history_rollup_sql(table):
+    """Return the statement aggregating raw history into ``table``."""
+    values = ", ".join(
+        f"('{attr}', CAST(h.\"{attr}\" AS double precision))"
+        for attr in ROLLUP_ATTRIBUTES
+    )
+    return f"""
+        INSERT INTO {table}
+            (sensor_id, attribute, bucket, count, min, max, avg, last, last_time)
+        SELECT h.sensor_id, v.attribute,
+            date_bin(CAST(:width AS interval), h.time, :origin) AS bucket,
+            count(*), min(v.value), max(v.value), avg(v.value),
+            (array_agg(v.value ORDER BY h.time DESC))[1], max(h.time)
+        FROM history h
+        CROSS JOIN LATERAL (VALUES {values}) AS v (attribute, value)
+        WHERE h.sensor_id = :sensor_id AND h.time >= :start AND h.time < :end
+            AND v.value IS NOT NULL
+        GROUP BY h.sensor_id, v.attribute, bucket
+        {UPSERT}
+    """
+
+
+def rollup_rollup_sql(table, source):
+    """Return the statement aggregating rollup ``source`` into ``table``."""
+    return f"""
+        INSERT INTO {table}
+            (sensor_id, attribute, bucket, count, min, max, avg, last, last_time)
+        SELECT sensor_id, attribute,
+            date_bin(CAST(:width AS interval), bucket, :origin) AS coarse,
+            sum(count), min(min), max(max), sum(avg * count) / sum(count),
+            (array_agg(last ORDER BY last_time DESC))[1], max(last_time)
+        FROM {source}
+        WHERE sensor_id = :sensor_id AND bucket >= :start AND bucket < :end
+        GROUP BY sensor_id, attribute, coarse
+        {UPSERT}
+    """
+
+
+ROLLUP_SQL = {
+    table: text(
+        history_rollup_sql(table)
+        if source == "history"
+        else rollup_rollup_sql(table, source)
+    )
+    for table, _, source in ROLLUPS
+}
+
+
+def bucket_floor(dt, width):
+    """Return the start of the bucket of ``width`` containing ``dt``."""
+    return dt - (dt - EPOCH) % width
+
+
+def bucket_range(start, end, width):
+    """Return the bucket-aligned range covering ``start`` to ``end``."""
+    return bucket_floor(start, width), bucket_floor(end, width) + width
+
+
+def refresh_rollups(session, sensor_id, start, end):
+    """Recompute every rollup bucket of a sensor that overlaps start to end.
+
+    Buckets are recomputed in full from their source, so this is correct
+    for inserted as well as updated readings. Runs in the caller's
+    transaction.
+    """
+    for table, width, _ in ROLLUPS:
+        bucket_start, bucket_end = bucket_range(start, end, width)
+        session.execute(
+            ROLLUP_SQL[table],
+            {
+                "sensor_id": sensor_id,
+                "start": bucket_start,
+                "end": bucket_end,
+                "width": width,
+                "origin": EPOCH,
+            },
+        )
+
+
+def rebuild_rollups(session, start, end, sensor_ids=None):
+    """Delete and recompute all rollups of the given sensors from start to end.
+
+    The range is widened to whole days and processed in chunks of
+    ``REBUILD_CHUNK``, each in its own transaction.
+    """
+    if sensor_ids is None:
+        sensor_ids = [sensor_id for (sensor_id,) in session.query(Sensor.id)]
+    day = timedelta(days=1)
+    start, end = bucket_range(start, end - timedelta(microseconds=1), day)
+
+    for sensor_id in sensor_ids:
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + REBUILD_CHUNK, end)
+            for table, _, _ in ROLLUPS:
+                session.execute(
+                    text(
+                        f"DELETE FROM {table} WHERE sensor_id = :sensor_id "
+                        "AND bucket >= :start AND bucket < :end"
+                    ),
+                    {"sensor_id": sensor_id, "start": chunk_start, "end": chunk_end},
+                )
+            refresh_rollups(
+                session, sensor_id, chunk_start, chunk_end - timedelta(microseconds=1)
+            )
+            session.commit()
+            chunk_start = chunk_end
+
+
+def parse_time(value):
+    """Parse a date or ISO timestamp, assuming UTC when no zone is given."""
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Maintain history rollups")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="Rebuild a time range")
+    rebuild_parser.add_argument("start", type=parse_time)
+    rebuild_parser.add_argument("end", type=parse_time)
+    rebuild_parser.add_argument(
+        "--sensor",
+        type=int,
+        action="append",
+        dest="sensor_ids",
+        help="Sensor to rebuild, may be repeated (default: all sensors)",
+    )
+    args = parser.parse_args(argv)
+
+    session = get_session()
+    try:
+        rebuild_rollups(session, args.start, args.end, args.sensor_ids)
+        print("Rollups rebuilt successfully!")
+    finally:
+        close_session()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -5,7 +5,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # API Configuration
-BASE_URL = "https://main.beehivemonitoring.com"
+BASE_URL = os.getenv("BEEHIVE_BASE_URL", "https://main.beehivemonitoring.com")
 HEADERS = {"X-Auth-Token": os.getenv("BEEHIVE_API_TOKEN")}
 
 # Database Configuration
@@ -22,6 +22,15 @@ HIVES = json.loads(os.getenv("HIVES", DEFAULT_HIVES))
 SENSORS = json.loads(os.getenv("SENSORS", DEFAULT_SENSORS))
 ASSIGNMENTS = json.loads(os.getenv("ASSIGNMENTS", DEFAULT_ASSIGNMENTS))
 
+# Where topology.py reads the topology from: "config" (the settings above
+# and beep_sensors.py) or "database"; a database topology is cached on disk
+# for TOPOLOGY_CACHE_TTL seconds, 0 disables the cache
+TOPOLOGY_SOURCE = os.getenv("TOPOLOGY_SOURCE", "config")
+TOPOLOGY_CACHE = os.getenv(
+    "TOPOLOGY_CACHE", os.path.expanduser("~/.cache/bees/topology.json")
+)
+TOPOLOGY_CACHE_TTL = int(os.getenv("TOPOLOGY_CACHE_TTL", "300"))
+
 # Monitoring Attributes
 ATTRIBUTES = (
     "weight;"
@@ -43,3 +52,46 @@ ARRAY_ATTRIBUTES = {"inCounts", "outCounts", "fft"}
 
 # Define which attributes should be stored as integers
 INTEGER_ATTRIBUTES = {"inTotal", "outTotal", "rssiIn", "rssiOut", "rssiGw", "fftPeak"}
+
+# Compression of the packed inCounts, outCounts and fft columns: "none",
+# "zlib" or "zstd" (needs the zstandard package, falls back to zlib)
+ARRAY_CODEC = os.getenv("HISTORY_ARRAY_CODEC", "zlib")
+
+# Ingest Configuration
+# Number of history rows written per INSERT ... ON CONFLICT statement
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "1000"))
+
+# Number of sensors whose history is fetched concurrently
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+
+# Length in hours of the windows fetched by backfill.py
+BACKFILL_WINDOW_HOURS = int(os.getenv("BACKFILL_WINDOW_HOURS", "24"))
+
+# Worker processes normalizing history chunks; below 2 normalization runs
+# in-process. The pool is only started for runs expecting at least
+# NORMALIZE_MIN_READINGS readings, smaller runs do not pay its startup.
+NORMALIZE_WORKERS = int(os.getenv("NORMALIZE_WORKERS", "0"))
+NORMALIZE_MIN_READINGS = int(os.getenv("NORMALIZE_MIN_READINGS", "50000"))
+
+# Daemon mode (beehivemonitoring.py --daemon), all values in seconds
+# Bounds of the polling interval of a sensor
+DAEMON_MIN_INTERVAL = int(os.getenv("DAEMON_MIN_INTERVAL", "60"))
+DAEMON_MAX_INTERVAL = int(os.getenv("DAEMON_MAX_INTERVAL", "3600"))
+# Time after a reading is expected before its sensor is polled
+DAEMON_POLL_DELAY = int(os.getenv("DAEMON_POLL_DELAY", "60"))
+# How often the sensor list is fetched again
+SENSOR_REFRESH_INTERVAL = int(os.getenv("SENSOR_REFRESH_INTERVAL", "3600"))
+
+# Metrics: directory for Prometheus textfiles (bees_<job>.prom), and the
+# port serving /metrics in daemon mode; empty or 0 disables them
+METRICS_TEXTFILE_DIR = os.getenv("METRICS_TEXTFILE_DIR", "")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Read API (query.py): default number of points of a series, and the size
+# and expiry in seconds of its in-process cache; a size of 0 disables it
+QUERY_MAX_POINTS = int(os.getenv("QUERY_MAX_POINTS", "1000"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "300"))
+
+# Keep the 15-minute, hourly and daily rollup tables up to date during ingest
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() in ("1", "true", "yes")
@@ -0,0 +1,80 @@
+"""Tests of the packed encoding of integer array attributes.
+
+Run from the repository root:
+
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+import arrays
+from arrays import CODECS, DELTA, PackedInts, pack_int_array, unpack_int_array
+
+VALUES = [
+    [],
+    [0],
+    [5, 7, 7, 3, 0],
+    [-3, -1, -40000, 2, -(1 << 40), 1 << 40],
+    [(1 << 63) - 1, -(1 << 63)],
+]
+
+
+def codecs():
+    """Return the codecs usable here; zstd needs the optional zstandard."""
+    return [codec for codec in CODECS if codec != "zstd" or arrays.zstandard]
+
+
+class PackTest(unittest.TestCase):
+    def test_round_trip(self):
+        for use_numpy in (True, False):
+            numpy = arrays.np if use_numpy else None
+            for codec in codecs():
+                for values in VALUES:
+                    with self.subTest(numpy=use_numpy, codec=codec, values=values):
+                        data = pack_int_array(values, codec)
+                        with mock.patch("arrays.np", numpy):
+                            self.assertEqual(unpack_int_array(data).tolist(), values)
+
+    def test_header(self):
+        data = pack_int_array([1, -2, 300], "none")
+        self.assertEqual(data[:2], bytes((CODECS["none"], 2)))
+        data = pack_int_array([1, -2, 300], "zlib")
+        self.assertEqual(data[:2], bytes((CODECS["zlib"] | DELTA, 2)))
+
+    def test_delta_size_fits_differences(self):
+        # The values fit 2 bytes, their differences need 4
+        data = pack_int_array([-32768, 32767, -32768], "zlib")
+        self.assertEqual(data[1], 4)
+        self.assertEqual(unpack_int_array(data).tolist(), [-32768, 32767, -32768])
+
+    def test_zstd_falls_back_to_zlib(self):
+        with mock.patch("arrays.zstandard", None):
+            data = pack_int_array([1, 2, 3], "zstd")
+        self.assertEqual(data[0] & arrays.CODEC_MASK, CODECS["zlib"])
+
+    def test_differences_beyond_8_bytes_are_not_delta_encoded(self):
+        values = [(1 << 63) - 1, -(1 << 63)]
+        data = pack_int_array(values, "zlib")
+        self.assertEqual(data[:2], bytes((CODECS["zlib"], 8)))
+        self.assertEqual(unpack_int_array(data).tolist(), values)
+
+    def test_none_value_is_refused(self):
+        for codec in codecs():
+            with self.subTest(codec=codec), self.assertRaises(TypeError):
+                pack_int_array([1, None, 3], codec)
+
+    def test_out_of_range(self):
+        with self.assertRaises(OverflowError):
+            pack_int_array([1 << 63], "none")
+
+    def test_packed_ints(self):
+        packed = PackedInts(pack_int_array([4, -5, 6], "zlib"))
+        self.assertEqual(packed, [4, -5, 6])
+        self.assertEqual(len(packed), 3)
+        self.assertEqual(list(packed), [4, -5, 6])
+        self.assertEqual(packed[1], -5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Tests of the resolution of sensor assignments to hives.
+
+Run from the repository root:
+
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+
+import unittest
+from datetime import datetime, timedelta, timezone
+from assignments import AssignmentIndex
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+TICK = timedelta(microseconds=1)
+
+
+def day(days):
+    return START + timedelta(days=days)
+
+
+class HiveAtTest(unittest.TestCase):
+    def test_boundaries(self):
+        index = AssignmentIndex([(1, 10, day(0), day(10)), (1, 20, day(10), None)])
+        cases = [
+            (day(0) - TICK, None),
+            (day(0), 10),
+            (day(10) - TICK, 10),
+            (day(10), 20),
+            (day(1000), 20),
+        ]
+        for time, hive_id in cases:
+            with self.subTest(time=time):
+                self.assertEqual(index.hive_at(1, time), hive_id)
+
+    def test_end_is_exclusive_and_gaps_have_no_hive(self):
+        index = AssignmentIndex([(1, 10, day(0), day(5)), (1, 20, day(8), day(9))])
+        self.assertEqual(index.hive_at(1, day(5) - TICK), 10)
+        self.assertIsNone(index.hive_at(1, day(5)))
+        self.assertIsNone(index.hive_at(1, day(8) - TICK))
+        self.assertEqual(index.hive_at(1, day(8)), 20)
+        self.assertIsNone(index.hive_at(1, day(9)))
+
+    def test_unknown_sensor(self):
+        index = AssignmentIndex([(1, 10, day(0), None)])
+        self.assertIsNone(index.hive_at(2, day(1)))
+
+    def test_later_start_wins_over_open_assignment(self):
+        index = AssignmentIndex([(1, 10, day(0), None), (1, 20, day(3), day(6))])
+        self.assertEqual(index.hive_at(1, day(3) - TICK), 10)
+        self.assertEqual(index.hive_at(1, day(3)), 20)
+        # The older assignment does not resume after the newer one ends
+        self.assertIsNone(index.hive_at(1, day(6)))
+
+    def test_newer_assignment_with_same_start_wins(self):
+        index = AssignmentIndex([(1, 10, day(0), None), (1, 20, day(0), None)])
+        self.assertEqual(index.hive_at(1, day(0)), 20)
+        self.assertEqual(len(index), 1)
+
+    def test_empty_interval_is_ignored(self):
+        index = AssignmentIndex([(1, 10, day(2), day(2)), (1, 20, day(0), day(5))])
+        self.assertEqual(index.hive_at(1, day(2)), 20)
+        self.assertEqual(len(index), 1)
+
+
+class SegmentsTest(unittest.TestCase):
+    def test_gaps_and_bounds(self):
+        index = AssignmentIndex([(1, 10, day(2), day(4)), (1, 20, day(6), None)])
+        self.assertEqual(
+            index.segments(1, day(0), day(8)),
+            [
+                (day(0), day(2), None),
+                (day(2), day(4), 10),
+                (day(4), day(6), None),
+                (day(6), day(8), 20),
+            ],
+        )
+        self.assertEqual(
+            index.segments(1, day(3), day(5)),
+            [(day(3), day(4), 10), (day(4), day(5), None)],
+        )
+
+    def test_segments_agree_with_hive_at(self):
+        index = AssignmentIndex(
+            [(1, 10, day(1), day(3)), (1, 20, day(3), day(4)), (1, 30, day(5), None)]
+        )
+        for start, end, hive_id in index.segments(1, day(0), day(7)):
+            for time in (start, end - TICK):
+                with self.subTest(time=time):
+                    self.assertEqual(index.hive_at(1, time), hive_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+"""Tests of the incremental JSON array decoder of beehivemonitoring.
+
+Run from the repository root:
+
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+
+import json
+import unittest
+from beehivemonitoring import iter_json_array
+
+
+def split_at(text, *positions):
+    """Return ``text`` cut into chunks at the given positions."""
+    bounds = [0, *positions, len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+class IterJsonArrayTest(unittest.TestCase):
+    def test_number_split_at_decimal_point(self):
+        self.assertEqual(list(iter_json_array(["[1, 2500.", "0, 3]"])), [1, 2500.0, 3])
+
+    def test_number_split_in_exponent(self):
+        self.assertEqual(list(iter_json_array(["[1e", "-3", "]"])), [1e-3])
+
+    def test_every_split_position(self):
+        values = [2500.05, -12, 0, 1.5e10, True, None, "a,]", {"time": 1}, [1, 2]]
+        text = json.dumps(values)
+        for position in range(1, len(text)):
+            for chunks in (split_at(text, position), list(text)):
+                with self.subTest(chunks=chunks):
+                    self.assertEqual(list(iter_json_array(chunks)), values)
+
+    def test_number_before_end_of_stream(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(["[1, 2500."]))
+
+    def test_malformed_number(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(["[2500x, 1]"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""Tests of the conversion of API measurements into history batches.
+
+Run from the repository root:
+
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+
+import json
+import unittest
+from datetime import datetime, timezone
+from normalizer import HistoryBatch, Normalizer, parse_history
+
+TIME_MS = 1700000000000
+TIME = datetime(2023, 11, 14, 22, 13, 20, tzinfo=timezone.utc)
+
+
+def normalizer():
+    """Return a Normalizer of a small attribute set."""
+    return Normalizer(
+        attributes="weight;rssiIn;fft",
+        array_attributes={"fft"},
+        integer_attributes={"rssiIn"},
+    )
+
+
+class NormalizerTest(unittest.TestCase):
+    def test_converts_values(self):
+        batch = normalizer().normalize(
+            7, [{"time": TIME_MS, "weight": "25.5", "rssiIn": 3.0, "fft": [1.0, "2"]}]
+        )
+        self.assertEqual(batch.names, ["sensor_id", "time", "weight", "rssiIn", "fft"])
+        self.assertEqual(batch.values, [(7, TIME, 25.5, 3, [1, 2])])
+        self.assertEqual(batch.rejected, {})
+
+    def test_single_array_value(self):
+        batch = normalizer().normalize(7, [{"time": TIME_MS, "fft": 4}])
+        self.assertEqual(batch.values, [(7, TIME, None, None, [4])])
+
+    def test_bad_value_is_null_and_counted(self):
+        batch = normalizer().normalize(
+            7, [{"time": TIME_MS, "weight": "heavy", "rssiIn": -70}]
+        )
+        self.assertEqual(batch.values, [(7, TIME, None, -70, None)])
+        self.assertEqual(batch.rejected, {"weight": 1})
+
+    def test_missing_or_bad_time_is_rejected(self):
+        measurements = [{"weight": 1}, {"time": None}, {"time": "x"}, {"time": TIME_MS}]
+        batch = normalizer().normalize(7, measurements)
+        self.assertEqual(batch.values, [(7, TIME, None, None, None)])
+        self.assertEqual(batch.rejected, {"time": 3})
+
+    def test_unknown_attributes_are_counted(self):
+        batch = normalizer().normalize(
+            7,
+            [
+                {"time": TIME_MS, "colour": "red"},
+                {"time": TIME_MS + 1, "colour": None},
+            ],
+        )
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(batch.rejected, {"colour": 1})
+
+    def test_measurements_are_not_modified(self):
+        measurement = {"time": TIME_MS, "weight": "1"}
+        normalizer().normalize(7, [measurement])
+        self.assertEqual(measurement, {"time": TIME_MS, "weight": "1"})
+
+
+class HistoryBatchTest(unittest.TestCase):
+    def test_views(self):
+        batch = HistoryBatch(
+            ["sensor_id", "time", "weight"], [(1, "t1", 2.0), (1, "t2", None)], {}
+        )
+        self.assertEqual(batch.times, ["t1", "t2"])
+        self.assertEqual(
+            batch.columns,
+            {"sensor_id": (1, 1), "time": ("t1", "t2"), "weight": (2.0, None)},
+        )
+        self.assertEqual(
+            batch.rows(),
+            [
+                {"sensor_id": 1, "time": "t1", "weight": 2.0},
+                {"sensor_id": 1, "time": "t2", "weight": None},
+            ],
+        )
+
+    def test_empty_columns(self):
+        batch = HistoryBatch(["sensor_id", "time"], [], {})
+        self.assertEqual(batch.columns, {"sensor_id": (), "time": ()})
+        self.assertEqual(batch.times, [])
+
+
+class ParseHistoryTest(unittest.TestCase):
+    def test_chunks_and_bounds(self):
+        text = json.dumps(
+            [{"time": TIME_MS + i, "weight": i} for i in range(5)] + [{"weight": 9}]
+        )
+        received, batches = parse_history(
+            normalizer(), 7, text, 2, since_ms=TIME_MS + 1, until_ms=TIME_MS + 4
+        )
+        self.assertEqual(received, 6)
+        # The reading without a time passes the bounds and is rejected
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual(
+            [value[2] for batch in batches for value in batch.values], [1.0, 2.0, 3.0]
+        )
+        self.assertEqual(batches[1].rejected, {"time": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
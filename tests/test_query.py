@@ -0,0 +1,163 @@
+"""Tests of the downsampling of history series.
+
+Run from the repository root:
+
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+
+import math
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import query
+from query import lttb, lttb_indices, minmax_series, read_series
+
+START = datetime(2026, 5, 1, tzinfo=timezone.utc)
+
+
+class FakeResult(list):
+    def scalar(self):
+        return self[0] if self else None
+
+
+class FakeSession:
+    """Answers the queries of query.py with fixed rows and records them."""
+
+    def __init__(self, rows, updated_at=None):
+        self.rows = rows
+        self.updated_at = updated_at
+        self.params = []
+
+    def execute(self, statement, params):
+        self.params.append(params)
+        if "ingest_state" in str(statement):
+            return FakeResult([self.updated_at] if self.updated_at else [])
+        return FakeResult(self.rows)
+
+
+def at(minutes):
+    return START + timedelta(minutes=minutes)
+
+
+class LttbIndicesTest(unittest.TestCase):
+    def series(self, count, use_numpy):
+        times = list(range(count))
+        values = [math.sin(i / 3) * (i % 7) for i in times]
+        if use_numpy:
+            times, values = query.np.array(times), query.np.array(values)
+        return times, values
+
+    def test_small_thresholds(self):
+        times, values = self.series(10, False)
+        self.assertEqual(lttb_indices(times, values, 10), list(range(10)))
+        self.assertEqual(lttb_indices(times, values, 20), list(range(10)))
+        self.assertEqual(lttb_indices(times, values, 2), [0, 9])
+        self.assertEqual(lttb_indices(times, values, 1), [0])
+        self.assertEqual(lttb_indices(times, values, 0), [])
+
+    def test_one_point_per_bucket(self):
+        for count in (5, 11, 100, 101):
+            for threshold in (3, 4, count - 1):
+                every = (count - 2) / (threshold - 2)
+                for use_numpy in (True, False):
+                    with self.subTest(
+                        count=count, threshold=threshold, numpy=use_numpy
+                    ):
+                        times, values = self.series(count, use_numpy)
+                        with mock.patch("query.np", query.np if use_numpy else None):
+                            indices = lttb_indices(times, values, threshold)
+                        self.assertEqual(len(indices), threshold)
+                        self.assertEqual((indices[0], indices[-1]), (0, count - 1))
+                        for i, index in enumerate(indices[1:-1]):
+                            self.assertGreaterEqual(index, int(i * every) + 1)
+                            self.assertLess(index, int((i + 1) * every) + 1)
+
+    def test_numpy_and_python_agree(self):
+        times, values = self.series(200, False)
+        with mock.patch("query.np", None):
+            expected = lttb_indices(times, values, 17)
+        times, values = self.series(200, True)
+        self.assertEqual(lttb_indices(times, values, 17), expected)
+
+    def test_keeps_spike(self):
+        series = [(at(i), 100.0 if i == 50 else 0.0) for i in range(100)]
+        self.assertIn((at(50), 100.0), lttb(series, 10))
+
+    def test_short_series_unchanged(self):
+        series = [(at(i), float(i)) for i in range(3)]
+        self.assertIs(lttb(series, 3), series)
+
+
+class MinmaxSeriesTest(unittest.TestCase):
+    def test_bucket_width(self):
+        session = FakeSession([])
+        minmax_series(session, 1, "weight", START, at(60), 4)
+        self.assertEqual(session.params[0]["width"], timedelta(minutes=15))
+
+    def test_width_edges(self):
+        session = FakeSession([])
+        minmax_series(session, 1, "weight", START, at(60), 0)
+        minmax_series(session, 1, "weight", START, START + timedelta(microseconds=3), 9)
+        widths = [params["width"] for params in session.params]
+        self.assertEqual(widths, [timedelta(minutes=60), timedelta(microseconds=1)])
+
+    def test_points_per_bucket(self):
+        rows = [
+            # One reading in the bucket
+            (at(1), 5.0, at(1), 5.0),
+            # Max before min, returned ordered by time
+            (at(20), 1.0, at(16), 9.0),
+            (at(30), 2.0, at(44), 3.0),
+        ]
+        self.assertEqual(
+            minmax_series(FakeSession(rows), 1, "weight", START, at(60), 4),
+            [
+                (at(1), 5.0),
+                (at(16), 9.0),
+                (at(20), 1.0),
+                (at(30), 2.0),
+                (at(44), 3.0),
+            ],
+        )
+
+
+class ReadSeriesTest(unittest.TestCase):
+    def setUp(self):
+        query.cache.clear()
+        self.addCleanup(query.cache.clear)
+
+    def test_cached_per_version(self):
+        rows = [(at(1), 1.0, at(2), 2.0)]
+        session = FakeSession(rows, updated_at=at(100))
+        first = read_series(session, 1, "weight", START, at(60), method="minmax")
+        first.append("changed")
+        self.assertEqual(
+            read_series(session, 1, "weight", START, at(60), method="minmax"),
+            [(at(1), 1.0), (at(2), 2.0)],
+        )
+        # Version query, series query, then only the version query
+        self.assertEqual(len(session.params), 3)
+
+        session.updated_at = at(200)
+        session.rows = []
+        self.assertEqual(
+            read_series(session, 1, "weight", START, at(60), method="minmax"), []
+        )
+
+    def test_not_cached_without_ingest_state(self):
+        session = FakeSession([(at(1), 1.0, at(1), 1.0)])
+        for _ in range(2):
+            read_series(session, 1, "weight", START, at(60), method="minmax")
+        self.assertEqual(len(session.params), 4)
+
+    def test_invalid_arguments(self):
+        session = FakeSession([])
+        for kwargs in ({"attribute": "fft"}, {"method": "mean"}, {"points": 1}):
+            arguments = {"attribute": "weight", **kwargs}
+            with self.subTest(**kwargs), self.assertRaises(ValueError):
+                read_series(session, 1, start=START, end=at(60), **arguments)
+
+
+if __name__ == "__main__":
+    unittest.main()
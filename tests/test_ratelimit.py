@@ -0,0 +1,100 @@
+"""Tests of the client-side rate limiting helpers.
+
+Run from the repository root:
+
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+from ratelimit import TokenBucket, retry_after
+
+
+class FakeClock:
+    """Stands in for the time module; sleeping advances the clock."""
+
+    def __init__(self, now=1000.0, wall=1_700_000_000.0):
+        self.now = now
+        self.wall = wall
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.wall + self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("ratelimit.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_paced(self):
+        bucket = TokenBucket(limit=60, period=60.0, burst=2)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertAlmostEqual(bucket.acquire(), 1.0)
+        self.assertAlmostEqual(bucket.acquire(), 1.0)
+        self.assertAlmostEqual(bucket.waited, 2.0)
+
+    def test_refill_is_capped_at_burst(self):
+        bucket = TokenBucket(limit=60, period=60.0, burst=2)
+        self.clock.now += 3600
+        for _ in range(2):
+            self.assertEqual(bucket.acquire(), 0.0)
+        self.assertAlmostEqual(bucket.acquire(), 1.0)
+
+    def test_pause_blocks_acquire(self):
+        bucket = TokenBucket(limit=60, period=60.0, burst=5)
+        bucket.pause(30)
+        self.assertAlmostEqual(bucket.acquire(), 30.0)
+        self.assertEqual(bucket.acquire(), 0.0)
+
+    def test_update_sets_rate_and_lowers_budget(self):
+        bucket = TokenBucket(limit=60, period=60.0, burst=5)
+        bucket.update({"X-RateLimit-Limit": "120", "X-RateLimit-Remaining": "1"})
+        self.assertEqual(bucket.rate, 2.0)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertAlmostEqual(bucket.acquire(), 0.5)
+
+    def test_update_keeps_lower_own_budget(self):
+        bucket = TokenBucket(limit=60, period=60.0, burst=2)
+        bucket.update({"X-RateLimit-Remaining": "50"})
+        self.assertEqual(bucket.tokens, 2.0)
+
+    def test_update_exhausted_waits_for_reset(self):
+        bucket = TokenBucket(limit=60, period=60.0, burst=5)
+        reset = int(self.clock.time()) + 20
+        bucket.update({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset)})
+        self.assertAlmostEqual(bucket.acquire(), 20.0)
+
+    def test_update_without_headers_changes_nothing(self):
+        bucket = TokenBucket(limit=60, period=60.0, burst=5)
+        for headers in ({}, {"X-RateLimit-Limit": "many", "X-RateLimit-Remaining": ""}):
+            with self.subTest(headers=headers):
+                bucket.update(headers)
+                self.assertEqual(bucket.rate, 1.0)
+                self.assertEqual(bucket.tokens, 5.0)
+                self.assertEqual(bucket.blocked_until, 0.0)
+
+
+class RetryAfterTest(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(retry_after({"Retry-After": "12"}), 12)
+        self.assertEqual(retry_after({"Retry-After": "-3"}), 0)
+
+    def test_missing_or_malformed(self):
+        self.assertIsNone(retry_after({}))
+        self.assertIsNone(retry_after({"Retry-After": "soon"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+"""Tests of the validation and lookups of the topology.
+
+Run from the repository root:
+
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+
+import copy
+import unittest
+from topology import Topology, TopologyError
+
+DOCUMENT = {
+    "apiaries": [{"id": 1, "name": "Garden", "hives": [1, 2]}],
+    "hives": [
+        {"id": 1, "name": "Hive 1", "apiary_id": 1},
+        {"id": 2, "name": "Hive 2", "apiary_id": 1},
+    ],
+    "sensors": [
+        {"id": 1, "name": "Sensor 1", "hive_id": 1},
+        {"id": 2, "name": "Sensor 2"},
+    ],
+    "assignments": [{"sensor_id": 2, "hive_id": 2}],
+    "beep_hives": [{"id": 100}, {"id": 200}],
+    "beep_devices": [
+        {"id": 1000, "hive_id": 100, "type": "scale"},
+        {"id": 1001, "hive_id": 100, "type": "heart"},
+    ],
+    "hive_map": {"1": 100, "2": 200},
+}
+
+
+def document(**changes):
+    """Return a copy of DOCUMENT with some sections replaced."""
+    changed = copy.deepcopy(DOCUMENT)
+    changed.update(changes)
+    return changed
+
+
+class TopologyTest(unittest.TestCase):
+    def test_lookups(self):
+        topology = Topology(document())
+        self.assertEqual(topology.apiary_id_for_hive(2), 1)
+        self.assertIsNone(topology.apiary_id_for_hive(3))
+        self.assertEqual(topology.beep_hive_id(1), 100)
+        self.assertEqual(topology.bhm_hive_id(200), 2)
+        self.assertEqual(topology.hives_of_apiary, {1: [1, 2]})
+        self.assertEqual(set(topology.hive_devices[100]), {"scale", "heart"})
+
+    def assertInvalid(self, message, **changes):
+        with self.assertRaises(TopologyError) as raised:
+            Topology(document(**changes))
+        self.assertIn(message, str(raised.exception))
+
+    def test_missing_section(self):
+        changed = document()
+        del changed["hive_map"]
+        with self.assertRaisesRegex(TopologyError, "lacks hive_map"):
+            Topology(changed)
+
+    def test_malformed_entry(self):
+        self.assertInvalid("malformed topology entry", hives=[{"name": "No ID"}])
+
+    def test_errors(self):
+        hives = DOCUMENT["hives"]
+        cases = {
+            "duplicate hive id 1": {"hives": hives + [dict(hives[0], name="Other")]},
+            "duplicate sensor name 'Sensor 1'": {
+                "sensors": DOCUMENT["sensors"] + [{"id": 3, "name": "Sensor 1"}]
+            },
+            "hive 3 is in unknown apiary 9": {
+                "hives": hives + [{"id": 3, "name": "Hive 3", "apiary_id": 9}]
+            },
+            "apiary 1 lists unknown hive 7": {
+                "apiaries": [{"id": 1, "name": "Garden", "hives": [1, 2, 7]}]
+            },
+            "apiary 2 lists hive 1 of apiary 1": {
+                "apiaries": DOCUMENT["apiaries"]
+                + [{"id": 2, "name": "Field", "hives": [1]}]
+            },
+            "sensor 2 is on unknown hive 5": {
+                "sensors": [{"id": 2, "name": "Sensor 2", "hive_id": 5}],
+                "assignments": [],
+            },
+            "assignment of unknown sensor 9": {
+                "assignments": [{"sensor_id": 9, "hive_id": 1}]
+            },
+            "sensor 2 is assigned to unknown hive 4": {
+                "assignments": [{"sensor_id": 2, "hive_id": 4}]
+            },
+            "sensor 1 is on hive 1 but assigned to hive 2": {
+                "assignments": [{"sensor_id": 1, "hive_id": 2}]
+            },
+            "BEEP device 1002 is on unknown BEEP hive 300": {
+                "beep_devices": DOCUMENT["beep_devices"]
+                + [{"id": 1002, "hive_id": 300, "type": "scale"}]
+            },
+            "BEEP hive 100 has two scale devices, 1000 and 1002": {
+                "beep_devices": DOCUMENT["beep_devices"]
+                + [{"id": 1002, "hive_id": 100, "type": "scale"}]
+            },
+            "hive 2 maps to unknown BEEP hive 300": {"hive_map": {"1": 100, "2": 300}},
+            "hives 1 and 2 both map to BEEP hive 100": {
+                "hive_map": {"1": 100, "2": 100}
+            },
+            "BEEP hive 100 has devices but no HIVE_MAP entry": {"hive_map": {"2": 200}},
+        }
+        for message, changes in cases.items():
+            with self.subTest(message):
+                self.assertInvalid(message, **changes)
+
+    def test_every_error_is_reported(self):
+        with self.assertRaises(TopologyError) as raised:
+            Topology(
+                document(
+                    assignments=[{"sensor_id": 9, "hive_id": 4}],
+                    hive_map={"1": 100, "2": 300},
+                )
+            )
+        self.assertEqual(str(raised.exception).count(";"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
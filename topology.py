@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Registry of apiaries, hives, sensors and BEEP devices.
+
+The topology is one document combining the JSON configuration of
+settings.py (``APIARIES``, ``HIVES``, ``SENSORS``, ``ASSIGNMENTS``) with the
+BEEP hives, devices and ``HIVE_MAP`` of beep_sensors.py. It is validated
+once when it is loaded: an unknown reference or an ambiguous mapping
+raises TopologyError listing every problem, before any data is written or
+uploaded. Lookups in both directions go through dicts built at load time.
+
+With ``TOPOLOGY_SOURCE=database`` the document is read from the
+``topology_document`` table instead, and a snapshot of it is kept on disk
+for TOPOLOGY_CACHE_TTL seconds so that short runs skip the query.
+
+Usage:
+    python topology.py check      # Validate and summarize the topology
+    python topology.py show       # Print the document as JSON
+    python topology.py store      # Store the configured topology in the database
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from datetime import datetime, timezone
+from settings import (
+    APIARIES,
+    HIVES,
+    SENSORS,
+    ASSIGNMENTS,
+    TOPOLOGY_SOURCE,
+    TOPOLOGY_CACHE,
+    TOPOLOGY_CACHE_TTL,
+)
+
+# Sections of a topology document
+SECTIONS = (
+    "apiaries",
+    "hives",
+    "sensors",
+    "assignments",
+    "beep_hives",
+    "beep_devices",
+    "hive_map",
+)
+
+
+class TopologyError(ValueError):
+    """The topology contains unknown references or ambiguous mappings."""
+
+
+def index_by_id(items, kind, errors, key="id"):
+    """Return dict of ``key`` -> item, reporting duplicate keys."""
+    indexed = {}
+    for item in items:
+        if item[key] in indexed:
+            errors.append(f"duplicate {kind} {key} {item[key]}")
+        indexed[item[key]] = item
+    return indexed
+
+
+def check_unique_names(items, kind, errors):
+    """Report items of a kind sharing a name, which the tables forbid."""
+    names = set()
+    for item in items:
+        if item["name"] in names:
+            errors.append(f"duplicate {kind} name {item['name']!r}")
+        names.add(item["name"])
+
+
+class Topology:
+    """Validated topology with indexed lookups.
+
+    Args:
+        document: dict with the lists ``apiaries``, ``hives``, ``sensors``,
+            ``assignments``, ``beep_hives`` and ``beep_devices`` and the
+            ``hive_map`` dict of beehivemonitoring to BEEP hive IDs
+
+    Raises:
+        TopologyError: if the document is inconsistent
+    """
+
+    def __init__(self, document):
+        missing = [section for section in SECTIONS if section not in document]
+        if missing:
+            raise TopologyError(f"topology lacks {', '.join(missing)}")
+        self.document = document
+        errors = []
+        try:
+            self.build(document, errors)
+        except (KeyError, TypeError, ValueError) as e:
+            raise TopologyError(f"malformed topology entry: {e!r}") from e
+        if errors:
+            raise TopologyError("invalid topology: " + "; ".join(errors))
+
+    def build(self, document, errors):
+        """Build the indexes, appending every inconsistency to ``errors``."""
+        self.apiaries = index_by_id(document["apiaries"], "apiary", errors)
+        self.hives = index_by_id(document["hives"], "hive", errors)
+        self.sensors = index_by_id(document["sensors"], "sensor", errors)
+        for kind, items in (
+            ("apiary", document["apiaries"]),
+            ("hive", document["hives"]),
+            ("sensor", document["sensors"]),
+        ):
+            check_unique_names(items, kind, errors)
+
+        # hive ID -> apiary ID, and the reverse
+        self.apiary_of_hive = {}
+        self.hives_of_apiary = {apiary_id: [] for apiary_id in self.apiaries}
+        for hive in self.hives.values():
+            if hive["apiary_id"] not in self.apiaries:
+                errors.append(
+                    f"hive {hive['id']} is in unknown apiary {hive['apiary_id']}"
+                )
+                continue
+            self.apiary_of_hive[hive["id"]] = hive["apiary_id"]
+            self.hives_of_apiary[hive["apiary_id"]].append(hive["id"])
+        for apiary in self.apiaries.values():
+            for hive_id in apiary.get("hives", ()):
+                if hive_id not in self.hives:
+                    errors.append(f"apiary {apiary['id']} lists unknown hive {hive_id}")
+                elif self.apiary_of_hive.get(hive_id) != apiary["id"]:
+                    errors.append(
+                        f"apiary {apiary['id']} lists hive {hive_id} of apiary "
+                        f"{self.hives[hive_id]['apiary_id']}"
+                    )
+
+        for sensor in self.sensors.values():
+            hive_id = sensor.get("hive_id")
+            if hive_id is not None and hive_id not in self.hives:
+                errors.append(f"sensor {sensor['id']} is on unknown hive {hive_id}")
+
+        # sensor ID -> assignment created for sensors never assigned before
+        self.default_assignments = index_by_id(
+            document["assignments"], "assignment of sensor", errors, key="sensor_id"
+        )
+        for sensor_id, assignment in self.default_assignments.items():
+            if sensor_id not in self.sensors:
+                errors.append(f"assignment of unknown sensor {sensor_id}")
+            if assignment["hive_id"] not in self.hives:
+                errors.append(
+                    f"sensor {sensor_id} is assigned to unknown hive "
+                    f"{assignment['hive_id']}"
+                )
+            sensor_hive = self.sensors.get(sensor_id, {}).get("hive_id")
+            if sensor_hive is not None and sensor_hive != assignment["hive_id"]:
+                errors.append(
+                    f"sensor {sensor_id} is on hive {sensor_hive} but assigned "
+                    f"to hive {assignment['hive_id']}"
+                )
+
+        self.beep_hives = index_by_id(document["beep_hives"], "BEEP hive", errors)
+        self.beep_devices = index_by_id(document["beep_devices"], "BEEP device", errors)
+        # BEEP hive ID -> {device type: device}
+        self.hive_devices = {hive_id: {} for hive_id in self.beep_hives}
+        for device in self.beep_devices.values():
+            devices = self.hive_devices.get(device["hive_id"])
+            if devices is None:
+                errors.append(
+                    f"BEEP device {device['id']} is on unknown BEEP hive "
+                    f"{device['hive_id']}"
+                )
+            elif device["type"] in devices:
+                errors.append(
+                    f"BEEP hive {device['hive_id']} has two {device['type']} "
+                    f"devices, {devices[device['type']]['id']} and {device['id']}"
+                )
+            else:
+                devices[device["type"]] = device
+
+        # JSON object keys are strings
+        self.hive_map = {
+            int(bhm_id): beep_id for bhm_id, beep_id in document["hive_map"].items()
+        }
+        self.bhm_hive_ids = {}
+        for bhm_id, beep_id in self.hive_map.items():
+            if beep_id not in self.beep_hives:
+                errors.append(f"hive {bhm_id} maps to unknown BEEP hive {beep_id}")
+            if beep_id in self.bhm_hive_ids:
+                errors.append(
+                    f"hives {self.bhm_hive_ids[beep_id]} and {bhm_id} both map "
+                    f"to BEEP hive {beep_id}"
+                )
+            self.bhm_hive_ids[beep_id] = bhm_id
+        for hive_id, devices in self.hive_devices.items():
+            if devices and hive_id not in self.bhm_hive_ids:
+                errors.append(f"BEEP hive {hive_id} has devices but no HIVE_MAP entry")
+
+    def apiary_id_for_hive(self, hive_id):
+        """Return the ID of the apiary of a hive, or None."""
+        return self.apiary_of_hive.get(hive_id)
+
+    def beep_hive_id(self, bhm_hive_id):
+        """Return the BEEP hive of a beehivemonitoring hive, or None."""
+        return self.hive_map.get(bhm_hive_id)
+
+    def bhm_hive_id(self, beep_hive_id):
+        """Return the beehivemonitoring hive of a BEEP hive, or None."""
+        return self.bhm_hive_ids.get(beep_hive_id)
+
+    def summary(self):
+        return (
+            f"{len(self.apiaries)} apiaries, {len(self.hives)} hives, "
+            f"{len(self.sensors)} sensors, {len(self.default_assignments)} "
+            f"assignments, {len(self.beep_hives)} BEEP hives, "
+            f"{len(self.beep_devices)} BEEP devices"
+        )
+
+
+def config_document():
+    """Return the topology document of settings.py and beep_sensors.py."""
+    from beep_sensors import HIVES as BEEP_HIVES, DEVICES, HIVE_MAP
+
+    return {
+        "apiaries": APIARIES,
+        "hives": HIVES,
+        "sensors": SENSORS,
+        "assignments": ASSIGNMENTS,
+        "beep_hives": BEEP_HIVES,
+        "beep_devices": DEVICES,
+        "hive_map": {str(bhm_id): beep_id for bhm_id, beep_id in HIVE_MAP.items()},
+    }
+
+
+def load_cached_document():
+    """Return the document of the snapshot on disk, or None if stale."""
+    try:
+        with open(TOPOLOGY_CACHE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - cache.get("fetched_at", 0) > TOPOLOGY_CACHE_TTL:
+        return None
+    return cache["document"]
+
+
+def save_cached_document(document):
+    """Write the snapshot of a document to disk."""
+    try:
+        os.makedirs(os.path.dirname(TOPOLOGY_CACHE), exist_ok=True)
+        with open(TOPOLOGY_CACHE, "w") as f:
+            json.dump({"fetched_at": time.time(), "document": document}, f)
+    except OSError as e:
+        logging.warning(f"Could not write topology cache: {e}")
+
+
+def database_document(session):
+    """Return the topology document stored in the database."""
+    from models import TopologyDocument
+
+    stored = session.get(TopologyDocument, 1)
+    if stored is None:
+        raise TopologyError("no topology stored, run 'topology.py store'")
+    return stored.document
+
+
+def store_document(session, document):
+    """Validate a document and store it as the database topology.
+
+    Returns:
+        The Topology of the document
+    """
+    from models import TopologyDocument
+
+    topology = Topology(document)
+    session.merge(
+        TopologyDocument(id=1, document=document, updated_at=datetime.now(timezone.utc))
+    )
+    session.commit()
+    if os.path.exists(TOPOLOGY_CACHE):
+        os.remove(TOPOLOGY_CACHE)
+    return topology
+
+
+# Topology of the process, see get_topology()
+_topology = None
+
+
+def load_topology(source=TOPOLOGY_SOURCE, session=None):
+    """Load and validate the topology of a source.
+
+    Args:
+        source: ``config`` or ``database``
+        session: SQLAlchemy session for the database source, defaults to
+            the session of the thread
+    """
+    if source == "config":
+        return Topology(config_document())
+    if source != "database":
+        raise TopologyError(f"unknown topology source {source!r}")
+    document = load_cached_document() if TOPOLOGY_CACHE_TTL > 0 else None
+    if document is None:
+        from database import get_session
+
+        document = database_document(session or get_session())
+        if TOPOLOGY_CACHE_TTL > 0:
+            save_cached_document(document)
+    return Topology(document)
+
+
+def get_topology(session=None):
+    """Return the topology, loading it on first use."""
+    global _topology
+    if _topology is None:
+        _topology = load_topology(session=session)
+    return _topology
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Check or store the topology")
+    parser.add_argument("action", choices=["check", "show", "store"])
+    parser.add_argument(
+        "--source",
+        choices=["config", "database"],
+        default=TOPOLOGY_SOURCE,
+        help="Topology to check or show (store always reads the config)",
+    )
+    args = parser.parse_args(argv)
+
+    from database import get_session, close_session
+
+    session = get_session()
+    try:
+        try:
+            if args.action == "store":
+                topology = store_document(session, config_document())
+                print(f"Topology stored: {topology.summary()}")
+                return 0
+            topology = load_topology(args.source, session)
+        except TopologyError as e:
+            print(e, file=sys.stderr)
+            return 1
+        if args.action == "show":
+            json.dump(topology.document, sys.stdout, indent=2)
+            print()
+        else:
+            print(f"Topology is valid: {topology.summary()}")
+        return 0
+    finally:
+        close_session()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))